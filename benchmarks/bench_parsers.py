@@ -0,0 +1,75 @@
+# benchmarks/bench_parsers.py
+# Micro-benchmarks dos parsers vetorizados (etl.bronze.parsers) contra as versões linha a linha anteriores,
+# com payloads sintéticos de vários anos. Não precisa de rede nem banco.
+#
+#   python -m benchmarks.bench_parsers --years 20 --currencies 40
+import argparse, timeit
+import numpy as np
+import pandas as pd
+from loguru import logger
+from etl.bronze.parsers import parse_coingecko_series, parse_ecb_sdmx, parse_yahoo_chart
+from benchmarks.synth import coingecko_payload, ecb_payload, yahoo_payload
+
+# ---------------- versões anteriores (cópias) ----------------
+def legacy_coingecko(payload: dict) -> pd.DataFrame:
+    rows = []
+    for ts_ms, price in payload.get("prices", []):
+        d = pd.to_datetime(ts_ms, unit="ms").date()
+        rows.append({"date": d, "btc_usd": float(price)})
+    return pd.DataFrame(rows)
+
+def legacy_ecb(payload: dict, code: str) -> pd.DataFrame:
+    data_section = payload.get("data", payload)
+    series = data_section["dataSets"][0]["series"]["0:0:0:0:0"]
+    obs = series.get("observations", {})
+    times = data_section["structure"]["dimensions"]["observation"][0]["values"]
+    rows = []
+    for k, v in obs.items():
+        rows.append({"date": times[int(k)]["id"], "code": code, "rate_vs_eur": float(v[0])})
+    return pd.DataFrame(rows)
+
+def legacy_yahoo(js: dict) -> pd.DataFrame:
+    result = js["chart"]["result"][0]
+    ts = result.get("timestamp", [])
+    q = result["indicators"]["quote"][0]
+    adj = result.get("indicators", {}).get("adjclose", [{}])[0].get("adjclose", q.get("close"))
+    return pd.DataFrame({
+        "Date": pd.to_datetime(ts, unit="s").date if ts else [],
+        "Open": q.get("open"), "High": q.get("high"), "Low": q.get("low"),
+        "Close": adj, "Adj Close": adj, "Volume": q.get("volume"),
+    })
+
+def bench(label: str, legacy, vectorized, repeat: int):
+    t_old = min(timeit.repeat(legacy, number=1, repeat=repeat))
+    t_new = min(timeit.repeat(vectorized, number=1, repeat=repeat))
+    logger.info(f"{label:<34} legado {t_old * 1e3:>9.1f} ms   vetorizado {t_new * 1e3:>8.1f} ms   {t_old / t_new:>6.1f}x")
+
+def main():
+    ap = argparse.ArgumentParser(description="Micro-benchmarks dos parsers de payload")
+    ap.add_argument("--years", type=int, default=10)
+    ap.add_argument("--currencies", type=int, default=40)
+    ap.add_argument("--points-per-day", type=int, default=24, help="granularidade CoinGecko (24 = horária)")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+
+    days = pd.bdate_range("2000-01-03", periods=args.years * 261)
+    cg = coingecko_payload("2005-01-01", args.years * 365, args.points_per_day, rng)
+    bench(f"CoinGecko ({len(cg['prices']):,} pontos)", lambda: legacy_coingecko(cg),
+          lambda: parse_coingecko_series(cg).assign(date=lambda d: d["ts"].dt.date), args.repeat)
+
+    one = ecb_payload(["C00"], days, rng)
+    bench(f"ECB 1 série ({args.years} anos)", lambda: legacy_ecb(one, "C00"),
+          lambda: parse_ecb_sdmx(one, "C00"), args.repeat)
+    many = ecb_payload([f"C{i:02d}" for i in range(args.currencies)], days, rng)
+    bench(f"ECB {args.currencies} séries (1 payload)",
+          lambda: pd.concat([legacy_ecb({"dataSets": [{"series": {"0:0:0:0:0": s}}],
+                                         "structure": many["structure"]}, "X")
+                             for s in many["dataSets"][0]["series"].values()]),
+          lambda: parse_ecb_sdmx(many), args.repeat)
+
+    yh = yahoo_payload(days, rng)
+    bench(f"Yahoo chart ({args.years} anos)", lambda: legacy_yahoo(yh), lambda: parse_yahoo_chart(yh), args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_upsert.py
+# Compara o upsert antigo do build_gold (DELETE linha a linha + INSERT) com o upsert set-based
+# de etl.common.db (staging temporário + DELETE-JOIN / ON DUPLICATE KEY UPDATE).
+#
+#   python -m benchmarks.bench_upsert --rows 1000000
+#   python -m benchmarks.bench_upsert --rows 1000000 --legacy-rows 20000   # extrapola o legado
+import argparse, time
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.types import Date, String, Float
+from loguru import logger
+from etl.common.db import get_engine, upsert, exec_sql
+
+TABLE = "md_gold._bench_upsert"
+DTYPE = {"date": Date(), "currency_pair": String(16), "rate_close": Float()}
+
+def legacy_upsert(engine, table_full, df: pd.DataFrame, key_cols: list[str]):
+    # Cópia do antigo etl.gold.build_gold.upsert (um DELETE por linha).
+    # O to_sql usa a conexão SQLAlchemy; o original passava conn.connection (DBAPI), que o pandas não aceita p/ MySQL.
+    with engine.begin() as conn:
+        if not df.empty:
+            keys = " AND ".join([f"{k} = :{k}" for k in key_cols])
+            del_sql = f"DELETE FROM {table_full} WHERE {keys}"
+            for _, row in df.iterrows():
+                conn.execute(text(del_sql), row.to_dict())
+        df.to_sql(table_full.split(".")[1], conn, schema=table_full.split(".")[0],
+                  if_exists="append", index=False)
+
+def make_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    # ~rows linhas de FX diário: n_pairs pares × dias úteis consecutivos
+    rng = np.random.default_rng(seed)
+    n_pairs = max(1, min(1600, rows // 2500))
+    n_days = -(-rows // n_pairs)
+    dates = pd.bdate_range("2000-01-03", periods=n_days).date
+    pairs = np.array([f"C{i:03d}/BRL" for i in range(n_pairs)])
+    df = pd.DataFrame({
+        "date": np.tile(dates, n_pairs),
+        "currency_pair": np.repeat(pairs, n_days),
+        "rate_close": rng.lognormal(0.0, 0.5, n_days * n_pairs),
+    })
+    return df.iloc[:rows]
+
+def reset_table(engine, base: pd.DataFrame):
+    exec_sql(engine, f"DROP TABLE IF EXISTS {TABLE}")
+    schema, table = TABLE.split(".")
+    base.to_sql(table, engine, schema=schema, index=False, dtype=DTYPE, chunksize=50_000, method="multi")
+
+def timed(label: str, fn, rows: int) -> float:
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    logger.info(f"{label:<28} {rows:>10,} linhas  {dt:>9.2f}s  {rows / dt:>12,.0f} linhas/s")
+    return dt
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de upsert (legado x set-based)")
+    ap.add_argument("--rows", type=int, default=1_000_000, help="linhas do lote de upsert")
+    ap.add_argument("--legacy-rows", type=int, default=None,
+                    help="linhas para o upsert legado (default = --rows; menor => extrapolação linear)")
+    ap.add_argument("--overlap", type=float, default=0.5, help="fração do lote que já existe na tabela")
+    args = ap.parse_args()
+
+    eng = get_engine()
+    keys = ["date", "currency_pair"]
+    full = make_frame(args.rows)
+    # Metade das chaves já existe (valores revisados), metade é nova
+    n_old = int(len(full) * args.overlap)
+    base = full.iloc[:n_old]
+    batch = full.assign(rate_close=full["rate_close"] * 1.001)
+
+    results = {}
+    for strategy in ("delete_join", "on_duplicate"):
+        reset_table(eng, base)
+        if strategy == "on_duplicate":
+            exec_sql(eng, f"ALTER TABLE {TABLE} ADD PRIMARY KEY (date, currency_pair)")
+        results[strategy] = timed(f"upsert set-based ({strategy})",
+                                  lambda: upsert(eng, TABLE, batch, keys, dtype=DTYPE, strategy=strategy),
+                                  len(batch))
+
+    legacy_rows = args.legacy_rows or len(batch)
+    reset_table(eng, base)
+    sample = batch.iloc[:legacy_rows]
+    dt = timed("upsert legado (iterrows)", lambda: legacy_upsert(eng, TABLE, sample, keys), len(sample))
+    results["legacy"] = dt * len(batch) / len(sample)
+    if len(sample) < len(batch):
+        logger.info(f"upsert legado extrapolado p/ {len(batch):,} linhas: {results['legacy']:.1f}s")
+
+    exec_sql(eng, f"DROP TABLE IF EXISTS {TABLE}")
+    best = min(results["delete_join"], results["on_duplicate"])
+    logger.success(f"Speedup set-based vs legado: {results['legacy'] / best:,.1f}x")
+
+if __name__ == "__main__":
+    main()
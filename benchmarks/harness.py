@@ -0,0 +1,120 @@
+# benchmarks/harness.py
+# Roda cada etapa do DAG contra o replay server e mede tempo, linhas/s, MB baixados e pico de RSS.
+# Grava nos schemas md_* do banco configurado: use um banco descartável.
+#
+#   python -m benchmarks.harness --data data/bench                  # carga completa (FULL_REFRESH)
+#   python -m benchmarks.harness --data data/bench --incremental    # re-execução sobre o estado atual
+import argparse, importlib, json, os, shutil, subprocess, sys, tempfile, time
+from loguru import logger
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _pipelines():
+    from scripts.run_all import PIPELINES
+    return PIPELINES
+
+def run_stage(name: str, result_path: str) -> int:
+    """Modo filho: executa uma etapa sob telemetria (sem ingestion_log) e grava as métricas em JSON."""
+    from etl.common import telemetry
+    node = next(n for n in _pipelines() if n.name == name)
+    m, code = None, 0
+    try:
+        with telemetry.stage(name, persist=False) as m:
+            importlib.import_module(node.module).main()
+    except Exception as exc:
+        logger.opt(exception=exc).error(f"Etapa {name} falhou: {exc}")
+        code = 1
+    finally:
+        with open(result_path, "w", encoding="utf-8") as f:
+            json.dump(m.to_dict() if m else {"stage": name, "status": "FAILED"}, f, default=str)
+    return code
+
+def _child_env(replay: str, start: str, incremental: bool) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (ROOT, env.get("PYTHONPATH")) if p)
+    env["HTTP_REPLAY_URL"] = replay
+    env["START_DATE"] = start
+    env["FULL_REFRESH"] = "0" if incremental else "1"
+    return env
+
+def _report(results: list[dict]):
+    logger.info(f"{'etapa':<26}{'status':>8}{'tempo':>9}{'lidas':>12}{'gravadas':>12}{'linhas/s':>12}"
+                f"{'HTTP MB':>9}{'DB s':>8}{'RSS MB':>8}")
+    for r in results:
+        wall = r.get("wall_seconds") or 0.0
+        rows = max(r.get("rows_in", 0), r.get("rows_out", 0))
+        rate = rows / wall if wall > 0 else 0.0
+        logger.info(f"{r['stage']:<26}{r.get('status', '?'):>8}{wall:>8.2f}s{r.get('rows_in', 0):>12,}"
+                    f"{r.get('rows_out', 0):>12,}{rate:>12,.0f}{r.get('bytes_downloaded', 0) / 1e6:>9.1f}"
+                    f"{r.get('db_write_seconds', 0.0):>8.2f}{r.get('peak_rss_mb', 0.0):>8.0f}")
+    total = sum(r.get("wall_seconds") or 0.0 for r in results)
+    logger.info(f"{'total':<26}{'':>8}{total:>8.2f}s")
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark offline do pipeline (replay + banco local)")
+    ap.add_argument("--data", default="data/bench", help="diretório gerado por benchmarks.synth")
+    ap.add_argument("--only", help="etapas separadas por vírgula (default: todas, na ordem do DAG)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="mantém watermarks, lake e cache HTTP (mede a re-execução); default é carga completa")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="latência artificial do replay server")
+    ap.add_argument("--out", help="grava o resultado em JSON")
+    ap.add_argument("--stage", help=argparse.SUPPRESS)
+    ap.add_argument("--result", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    if args.stage:
+        return run_stage(args.stage, args.result)
+
+    from benchmarks.replay_server import serve_in_thread
+    from etl.common.db import get_engine
+    from etl.common.schema import ensure_schema
+
+    data = os.path.abspath(args.data)
+    with open(os.path.join(data, "replay", "routes.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if not args.incremental:
+        # Carga completa: lake e cache HTTP do diretório de benchmark começam vazios
+        shutil.rmtree(os.path.join(data, "data"), ignore_errors=True)
+    only = {s.strip() for s in args.only.split(",")} if args.only else None
+    nodes = [n for n in _pipelines() if only is None or n.name in only]
+
+    # DDL fora da medição: a primeira etapa não paga as migrações
+    ensure_schema(get_engine())
+    server, replay = serve_in_thread(data, latency_ms=args.latency_ms)
+    env = _child_env(replay, manifest["start"], args.incremental)
+    logger.info(f"Benchmark {manifest['start']} → {manifest['end']} ({manifest['years']} anos, "
+                f"{manifest['currencies']} moedas, {manifest['indices'] + 1} índices, "
+                f"{manifest.get('coins', 1)} cripto a {manifest['points_per_day']} pontos/dia); replay em {replay}")
+
+    results = []
+    try:
+        for node in nodes:
+            fd, result_path = tempfile.mkstemp(suffix=".json", prefix=f"bench_{node.name}_")
+            os.close(fd)
+            t0 = time.perf_counter()
+            proc = subprocess.run([sys.executable, "-m", "benchmarks.harness", "--stage", node.name,
+                                   "--result", result_path], cwd=data, env=env)
+            try:
+                with open(result_path, "r", encoding="utf-8") as f:
+                    res = json.load(f)
+            except (json.JSONDecodeError, FileNotFoundError):
+                res = {"stage": node.name, "status": "FAILED"}
+            finally:
+                os.remove(result_path)
+            res["process_seconds"] = time.perf_counter() - t0   # inclui start do interpretador e imports
+            if proc.returncode != 0:
+                res["status"] = "FAILED"
+            results.append(res)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    _report(results)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"manifest": {k: v for k, v in manifest.items() if k != "routes"},
+                       "incremental": args.incremental, "stages": results}, f, indent=1, default=str)
+        logger.info(f"Resultado em {args.out}")
+    return 0 if all(r.get("status") == "SUCCESS" for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# benchmarks/replay_server.py
+# Servidor HTTP local com os payloads do benchmarks/synth.py (HTTP_REPLAY_URL redireciona as fontes para ele).
+#
+#   python -m benchmarks.replay_server --root data/bench --port 8765
+import argparse, hashlib, json, os, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, unquote, parse_qsl
+from loguru import logger
+
+def load_routes(root: str) -> dict[tuple[str, str], list[dict]]:
+    """routes.json -> {(host, path): [rota, ...]} com o ETag (sha256 do arquivo) de cada rota."""
+    with open(os.path.join(root, "replay", "routes.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    routes: dict[tuple[str, str], list[dict]] = {}
+    for r in manifest["routes"]:
+        path = os.path.join(root, "replay", r["file"])
+        with open(path, "rb") as f:
+            etag = '"' + hashlib.sha256(f.read()).hexdigest()[:32] + '"'
+        routes.setdefault((r["host"], r["path"]), []).append({**r, "abspath": path, "etag": etag})
+    return routes
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    routes: dict = {}
+    latency: float = 0.0
+    protocol_version = "HTTP/1.1"   # keep-alive, como a Session do etl.common.io
+
+    def _match(self) -> dict | None:
+        parts = urlsplit(self.path)
+        host, _, path = unquote(parts.path).lstrip("/").partition("/")
+        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+        for r in self.routes.get((host, "/" + path), []):
+            if all(query.get(k) == v for k, v in r["query"].items()):
+                return r
+        return None
+
+    @staticmethod
+    def _slice(body: bytes, query: dict) -> bytes:
+        # Rotas "slice": "unix" (CoinGecko market_chart/range): recorta [[ts_ms, v], ...] por from/to; as demais
+        # ignoram a janela de datas e o ingestor filtra pelo watermark
+        lo, hi = int(query.get("from", 0)) * 1000, int(query.get("to", 2**40)) * 1000
+        payload = json.loads(body)
+        return json.dumps({k: [p for p in v if lo <= p[0] <= hi] for k, v in payload.items()},
+                          separators=(",", ":")).encode("utf-8")
+
+    def _send(self, status: int, body: bytes = b"", headers: dict | None = None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        r = self._match()
+        if r is None:
+            # Mesmo comportamento das APIs sem dados para a consulta (ECB/SGS respondem 404)
+            self._send(404, b"No results found.", {"Content-Type": "text/plain"})
+            return
+        with open(r["abspath"], "rb") as f:
+            body = f.read()
+        etag = r["etag"]
+        if r.get("slice") == "unix":
+            body = self._slice(body, dict(parse_qsl(urlsplit(self.path).query)))
+            etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, headers={"ETag": etag})
+            return
+        self._send(200, body, {"Content-Type": r["content_type"], "ETag": etag})
+
+    def log_message(self, fmt, *args):
+        logger.debug(f"replay {self.address_string()} {fmt % args}")
+
+def make_server(root: str, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0) -> ThreadingHTTPServer:
+    handler = type("Handler", (ReplayHandler,), {"routes": load_routes(root), "latency": latency_ms / 1000.0})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def serve_in_thread(root: str, port: int = 0, latency_ms: float = 0.0) -> tuple[ThreadingHTTPServer, str]:
+    """Sobe o servidor numa thread daemon; devolve (server, url base para HTTP_REPLAY_URL)."""
+    server = make_server(root, port=port, latency_ms=latency_ms)
+    threading.Thread(target=server.serve_forever, name="replay-server", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay HTTP dos payloads sintéticos")
+    ap.add_argument("--root", default="data/bench", help="diretório gerado por benchmarks.synth")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="latência artificial por requisição")
+    args = ap.parse_args()
+    server = make_server(args.root, port=args.port, latency_ms=args.latency_ms)
+    n = sum(len(v) for v in server.RequestHandlerClass.routes.values())
+    logger.info(f"Replay de {n} rotas em http://127.0.0.1:{args.port} (HTTP_REPLAY_URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
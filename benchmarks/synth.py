@@ -0,0 +1,204 @@
+# benchmarks/synth.py
+# Dados sintéticos no formato de cada fonte, para o replay server e o harness.
+#
+#   python -m benchmarks.synth --years 20 --currencies 30 --indices 8 --points-per-day 24 --out data/bench
+import argparse, json, os
+from urllib.parse import urlparse, unquote
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import yaml
+from loguru import logger
+from etl.common.trading_calendar import business_days
+
+ECB_BASE_URL = "https://data-api.ecb.europa.eu/service/data/EXR"
+COINGECKO_BASE_URL = "https://api.coingecko.com/api/v3"
+COINGECKO_COINS = ["bitcoin", "ethereum", "solana", "ripple", "cardano", "dogecoin"]
+PTAX_SERIE = 10813
+# Moedas publicadas pelo ECB; acima disso o gerador cria códigos X00, X01...
+ECB_CODES = ["USD", "JPY", "BGN", "CZK", "DKK", "GBP", "HUF", "PLN", "RON", "SEK", "CHF", "ISK", "NOK", "TRY",
+             "AUD", "BRL", "CAD", "CNY", "HKD", "IDR", "ILS", "INR", "KRW", "MXN", "MYR", "NZD", "PHP", "SGD",
+             "THB", "ZAR"]
+# Nível inicial aproximado (unidades por 1 EUR) das moedas que a silver/gold usam nas contas
+ECB_LEVELS = {"USD": 1.1, "BRL": 5.5, "GBP": 0.85, "JPY": 150.0, "CHF": 0.95}
+STOOQ_INDICES = [("SPX", "^spx"), ("DJI", "^dji"), ("NASDAQ", "^ndq"), ("NDX", "^ndx")]
+# Hosts que o pipeline acessa; o sources.yaml gerado tira o rate limit deles (exceto com --throttle)
+HOSTS = ["data-api.ecb.europa.eu", "api.bcb.gov.br", "api.coingecko.com", "stooq.com",
+         "finance.yahoo.com", "query1.finance.yahoo.com"]
+
+def _walk(n: int, level: float, vol: float, rng) -> np.ndarray:
+    return level * np.exp(np.cumsum(rng.normal(0, vol, n)))
+
+def ecb_codes(n: int) -> list[str]:
+    return ECB_CODES[:n] + [f"X{i:02d}" for i in range(max(0, n - len(ECB_CODES)))]
+
+# ---------------- payloads no formato de cada fonte ----------------
+def ecb_payload(codes: list[str], days: pd.DatetimeIndex, rng) -> dict:
+    """SDMX-JSON (format=jsondata) com uma série D.<code>.EUR.SP00.A por moeda."""
+    series = {}
+    for i, code in enumerate(codes):
+        rates = _walk(len(days), ECB_LEVELS.get(code, rng.lognormal(0, 1.5)), 0.003, rng)
+        series[f"0:{i}:0:0:0"] = {"attributes": [0, None, 0],
+                                  "observations": {str(j): [round(float(r), 6), 0, 0, None, None]
+                                                   for j, r in enumerate(rates)}}
+    dims = {
+        "series": [{"id": "FREQ", "values": [{"id": "D", "name": "Daily"}]},
+                   {"id": "CURRENCY", "values": [{"id": c} for c in codes]},
+                   {"id": "CURRENCY_DENOM", "values": [{"id": "EUR", "name": "Euro"}]},
+                   {"id": "EXR_TYPE", "values": [{"id": "SP00", "name": "Spot"}]},
+                   {"id": "EXR_SUFFIX", "values": [{"id": "A", "name": "Average"}]}],
+        "observation": [{"id": "TIME_PERIOD", "values": [{"id": d.strftime("%Y-%m-%d")} for d in days]}],
+    }
+    return {"header": {"prepared": pd.Timestamp.now("UTC").isoformat()},
+            "dataSets": [{"action": "Replace", "series": series}],
+            "structure": {"dimensions": dims}}
+
+def ptax_payload(days: pd.DatetimeIndex, rng) -> list[dict]:
+    """SGS/BACEN: [{"data": "dd/mm/aaaa", "valor": "5.1234"}, ...] (valor como texto, como na API)."""
+    rates = _walk(len(days), 5.0, 0.006, rng)
+    return [{"data": d.strftime("%d/%m/%Y"), "valor": f"{r:.4f}"} for d, r in zip(days, rates)]
+
+def coingecko_payload(start, n_days: int, points_per_day: int, rng) -> dict:
+    """market_chart: prices/market_caps/total_volumes como [[ts_ms, valor], ...]."""
+    n = n_days * points_per_day
+    start_ms = int(pd.Timestamp(start).value // 10**6)
+    ts = start_ms + np.arange(n, dtype="int64") * (86_400_000 // points_per_day)
+    prices = _walk(n, 30_000, 0.02 / np.sqrt(points_per_day), rng)
+    caps = prices * 19.5e6
+    vols = rng.lognormal(23, 0.4, n)
+    pairs = lambda values: [[int(t), float(v)] for t, v in zip(ts, values)]
+    return {"prices": pairs(prices), "market_caps": pairs(caps), "total_volumes": pairs(vols)}
+
+def _ohlc(days: pd.DatetimeIndex, level: float, rng) -> pd.DataFrame:
+    close = _walk(len(days), level, 0.01, rng)
+    open_ = close * np.exp(rng.normal(0, 0.004, len(days)))
+    spread = np.abs(rng.normal(0, 0.006, len(days)))
+    return pd.DataFrame({
+        "Date": days.strftime("%Y-%m-%d"),
+        "Open": open_, "High": np.maximum(open_, close) * (1 + spread),
+        "Low": np.minimum(open_, close) * (1 - spread), "Close": close,
+        "Volume": rng.integers(10**8, 10**9, len(days)).astype("float64"),
+    })
+
+def stooq_csv(days: pd.DatetimeIndex, rng, level: float = 4_000.0) -> bytes:
+    """CSV do Stooq: Date,Open,High,Low,Close,Volume."""
+    return _ohlc(days, level, rng).to_csv(index=False, float_format="%.2f").encode("utf-8")
+
+def yahoo_payload(days: pd.DatetimeIndex, rng, symbol: str = "^BVSP", level: float = 100_000.0) -> dict:
+    """Chart API v8 (interval=1d); timestamps na abertura do pregão (10h de Brasília = 13h UTC)."""
+    df = _ohlc(days, level, rng)
+    ts = ((days + pd.Timedelta(hours=13) - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).tolist()
+    q = {k.lower(): df[k].round(2).tolist() for k in ("Open", "High", "Low", "Close")}
+    q["volume"] = df["Volume"].astype("int64").tolist()
+    meta = {"currency": "BRL", "symbol": symbol, "exchangeName": "SAO", "instrumentType": "INDEX",
+            "timezone": "BRT", "exchangeTimezoneName": "America/Sao_Paulo", "dataGranularity": "1d"}
+    return {"chart": {"result": [{"meta": meta, "timestamp": ts,
+                                  "indicators": {"quote": [q], "adjclose": [{"adjclose": q["close"]}]}}],
+                      "error": None}}
+
+# ---------------- diretório de trabalho ----------------
+class _Writer:
+    def __init__(self, out: str):
+        self.dir = os.path.join(out, "replay")
+        os.makedirs(self.dir, exist_ok=True)
+        self.routes = []
+        self.bytes = 0
+
+    def add(self, url: str, body, content_type: str, match: dict | None = None, slice_: str | None = None):
+        """Registra a rota host+path (+ parâmetros que identificam o símbolo); demais parâmetros são ignorados."""
+        p = urlparse(url)
+        name = f"{len(self.routes):04d}_{p.netloc.split('.')[-2]}"
+        name += ".json" if "json" in content_type else ".csv" if "csv" in content_type else ".html"
+        data = body if isinstance(body, bytes) else json.dumps(body, separators=(",", ":")).encode("utf-8")
+        with open(os.path.join(self.dir, name), "wb") as f:
+            f.write(data)
+        self.bytes += len(data)
+        self.routes.append({"host": p.netloc, "path": unquote(p.path), "query": match or {},
+                            "file": name, "content_type": content_type, **({"slice": slice_} if slice_ else {})})
+
+def generate(out: str, years: int, currencies: int, indices: int, points_per_day: int,
+             throttle: bool = False, seed: int = 0, coins: int = 1) -> dict:
+    rng = np.random.default_rng(seed)
+    end = date.today()
+    start = end - timedelta(days=int(years * 365.25))
+    w = _Writer(out)
+
+    # ECB: uma rota por moeda (modo padrão) e a rota do lote D.A+B+....EUR.SP00.A (ecb.batch)
+    codes = ecb_codes(currencies)
+    ecb_days = business_days("ECB", start, end)
+    full = ecb_payload(codes, ecb_days, rng)
+    for i, code in enumerate(codes):
+        one = {**full, "dataSets": [{"action": "Replace",
+                                     "series": {"0:0:0:0:0": full["dataSets"][0]["series"][f"0:{i}:0:0:0"]}}],
+               "structure": {"dimensions": {
+                   "series": [d if d["id"] != "CURRENCY" else {"id": "CURRENCY", "values": [{"id": code}]}
+                              for d in full["structure"]["dimensions"]["series"]],
+                   "observation": full["structure"]["dimensions"]["observation"]}}}
+        w.add(f"{ECB_BASE_URL}/D.{code}.EUR.SP00.A", one, "application/json")
+    w.add(f"{ECB_BASE_URL}/D.{'+'.join(codes)}.EUR.SP00.A", full, "application/json")
+
+    w.add(f"https://api.bcb.gov.br/dados/serie/bcdata.sgs.{PTAX_SERIE}/dados",
+          ptax_payload(business_days("BR", start, end), rng), "application/json")
+
+    n_days = (end - start).days + 1
+    btc = coingecko_payload(start, n_days, points_per_day, rng)
+    w.add(f"{COINGECKO_BASE_URL}/coins/bitcoin/market_chart", btc, "application/json", {"vs_currency": "usd"})
+    # market_chart/range (ingestor multi-moeda e backfill): o replay recorta a série por from/to
+    coin_ids = COINGECKO_COINS[:coins] + [f"coin{i:02d}" for i in range(max(0, coins - len(COINGECKO_COINS)))]
+    for i, coin in enumerate(coin_ids):
+        payload = btc if i == 0 else coingecko_payload(start, n_days, points_per_day, rng)
+        w.add(f"{COINGECKO_BASE_URL}/coins/{coin}/market_chart/range", payload, "application/json",
+              {"vs_currency": "usd"}, slice_="unix")
+
+    us_days = business_days("US", start, end)
+    stooq = STOOQ_INDICES[:indices] + [(f"IDX{i:02d}", f"^i{i:02d}") for i in range(max(0, indices - len(STOOQ_INDICES)))]
+    for name, code in stooq:
+        w.add("https://stooq.com/q/d/l/", stooq_csv(us_days, rng), "text/csv", {"s": code})
+
+    # Yahoo: página de histórico (só cookies) e Chart API; o CSV v7 fica sem rota (404) como hoje no Yahoo
+    w.add("https://finance.yahoo.com/quote/^BVSP/history", b"<html><body>history</body></html>", "text/html")
+    w.add("https://query1.finance.yahoo.com/v8/finance/chart/^BVSP",
+          yahoo_payload(business_days("BR", start, end), rng), "application/json")
+
+    cfg = {
+        "ecb": {"base_url": ECB_BASE_URL, "format": "jsondata",
+                "symbols": [{"code": c, "key": f"D.{c}.EUR.SP00.A"} for c in codes]},
+        "bacen_ptax": {"serie_usdbrl": PTAX_SERIE},
+        "coingecko": {"base_url": COINGECKO_BASE_URL, "coin_id": "bitcoin", "vs_currency": "usd", "days": "max",
+                      "coins": coin_ids},
+        "stooq": {"symbols": [{"name": n, "code": c, "url": f"https://stooq.com/q/d/l/?s={c}&i=d"}
+                              for n, c in stooq]},
+        "yahoo": {"indices": [{"name": "IBOV", "code": "^bvsp", "ticker": "%5EBVSP"}]},
+    }
+    if not throttle:
+        # rate 0 = sem intervalo entre requisições: o benchmark mede o pipeline, não o rate limit dos provedores
+        cfg["http"] = {"hosts": {h: {"concurrency": 8, "rate": 0} for h in HOSTS}}
+    os.makedirs(os.path.join(out, "configs"), exist_ok=True)
+    with open(os.path.join(out, "configs", "sources.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f, sort_keys=False, allow_unicode=True)
+
+    manifest = {"start": start.isoformat(), "end": end.isoformat(), "years": years, "currencies": currencies,
+                "indices": indices, "coins": coins, "points_per_day": points_per_day, "seed": seed,
+                "routes": w.routes}
+    with open(os.path.join(w.dir, "routes.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    logger.success(f"Sintéticos em {out}: {len(w.routes)} rotas, {w.bytes / 1e6:.1f} MB "
+                   f"({start} → {end}, {len(codes)} moedas, {len(stooq) + 1} índices, {len(coin_ids)} cripto, {points_per_day} pontos/dia)")
+    return manifest
+
+def main():
+    ap = argparse.ArgumentParser(description="Gera payloads sintéticos no formato de cada fonte")
+    ap.add_argument("--out", default="data/bench", help="diretório de trabalho do benchmark")
+    ap.add_argument("--years", type=int, default=10)
+    ap.add_argument("--currencies", type=int, default=30, help="moedas do ECB (USD e BRL sempre entram)")
+    ap.add_argument("--indices", type=int, default=4, help="índices do Stooq (além do ^BVSP via Yahoo)")
+    ap.add_argument("--coins", type=int, default=1, help="moedas da CoinGecko (coingecko.coins)")
+    ap.add_argument("--points-per-day", type=int, default=1, help="granularidade CoinGecko (24 = horária)")
+    ap.add_argument("--throttle", action="store_true", help="mantém os limites de req/s por host de produção")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    generate(args.out, args.years, max(args.currencies, 16), args.indices, args.points_per_day,
+             args.throttle, args.seed, max(args.coins, 1))
+
+if __name__ == "__main__":
+    main()
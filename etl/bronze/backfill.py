@@ -0,0 +1,361 @@
+# etl/bronze/backfill.py
+# Backfill histórico em blocos paralelos, com checkpoint por bloco em md_catalog.backfill_chunks.
+#
+#   python -m etl.bronze.backfill --source bacen_ptax --from 2010-01-01 --to 2019-12-31
+#   python -m etl.bronze.backfill --source ecb --from 2000-01-01 --symbols USD,GBP --chunk-months 6
+#   python -m etl.bronze.backfill --status
+import argparse, json
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable
+import pandas as pd
+from loguru import logger
+from requests import HTTPError
+from sqlalchemy import text, bindparam
+from sqlalchemy.types import Date, String, Float
+from etl.common.io import load_sources_yaml, http_get, iter_concurrent, with_query_params
+from etl.common.lake import write_bronze, dedup_bronze
+from etl.common.db import get_engine, upsert
+from etl.common.env import START_DATE
+from etl.common.backend import upsert_sql
+from etl.common.schema import BACKFILL_TABLE, ensure_schema
+from etl.common.watermark import set_watermark, set_watermarks, rewind_watermark
+from etl.common import telemetry
+from etl.bronze.parsers import parse_sgs, parse_ecb_sdmx, parse_coingecko_series, parse_stooq_csv, parse_yahoo_chart
+from etl.bronze import (ingest_ecb_fx, ingest_ptax_usdbrl, ingest_coingecko_btcusd, ingest_coingecko_crypto,
+                        ingest_yahoo_index)
+
+# Lote gravado de uma vez (e checkpoint dos blocos dele): o que cair antes do flush é refeito
+FLUSH_ROWS = 250_000
+FLUSH_CHUNKS = 32
+# Checkpoints a jusante recuados depois do backfill de cada fonte (+ todos os da gold)
+DOWNSTREAM = {
+    "ecb": [("silver", "fx_rates")],
+    "bacen_ptax": [("silver", "fx_rates"), ("silver", "crypto_rates")],
+    "coingecko": [("silver", "crypto_rates")],
+    "coingecko_points": [("silver", "crypto_rates")],
+    "stooq": [("silver", "index_ohlc")],
+    "yahoo": [("silver", "index_ohlc")],
+}
+GOLD_CHECKPOINTS = [("gold", "facts"), ("gold", "rollups"), ("gold", "features")]
+
+INDEX_DTYPE = {"date": Date(), "code": String(16), "name": String(64),
+               "open": Float(), "high": Float(), "low": Float(), "close": Float(), "volume": Float()}
+INDEX_COLS = ["date", "code", "name", "open", "high", "low", "close", "volume"]
+
+@dataclass
+class Chunk:
+    source: str
+    symbol: str
+    start: date
+    end: date
+    item: dict          # configuração do símbolo no sources.yaml
+
+@dataclass(frozen=True)
+class Source:
+    table: str
+    keys: tuple[str, ...]
+    dtype: dict
+    months: int                                             # tamanho padrão do bloco
+    symbols: Callable[[dict], list[tuple[str, dict]]]       # cfg da fonte -> [(símbolo, item)]
+    request: Callable[[Chunk], tuple[str, dict | None]]     # bloco -> (url, headers)
+    parse: Callable[[bytes, Chunk], pd.DataFrame]
+    symbol_col: str | None = None                           # coluna do símbolo; None = série única
+    watermark_symbol: bool = True                           # série única: watermark "fonte:símbolo" ou só "fonte"
+    db_keys: tuple[str, ...] | None = None                  # PK da tabela, se diferente das chaves do lake
+    max_days: int | None = None                             # teto do bloco em dias (vale também com --chunk-months)
+    section: str | None = None                              # seção do sources.yaml, se não for o nome da fonte
+
+# ---------------- fontes ----------------
+def _ptax_symbols(cfg: dict) -> list[tuple[str, dict]]:
+    return [("USDBRL", cfg)]
+
+def _ptax_request(c: Chunk) -> tuple[str, dict | None]:
+    # SGS recusa janelas longas em séries diárias: cada bloco é uma consulta dataInicial/dataFinal
+    return ingest_ptax_usdbrl.build_url(c.item["serie_usdbrl"], c.start, c.end), None
+
+def _ecb_symbols(cfg: dict) -> list[tuple[str, dict]]:
+    return [(s["code"], {**s, "base_url": cfg["base_url"], "format": cfg.get("format", "jsondata")})
+            for s in cfg.get("symbols", []) if s["code"] != "EUR"]
+
+def _ecb_request(c: Chunk) -> tuple[str, dict | None]:
+    return ingest_ecb_fx.build_url(c.item["base_url"], c.item["key"], c.item["format"],
+                                   c.start.isoformat(), c.end.isoformat()), None
+
+def _ecb_parse(content: bytes, c: Chunk) -> pd.DataFrame:
+    return parse_ecb_sdmx(json.loads(content), c.symbol) if content.strip() else pd.DataFrame()
+
+def _unix(d: date) -> int:
+    return int(datetime(d.year, d.month, d.day, tzinfo=timezone.utc).timestamp())
+
+def _coingecko_symbols(cfg: dict) -> list[tuple[str, dict]]:
+    return [(f'{cfg["coin_id"]}/{cfg["vs_currency"]}', cfg)]
+
+def _coingecko_request(c: Chunk) -> tuple[str, dict | None]:
+    # /range devolve pontos diários para janelas > 90 dias (blocos de 1 ano)
+    cg = c.item
+    params, headers, _ = ingest_coingecko_btcusd.api_auth(cg)
+    url = (f'{cg["base_url"]}/coins/{cg["coin_id"]}/market_chart/range?vs_currency={cg["vs_currency"]}'
+           f'&from={_unix(c.start)}&to={_unix(c.end + timedelta(days=1)) - 1}')
+    return (with_query_params(url, params) if params else url), headers or None
+
+def _coingecko_parse(content: bytes, c: Chunk) -> pd.DataFrame:
+    pts = parse_coingecko_series(json.loads(content), "prices")
+    return pd.DataFrame({"date": pts["ts"].dt.date, "btc_usd": pts["value"]}).groupby("date", as_index=False).mean()
+
+def _points_symbols(cfg: dict) -> list[tuple[str, dict]]:
+    # Uma série por moeda (id da CoinGecko), como o watermark "coingecko_points:<id>" do ingestor
+    return [(c["id"], cfg) for c in ingest_coingecko_crypto.coin_list(cfg)] if cfg else []
+
+def _points_request(c: Chunk) -> tuple[str, dict | None]:
+    return ingest_coingecko_crypto.build_request(c.item, c.symbol, c.start, c.end)
+
+def _points_parse(content: bytes, c: Chunk) -> pd.DataFrame:
+    return ingest_coingecko_crypto.parse_points(json.loads(content), c.symbol)
+
+def _stooq_symbols(cfg: dict) -> list[tuple[str, dict]]:
+    return [(it["code"], it) for it in cfg.get("symbols", [])]
+
+def _stooq_request(c: Chunk) -> tuple[str, dict | None]:
+    return with_query_params(c.item["url"], {"d1": c.start.strftime("%Y%m%d"), "d2": c.end.strftime("%Y%m%d")}), None
+
+def _stooq_parse(content: bytes, c: Chunk) -> pd.DataFrame:
+    df = parse_stooq_csv(content) if len(content) >= 32 else pd.DataFrame()
+    if "date" not in df.columns:
+        return pd.DataFrame(columns=INDEX_COLS)
+    return df.assign(code=c.item["code"], name=c.item["name"])[INDEX_COLS]
+
+def _yahoo_symbols(cfg: dict) -> list[tuple[str, dict]]:
+    return [(it["code"], it) for it in cfg.get("indices", [])]
+
+def _yahoo_request(c: Chunk) -> tuple[str, dict | None]:
+    # Só a Chart API: com period1/period2 explícitos não precisa da página de histórico nem do CSV v7
+    _, _, chart_url = ingest_yahoo_index.build_urls(c.item["ticker"], c.start.isoformat(), c.end.isoformat())
+    return chart_url, {"User-Agent": ingest_yahoo_index.UA}
+
+def _yahoo_parse(content: bytes, c: Chunk) -> pd.DataFrame:
+    df = parse_yahoo_chart(json.loads(content)).rename(columns=str.lower)
+    return df.assign(code=c.item["code"], name=c.item["name"])[INDEX_COLS]
+
+SOURCES: dict[str, Source] = {
+    "bacen_ptax": Source(ingest_ptax_usdbrl.TABLE, ("date",), {"date": Date(), "usdbrl": Float()}, 12,
+                         _ptax_symbols, _ptax_request, lambda content, c: parse_sgs(content),
+                         watermark_symbol=False),
+    "ecb": Source(ingest_ecb_fx.TABLE, ("date", "code"),
+                  {"date": Date(), "code": String(10), "rate_vs_eur": Float()}, 12,
+                  _ecb_symbols, _ecb_request, _ecb_parse, symbol_col="code"),
+    "coingecko": Source(ingest_coingecko_btcusd.TABLE, ("date",), {"date": Date(), "btc_usd": Float()}, 12,
+                        _coingecko_symbols, _coingecko_request, _coingecko_parse),
+    # Pontos horários só em janelas de até 90 dias: blocos de 2 meses
+    "coingecko_points": Source(ingest_coingecko_crypto.TABLE, ("coin", "ts"), ingest_coingecko_crypto.DTYPE, 2,
+                               _points_symbols, _points_request, _points_parse, symbol_col="coin",
+                               db_keys=("date", "coin", "ts"), max_days=ingest_coingecko_crypto.WINDOW_DAYS,
+                               section="coingecko"),
+    "stooq": Source("md_bronze.stooq_index_raw", ("date", "code"), INDEX_DTYPE, 60,
+                    _stooq_symbols, _stooq_request, _stooq_parse, symbol_col="code"),
+    "yahoo": Source(ingest_yahoo_index.TABLE, ("date", "code"), INDEX_DTYPE, 60,
+                    _yahoo_symbols, _yahoo_request, _yahoo_parse, symbol_col="code"),
+}
+
+def source_symbols(cfg: dict, name: str) -> list[tuple[str, dict]]:
+    spec = SOURCES[name]
+    return spec.symbols(cfg.get(spec.section or name) or {})
+
+# ---------------- blocos ----------------
+def _month_index(d: date) -> int:
+    return d.year * 12 + d.month - 1
+
+def _month_date(i: int) -> date:
+    return date(i // 12, i % 12 + 1, 1)
+
+def split_range(start: date, end: date, months: int) -> list[tuple[date, date]]:
+    """Blocos alinhados ao calendário (múltiplos de `months` meses), cortados em [start, end]: re-execuções
+    com outro --from/--to geram os mesmos blocos internos e reaproveitam os checkpoints."""
+    out = []
+    b = _month_index(start) // months
+    while True:
+        lo, hi = _month_date(b * months), _month_date((b + 1) * months) - timedelta(days=1)
+        if lo > end:
+            return out
+        out.append((max(lo, start), min(hi, end)))
+        b += 1
+
+def plan(cfg: dict, sources: list[str], start: date, end: date, symbols: list[str] | None = None,
+         chunk_months: int | None = None) -> list[Chunk]:
+    per_source = []
+    for name in sources:
+        spec = SOURCES[name]
+        chunks = []
+        for symbol, item in source_symbols(cfg, name):
+            if symbols and symbol not in symbols:
+                continue
+            for lo, hi in split_range(start, end, chunk_months or spec.months):
+                for wlo, whi in (ingest_coingecko_crypto.windows(lo, hi, spec.max_days) if spec.max_days
+                                 else [(lo, hi)]):
+                    chunks.append(Chunk(name, symbol, wlo, whi, item))
+        per_source.append(chunks)
+    # Intercala as fontes: um host lento (CoinGecko) não ocupa todas as threads do pool no começo
+    out = []
+    for i in range(max((len(c) for c in per_source), default=0)):
+        out += [c[i] for c in per_source if i < len(c)]
+    return out
+
+# ---------------- checkpoints (md_catalog.backfill_chunks) ----------------
+def done_ranges(engine, sources: list[str]) -> dict[tuple[str, str], list[tuple[date, date]]]:
+    sql = text(f"SELECT source_name, symbol, chunk_start, chunk_end FROM {BACKFILL_TABLE} "
+               f"WHERE status = 'DONE' AND source_name IN :sources").bindparams(bindparam("sources", expanding=True))
+    out: dict[tuple[str, str], list[tuple[date, date]]] = {}
+    with engine.connect() as conn:
+        for source, symbol, lo, hi in conn.execute(sql, {"sources": sources}):
+            out.setdefault((source, symbol), []).append((lo, hi))
+    return out
+
+def _covered(c: Chunk, done: dict) -> bool:
+    return any(lo <= c.start and hi >= c.end for lo, hi in done.get((c.source, c.symbol), []))
+
+def mark(engine, chunks: list[tuple[Chunk, int]], status: str, message: str = ""):
+    if not chunks:
+        return
+    cols = ["source_name", "symbol", "chunk_start", "chunk_end", "status", "rows_loaded", "message"]
+    sql = text(upsert_sql(engine, BACKFILL_TABLE, cols, cols[:4], {
+        "status": "{new}", "rows_loaded": "{new}", "message": "{new}",
+        "attempts": "{old} + 1", "updated_at": "CURRENT_TIMESTAMP"}))
+    with engine.begin() as conn:
+        conn.execute(sql, [{"source_name": c.source, "symbol": c.symbol, "chunk_start": c.start, "chunk_end": c.end,
+                            "status": status, "rows_loaded": rows, "message": message[:2000]} for c, rows in chunks])
+
+# ---------------- busca e carga ----------------
+def fetch_chunk(c: Chunk) -> pd.DataFrame:
+    spec = SOURCES[c.source]
+    url, headers = spec.request(c)
+    try:
+        content = http_get(url, headers=headers)
+    except HTTPError as exc:
+        # ECB e SGS respondem 404 quando a janela não tem observações (ex.: feriados longos, antes do início)
+        if exc.response is not None and exc.response.status_code == 404:
+            return pd.DataFrame()
+        raise
+    df = spec.parse(content, c)
+    if df.empty:
+        return df
+    df["date"] = pd.to_datetime(df["date"]).dt.date
+    return df[(df["date"] >= c.start) & (df["date"] <= c.end)]
+
+def load_source(engine, source: str, items: list[tuple[Chunk, pd.DataFrame]]) -> int:
+    """Grava os frames dos blocos de uma fonte (dedup + lake + upsert + watermarks); devolve as linhas novas."""
+    spec = SOURCES[source]
+    frames = [df for _, df in items if not df.empty]
+    if not frames:
+        return 0
+    df = pd.concat(frames, ignore_index=True).drop_duplicates(subset=list(spec.keys), keep="last")
+    if source == "ecb":
+        df = ingest_ecb_fx.add_eur(df)
+    delta = dedup_bronze(df, source, keys=list(spec.keys))
+    if spec.symbol_col:
+        write_bronze(delta.df, source, keys=list(spec.keys), symbol_col=spec.symbol_col, revision=delta.revision)
+    else:
+        write_bronze(delta.df, source, keys=list(spec.keys), symbol=items[0][0].symbol, revision=delta.revision)
+    upsert(engine, spec.table, delta.df, key_cols=list(spec.db_keys or spec.keys), dtype=spec.dtype)
+    if spec.symbol_col:
+        set_watermarks(engine, source, df[df[spec.symbol_col] != "EUR"], symbol_col=spec.symbol_col)
+    else:
+        set_watermark(engine, source, items[0][0].symbol if spec.watermark_symbol else None, df["date"].max())
+    delta.commit()
+    return len(delta.df)
+
+def flush(engine, batch: list[tuple[Chunk, pd.DataFrame]]) -> int:
+    """Grava o lote por fonte e só então marca os blocos como DONE."""
+    total = 0
+    for source in dict.fromkeys(c.source for c, _ in batch):
+        items = [(c, df) for c, df in batch if c.source == source]
+        total += load_source(engine, source, items)
+        mark(engine, [(c, len(df)) for c, df in items], "DONE")
+    return total
+
+def run(engine, cfg: dict, sources: list[str], start: date, end: date, symbols: list[str] | None = None,
+        chunk_months: int | None = None, max_workers: int | None = None) -> tuple[int, int]:
+    """Executa o backfill; devolve (blocos com falha, linhas gravadas)."""
+    chunks = plan(cfg, sources, start, end, symbols, chunk_months)
+    done = done_ranges(engine, sources)
+    pending = [c for c in chunks if not _covered(c, done)]
+    logger.info(f"Backfill {','.join(sources)} {start} → {end}: {len(chunks)} blocos, "
+                f"{len(chunks) - len(pending)} já concluídos, {len(pending)} a buscar.")
+    demo_key = ingest_coingecko_btcusd.api_auth(cfg.get("coingecko") or {})[2]
+    if demo_key and {"coingecko", "coingecko_points"} & set(sources) and start < date.today() - timedelta(days=365):
+        logger.warning("CoinGecko demo key só cobre os últimos 365 dias: blocos anteriores voltam vazios ou com erro.")
+
+    batch, batch_rows, failed, written, finished = [], 0, 0, 0, 0
+    for c, out in iter_concurrent(fetch_chunk, pending, max_workers):
+        finished += 1
+        if isinstance(out, Exception):
+            failed += 1
+            logger.error(f"Backfill {c.source}:{c.symbol} {c.start} → {c.end} falhou: {out}")
+            mark(engine, [(c, 0)], "FAILED", f"{type(out).__name__}: {out}")
+            continue
+        batch.append((c, out))
+        batch_rows += len(out)
+        if batch_rows >= FLUSH_ROWS or len(batch) >= FLUSH_CHUNKS:
+            written += flush(engine, batch)
+            logger.info(f"Backfill: {finished}/{len(pending)} blocos, {written:,} linhas gravadas")
+            batch, batch_rows = [], 0
+    if batch:
+        written += flush(engine, batch)
+    return failed, written
+
+def rewind_downstream(engine, sources: list[str], start: date):
+    checkpoints = dict.fromkeys([cp for s in sources for cp in DOWNSTREAM.get(s, [])] + GOLD_CHECKPOINTS)
+    for cp in checkpoints:
+        rewind_watermark(engine, *cp, start)
+    logger.info(f"Checkpoints {', '.join(':'.join(cp) for cp in checkpoints)} recuados para {start}.")
+    if start < pd.to_datetime(START_DATE).date():
+        logger.warning(f"START_DATE={START_DATE} é posterior a {start}: rode a silver/gold com "
+                       f"START_DATE={start} para processar o histórico carregado.")
+
+def status(engine):
+    sql = text(f"""
+        SELECT source_name, status, COUNT(*) AS chunks, MIN(chunk_start) AS first, MAX(chunk_end) AS last,
+               SUM(rows_loaded) AS rows_loaded
+        FROM {BACKFILL_TABLE} GROUP BY source_name, status ORDER BY source_name, status""")
+    with engine.connect() as conn:
+        for r in conn.execute(sql):
+            print(f"{r.source_name:<12} {r.status:<7} {r.chunks:>6} blocos  {r.first} → {r.last}  "
+                  f"{int(r.rows_loaded or 0):>12,} linhas")
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Backfill histórico em blocos, paralelo e retomável")
+    ap.add_argument("--source", help=f"fontes separadas por vírgula ou 'all' ({', '.join(SOURCES)})")
+    ap.add_argument("--from", dest="start", type=date.fromisoformat, help="primeira data (AAAA-MM-DD)")
+    ap.add_argument("--to", dest="end", type=date.fromisoformat, default=date.today(), help="última data (default: hoje)")
+    ap.add_argument("--symbols", help="só estes símbolos (ex.: USD,GBP ou ^spx)")
+    ap.add_argument("--chunk-months", type=int, help="tamanho do bloco em meses (default por fonte)")
+    ap.add_argument("--workers", type=int, help="requisições simultâneas (default: HTTP_MAX_WORKERS)")
+    ap.add_argument("--no-rewind", action="store_true", help="não recua os checkpoints da silver/gold")
+    ap.add_argument("--status", action="store_true", help="resumo dos checkpoints e sai")
+    args = ap.parse_args(argv)
+
+    engine = get_engine()
+    ensure_schema(engine)
+    if args.status:
+        status(engine)
+        return 0
+    if not args.source or not args.start:
+        ap.error("--source e --from são obrigatórios")
+    sources = list(SOURCES) if args.source == "all" else [s.strip() for s in args.source.split(",") if s.strip()]
+    unknown = [s for s in sources if s not in SOURCES]
+    if unknown:
+        ap.error(f"fonte(s) sem backfill: {', '.join(unknown)}")
+    symbols = [s.strip() for s in args.symbols.split(",")] if args.symbols else None
+
+    with telemetry.stage(f"backfill:{','.join(sources)}"):
+        failed, written = run(engine, load_sources_yaml(), sources, args.start, args.end, symbols,
+                              args.chunk_months, args.workers)
+        if not args.no_rewind and written:
+            rewind_downstream(engine, sources, args.start)
+    if failed:
+        logger.error(f"Backfill terminou com {failed} bloco(s) com falha; rode de novo para retomar.")
+        return 1
+    logger.success(f"Backfill concluído: {written:,} linhas gravadas.")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,20 @@
+# Compactação do lake Bronze: junta os arquivos de cada partição e remove duplicatas pelas chaves naturais.
+#   python -m etl.bronze.compact_lake            # todas as fontes
+#   python -m etl.bronze.compact_lake ecb yahoo  # só as fontes informadas
+#   python -m etl.bronze.compact_lake --rebuild-hashes ecb  # recria também o índice de conteúdo
+import sys
+from loguru import logger
+from etl.common.lake import compact, rebuild_hashes, sources
+
+def main(argv=None):
+    args = list(argv if argv is not None else sys.argv[1:])
+    rebuild = "--rebuild-hashes" in args
+    wanted = [a for a in args if a != "--rebuild-hashes"] or sources()
+    total = sum(compact(src) for src in wanted)
+    if rebuild:
+        for src in wanted:
+            rebuild_hashes(src)
+    logger.success(f"Bronze lake: {total} partição(ões) compactada(s) em {len(wanted)} fonte(s).")
+
+if __name__ == "__main__":
+    main()
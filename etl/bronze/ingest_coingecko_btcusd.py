@@ -1,46 +1,57 @@
 import pandas as pd, io, json
 from loguru import logger
-from etl.common.io import load_sources_yaml, ensure_dirs, http_get, save_df, today_tag
-from etl.common.db import get_engine
+from etl.common.io import load_sources_yaml, http_get_cached, with_query_params
+from etl.common.lake import write_bronze, dedup_bronze
+from etl.common.db import get_engine, upsert
+from etl.common.watermark import get_watermark, incremental_start, set_watermark
 from etl.common.env import (
-    START_DATE,
     COINGECKO_API_KEY,
     COINGECKO_API_KEY_HEADER,
     COINGECKO_API_KEY_QUERY_PARAM,
 )
 from sqlalchemy.types import Date, Float
 from requests import HTTPError
-from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+from etl.bronze.parsers import parse_coingecko_series
 
-BRONZE_DIR = "data/bronze/coingecko"
 TABLE = "md_bronze.coingecko_btcusd_raw"
+SOURCE = "coingecko"
+
+def api_auth(cg: dict) -> tuple[dict, dict, bool]:
+    """(query params, headers, chave demo?) para a chave da CoinGecko configurada (ou nenhuma)."""
+    api_key = cg.get("api_key") or COINGECKO_API_KEY
+    api_key_header = (cg.get("api_key_header") or COINGECKO_API_KEY_HEADER or "").strip()
+    api_key_query_param = (cg.get("api_key_query_param") or COINGECKO_API_KEY_QUERY_PARAM or "").strip()
+    if not api_key:
+        return {}, {}, False
+    if api_key_query_param:
+        return {api_key_query_param: api_key}, {}, "x_cg_demo" in api_key_query_param.lower()
+    if api_key_header:
+        return {}, {api_key_header: api_key}, "x-cg-demo" in api_key_header.lower()
+    # Heurística: chave demo (CG-) usa query param; caso contrário, header Pro.
+    if api_key.upper().startswith("CG-"):
+        return {"x_cg_demo_api_key": api_key}, {}, True
+    return {}, {"x-cg-pro-api-key": api_key}, False
 
 def main():
     cfg = load_sources_yaml()
     cg = cfg["coingecko"]
     api_key = cg.get("api_key") or COINGECKO_API_KEY
-    api_key_header = (cg.get("api_key_header") or COINGECKO_API_KEY_HEADER or "").strip()
-    api_key_query_param = (cg.get("api_key_query_param") or COINGECKO_API_KEY_QUERY_PARAM or "").strip()
+    auth_params, headers, use_demo_key = api_auth(cg)
     days_cfg = str(cg.get("days", "max"))
-    start_dt = pd.to_datetime(START_DATE).date()
+    engine = get_engine()
+    symbol = f'{cg["coin_id"]}/{cg["vs_currency"]}'
+    # Com watermark, pede apenas os dias faltantes (+overlap) em vez de days=max
+    incremental = get_watermark(engine, SOURCE, symbol) is not None
+    start_dt = incremental_start(engine, SOURCE, symbol, cg.get("overlap_days"))
     today = pd.Timestamp.utcnow().date()
     diff_days = (today - start_dt).days
     if diff_days < 0:
         diff_days = 0
-    use_demo_key = False
-    if api_key:
-        if api_key_header and "x-cg-demo" in api_key_header.lower():
-            use_demo_key = True
-        elif api_key_query_param and "x_cg_demo" in api_key_query_param.lower():
-            use_demo_key = True
-        elif not api_key_header and not api_key_query_param and api_key.upper().startswith("CG-"):
-            use_demo_key = True
-
     days_param = days_cfg
     effective_start_date = start_dt
-    if days_cfg.lower() == "max" and use_demo_key:
+    if days_cfg.lower() == "max" and (use_demo_key or incremental):
         days_window = diff_days + 1
-        if days_window > 365:
+        if days_window > 365 and use_demo_key:
             logger.warning("CoinGecko demo key limita a busca a 365 dias. Ajustando parâmetro 'days' para 365 e truncando período inicial.")
             days_window = 365
         if days_window <= 0:
@@ -53,34 +64,18 @@ def main():
             effective_start_date = max(start_dt, limit_start)
     url = (f'{cg["base_url"]}/coins/{cg["coin_id"]}/market_chart'
            f'?vs_currency={cg["vs_currency"]}&days={days_param}')
-    headers = {}
-    def append_query_param(url_in: str, param: str, value: str) -> str:
-        parsed = urlparse(url_in)
-        query = dict(parse_qsl(parsed.query))
-        query[param] = value
-        new_query = urlencode(query)
-        return urlunparse(parsed._replace(query=new_query))
-
-    if api_key:
-        if api_key_query_param:
-            url = append_query_param(url, api_key_query_param, api_key)
-        elif api_key_header:
-            headers[api_key_header] = api_key
-        else:
-            # Heurística: chave demo (CG-) usa query param; caso contrário, header Pro.
-            if api_key.upper().startswith("CG-"):
-                url = append_query_param(url, "x_cg_demo_api_key", api_key)
-                use_demo_key = True
-            else:
-                headers["x-cg-pro-api-key"] = api_key
-    ensure_dirs(BRONZE_DIR)
+    if days_param.isdigit() and int(days_param) <= 90:
+        # Janelas curtas viriam em granularidade horária; mantém o ponto diário da carga histórica
+        url += "&interval=daily"
+    if auth_params:
+        url = with_query_params(url, auth_params)
     log_url = url.replace(api_key, "***") if api_key else url
     logger.info(f"CoinGecko GET: {log_url}")
     if headers:
         logger.debug(f"CoinGecko headers usados: {list(headers.keys())}")
     logger.debug(f"CoinGecko days param: {days_param}; filtro inicial: {effective_start_date}")
     try:
-        raw = http_get(url, headers=headers or None)
+        res = http_get_cached(url, headers=headers or None)
     except HTTPError as exc:
         status = exc.response.status_code if exc.response is not None else None
         body = exc.response.text if exc.response is not None else ""
@@ -93,23 +88,25 @@ def main():
         elif status == 403:
             logger.error(f"CoinGecko retornou 403 Forbidden. Corpo: {body}")
         raise
-    payload = json.loads(raw.decode("utf-8"))
-    # prices: [ [ts_ms, price], ... ]
-    rows = []
-    for ts_ms, price in payload.get("prices", []):
-        d = pd.to_datetime(ts_ms, unit="ms").date()
-        rows.append({"date": d, "btc_usd": float(price)})
-    df = pd.DataFrame(rows)
+    if not res.changed:
+        logger.info("CoinGecko: payload inalterado desde a última carga, pulando.")
+        return
+    payload = json.loads(res.content.decode("utf-8"))
+    # prices: [ [ts_ms, price], ... ] -> conversão vetorizada de todos os timestamps de uma vez
+    pts = parse_coingecko_series(payload, "prices")
+    df = pd.DataFrame({"date": pts["ts"].dt.date, "btc_usd": pts["value"]})
     df = df[df["date"] >= effective_start_date].groupby("date", as_index=False).mean()
 
-    tag = today_tag()
-    save_df(df, f"{BRONZE_DIR}/btc_usd_{tag}.parquet")
+    delta = dedup_bronze(df, SOURCE, keys=["date"])
+    write_bronze(delta.df, SOURCE, keys=["date"], symbol=symbol, revision=delta.revision)
 
-    engine = get_engine()
-    df.to_sql(TABLE.split(".")[1], engine, schema=TABLE.split(".")[0],
-              if_exists="append", index=False,
-              dtype={"date": Date(), "btc_usd": Float()})
-    logger.success(f"Inserido Bronze -> {TABLE}: {len(df)} linhas.")
+    upsert(engine, TABLE, delta.df, key_cols=["date"],
+           dtype={"date": Date(), "btc_usd": Float()})
+    if not df.empty:
+        set_watermark(engine, SOURCE, symbol, df["date"].max())
+    delta.commit()
+    res.commit()
+    logger.success(f"Inserido Bronze -> {TABLE}: {len(delta.df)} linhas.")
 
 if __name__ == "__main__":
     main()
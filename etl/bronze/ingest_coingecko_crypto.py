@@ -0,0 +1,115 @@
+# etl/bronze/ingest_coingecko_crypto.py
+# Pontos intraday da CoinGecko (market_chart/range) para as moedas de coingecko.coins no sources.yaml.
+import json
+from datetime import date, datetime, timedelta, timezone
+import pandas as pd
+from loguru import logger
+from sqlalchemy.types import Date, DateTime, String, Float
+from etl.common.io import load_sources_yaml, http_get, iter_concurrent, with_query_params
+from etl.common.lake import write_bronze, dedup_bronze
+from etl.common.db import get_engine, upsert
+from etl.common.watermark import incremental_start, set_watermarks
+from etl.bronze.parsers import parse_coingecko_series
+from etl.bronze.ingest_coingecko_btcusd import api_auth
+
+TABLE = "md_bronze.coingecko_points_raw"
+SOURCE = "coingecko_points"
+# /market_chart/range devolve pontos horários para janelas de 2 a 90 dias (diários acima disso)
+WINDOW_DAYS = 90
+# Chave demo só alcança o último ano de histórico
+DEMO_HISTORY_DAYS = 365
+KNOWN_SYMBOLS = {"bitcoin": "BTC", "ethereum": "ETH", "tether": "USDT", "solana": "SOL", "ripple": "XRP",
+                 "binancecoin": "BNB", "cardano": "ADA", "dogecoin": "DOGE", "usd-coin": "USDC"}
+DTYPE = {"date": Date(), "coin": String(64), "ts": DateTime(), "price": Float(), "volume": Float()}
+
+def coin_list(cg: dict) -> list[dict]:
+    """coingecko.coins (ids ou {id, symbol}) -> [{id, symbol}]; sem a lista, só a moeda de coin_id."""
+    out = []
+    for c in cg.get("coins") or [cg.get("coin_id", "bitcoin")]:
+        c = {"id": c} if isinstance(c, str) else dict(c)
+        c["symbol"] = str(c.get("symbol") or KNOWN_SYMBOLS.get(c["id"], c["id"])).upper()
+        out.append(c)
+    return out
+
+def windows(start: date, end: date, days: int = WINDOW_DAYS) -> list[tuple[date, date]]:
+    out, lo = [], start
+    while lo <= end:
+        hi = min(lo + timedelta(days=days - 1), end)
+        out.append((lo, hi))
+        lo = hi + timedelta(days=1)
+    return out
+
+def _unix(d: date) -> int:
+    return int(datetime(d.year, d.month, d.day, tzinfo=timezone.utc).timestamp())
+
+def parse_points(payload: dict, coin: str) -> pd.DataFrame:
+    """prices + total_volumes -> (date, coin, ts, price, volume); o volume é o acumulado de 24h no instante."""
+    prices = parse_coingecko_series(payload, "prices").rename(columns={"value": "price"})
+    vols = parse_coingecko_series(payload, "total_volumes").rename(columns={"value": "volume"})
+    if prices.empty:
+        return pd.DataFrame(columns=list(DTYPE))
+    # Normalmente os timestamps coincidem; merge_asof tolera pequenos desvios entre as duas séries
+    df = pd.merge_asof(prices.sort_values("ts"), vols.sort_values("ts"), on="ts",
+                       direction="nearest", tolerance=pd.Timedelta(minutes=30))
+    df["coin"] = coin
+    df["date"] = df["ts"].dt.date
+    return df[list(DTYPE)]
+
+def build_request(cg: dict, coin: str, lo: date, hi: date) -> tuple[str, dict | None]:
+    params, headers, _ = api_auth(cg)
+    url = (f'{cg["base_url"]}/coins/{coin}/market_chart/range?vs_currency={cg["vs_currency"]}'
+           f'&from={_unix(lo)}&to={_unix(hi + timedelta(days=1)) - 1}')
+    return (with_query_params(url, params) if params else url), headers or None
+
+def fetch_window(cg: dict, coin: str, lo: date, hi: date) -> pd.DataFrame:
+    url, headers = build_request(cg, coin, lo, hi)
+    df = parse_points(json.loads(http_get(url, headers=headers)), coin)
+    return df[(df["date"] >= lo) & (df["date"] <= hi)]
+
+def main():
+    cfg = load_sources_yaml()
+    cg = cfg["coingecko"]
+    engine = get_engine()
+    coins = coin_list(cg)
+    _, _, use_demo_key = api_auth(cg)
+    today = datetime.now(timezone.utc).date()
+    floor = today - timedelta(days=DEMO_HISTORY_DAYS - 1) if use_demo_key else None
+
+    jobs = []
+    for c in coins:
+        # Overlap curto: o dia corrente chega parcial e é regravado na próxima execução
+        start = incremental_start(engine, SOURCE, c["id"], cg.get("points_overlap_days", 1))
+        if floor and start < floor:
+            logger.warning(f"CoinGecko demo key: {c['id']} limitado a {DEMO_HISTORY_DAYS} dias (desde {floor}).")
+            start = floor
+        jobs += [(c["id"], lo, hi) for lo, hi in windows(start, today)]
+    logger.info(f"CoinGecko: {len(coins)} moeda(s), {len(jobs)} janela(s) de até {WINDOW_DAYS} dias")
+
+    frames, failed = [], set()
+    for (coin, lo, hi), out in iter_concurrent(lambda job: fetch_window(cg, *job), jobs):
+        if isinstance(out, Exception):
+            logger.error(f"CoinGecko {coin} {lo} → {hi} falhou: {out}")
+            failed.add(coin)
+            continue
+        if not out.empty:
+            frames.append(out)
+    if not frames:
+        logger.info("CoinGecko: nenhum ponto novo.")
+        if failed:
+            raise RuntimeError(f"CoinGecko falhou para {len(failed)} moeda(s): {', '.join(sorted(failed))}")
+        return
+
+    df = pd.concat(frames, ignore_index=True).drop_duplicates(subset=["coin", "ts"], keep="last")
+    # O dia corrente volta a cada execução: só os pontos novos (ou com preço/volume revisado) são gravados
+    delta = dedup_bronze(df, SOURCE, keys=["coin", "ts"])
+    write_bronze(delta.df, SOURCE, keys=["coin", "ts"], symbol_col="coin", revision=delta.revision)
+    upsert(engine, TABLE, delta.df, key_cols=["date", "coin", "ts"], dtype=DTYPE)
+    # Moeda com alguma janela falha não avança o watermark: a próxima execução rebusca desde o anterior
+    set_watermarks(engine, SOURCE, df[~df["coin"].isin(failed)], symbol_col="coin")
+    delta.commit()
+    if failed:
+        logger.warning(f"CoinGecko: {len(failed)} moeda(s) com falha: {', '.join(sorted(failed))}")
+    logger.success(f"Inserido Bronze -> {TABLE}: {len(delta.df)} pontos de {df['coin'].nunique()} moeda(s).")
+
+if __name__ == "__main__":
+    main()
@@ -1,91 +1,108 @@
-import io
 import json
 import pandas as pd
 from loguru import logger
 from urllib.parse import quote
-from etl.common.io import load_sources_yaml, ensure_dirs, http_get, save_df, today_tag
-from etl.common.db import get_engine
-from etl.common.env import START_DATE
+from etl.common.io import load_sources_yaml, fetch_many, FetchRequest
+from etl.common.lake import write_bronze, dedup_bronze
+from etl.common.db import get_engine, upsert
+from etl.common.watermark import incremental_start, set_watermarks
 from sqlalchemy.types import Date, String, Float
+from requests import HTTPError
+from etl.bronze.parsers import parse_ecb_sdmx
 
-BRONZE_DIR = "data/bronze/ecb"
 TABLE = "md_bronze.ecb_fx_raw"
+SOURCE = "ecb"
 
-def build_url(base_url: str, series_key: str, fmt: str = "jsondata", start: str = "2025-01-01") -> str:
+def build_url(base_url: str, series_key: str, fmt: str = "jsondata", start: str = "2025-01-01",
+              end: str | None = None) -> str:
     # EX: https://data-api.ecb.europa.eu/service/data/EXR/D.USD.EUR.SP00.A?format=jsondata&startPeriod=2025-01-01
-    return f"{base_url}/{quote(series_key)}?format={fmt}&startPeriod={start}"
+    url = f"{base_url}/{quote(series_key)}?format={fmt}&startPeriod={start}"
+    return f"{url}&endPeriod={end}" if end else url
 
-def normalize_json(payload: dict, code: str) -> pd.DataFrame:
-    # Navegação no SDMX-json do ECB
-    data_section = payload.get("data", payload)
-    data_sets = data_section.get("dataSets", [])
-    if not data_sets:
-        raise ValueError("ECB payload sem dataSets")
+def normalize_json(payload: dict, code: str | None = None) -> pd.DataFrame:
+    # Navegação no SDMX-json do ECB (vetorizada; code=None devolve todas as séries do payload)
+    return parse_ecb_sdmx(payload, code)
 
-    try:
-        series = data_sets[0]["series"]["0:0:0:0:0"]
-    except (KeyError, IndexError) as exc:
-        raise KeyError("Estrutura inesperada em dataSets.series") from exc
-
-    obs = series.get("observations", {})
-    if not obs:
-        return pd.DataFrame(columns=["date", "code", "rate_vs_eur"])
-
-    rows = []
-    # Alguns payloads trazem índices numéricos, outros já trazem a data como chave.
-    numeric_keys = all(str(k).isdigit() for k in obs.keys())
-    if numeric_keys:
-        structure = data_section.get("structure", {})
-        dimensions = structure.get("dimensions", {})
-        observation = dimensions.get("observation", [])
-        if not observation:
-            raise KeyError("Estrutura sem dimensions.observation para mapear datas")
-        times = observation[0]["values"]
-        for k, v in obs.items():
-            idx = int(k)
-            date = times[idx]["id"]
-            rate = float(v[0])
-            rows.append({"date": date, "code": code, "rate_vs_eur": rate})
-    else:
-        for date, v in obs.items():
-            rate = float(v[0])
-            rows.append({"date": date, "code": code, "rate_vs_eur": rate})
-    return pd.DataFrame(rows)
+def add_eur(df: pd.DataFrame) -> pd.DataFrame:
+    # adiciona EUR/EUR = 1 em cada data observada
+    eur = df[["date"]].drop_duplicates().assign(code="EUR", rate_vs_eur=1.0)
+    return pd.concat([df, eur], ignore_index=True)
 
 def main():
     cfg = load_sources_yaml()
     ecb = cfg["ecb"]
-    ensure_dirs(BRONZE_DIR)
+    engine = get_engine()
 
-    frames = []
-    for sym in ecb["symbols"]:
-        code, key = sym["code"], sym["key"]
-        if code == "EUR":
-            # EUR/EUR = 1 (vamos criar sintético)
+    # EUR/EUR = 1 (vamos criar sintético)
+    symbols = [sym for sym in ecb["symbols"] if sym["code"] != "EUR"]
+    # Busca só a janela após o watermark de cada símbolo (com overlap para revisões)
+    starts = {sym["code"]: incremental_start(engine, SOURCE, sym["code"], ecb.get("overlap_days"))
+              for sym in symbols}
+    if ecb.get("batch") and symbols:
+        # Uma requisição para todas as moedas (D.USD+GBP+BRL.EUR.SP00.A): o SDMX devolve uma série por moeda
+        parts = symbols[0]["key"].split(".")
+        parts[1] = "+".join(sym["code"] for sym in symbols)
+        start = min(starts.values())
+        url = build_url(ecb["base_url"], ".".join(parts), ecb["format"], start.isoformat())
+        logger.info(f"ECB GET {len(symbols)} moedas: {url}")
+        reqs = [FetchRequest(url, key=(None, start))]
+    else:
+        reqs = []
+        for sym in symbols:
+            code, key = sym["code"], sym["key"]
+            url = build_url(ecb["base_url"], key, ecb["format"], starts[code].isoformat())
+            logger.info(f"ECB GET {code}: {url}")
+            reqs.append(FetchRequest(url, key=(code, starts[code])))
+
+    frames, errors, fetched = [], [], []
+    for req, res in zip(reqs, fetch_many(reqs)):
+        code, start = req.key
+        label = code or "todas as moedas"
+        if isinstance(res, HTTPError) and res.response is not None and res.response.status_code == 404:
+            # ECB responde 404 quando não há observações na janela pedida
+            logger.info(f"ECB sem observações novas para {label} desde {start}")
+            continue
+        if isinstance(res, Exception):
+            logger.error(f"ECB falhou para {label}: {res}")
+            errors.append(res)
             continue
-        url = build_url(ecb["base_url"], key, ecb["format"], START_DATE)
-        logger.info(f"ECB GET {code}: {url}")
-        raw = http_get(url)
-        payload = json.loads(raw.decode("utf-8"))
-        df = normalize_json(payload, code)
-        frames.append(df)
+        if not res.changed:
+            # 304 ou mesmo conteúdo já carregado: nem parse nem carga
+            logger.info(f"ECB {label}: payload inalterado, pulando.")
+            continue
+        fetched.append(res)
+        if not res.content.strip():
+            continue
+        payload = json.loads(res.content.decode("utf-8"))
+        frames.append(normalize_json(payload, code))
+    if errors and len(errors) == len(reqs):
+        raise errors[0]
 
-    df_all = pd.concat(frames, ignore_index=True).sort_values("date")
-    # adiciona EUR/EUR = 1
-    eur = df_all[["date"]].drop_duplicates().assign(code="EUR", rate_vs_eur=1.0)
-    df_all = pd.concat([df_all, eur], ignore_index=True)
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        logger.info("ECB: nenhuma observação nova; nada a carregar.")
+        for res in fetched:
+            res.commit()
+        return
+
+    df_all = add_eur(pd.concat(frames, ignore_index=True).sort_values("date"))
+
+    df_all["date"] = pd.to_datetime(df_all["date"]).dt.date
+    # Só observações novas ou revisadas seguem: o overlap re-enviado pelo ECB é descartado aqui
+    delta = dedup_bronze(df_all, SOURCE, keys=["date", "code"])
 
     # Persistir arquivo Bronze
-    tag = today_tag()
-    save_df(df_all, f"{BRONZE_DIR}/ecb_fx_{tag}.parquet")
+    write_bronze(delta.df, SOURCE, keys=["date", "code"], symbol_col="code", revision=delta.revision)
 
     # Carregar no MariaDB (tabela raw)
-    engine = get_engine()
-    df_all["date"] = pd.to_datetime(df_all["date"]).dt.date
     dtypes = {"date": Date(), "code": String(10), "rate_vs_eur": Float()}
-    df_all.to_sql(TABLE.split(".")[1], engine, schema=TABLE.split(".")[0],
-                  if_exists="append", index=False, dtype=dtypes)
-    logger.success(f"Inserido Bronze -> {TABLE}: {len(df_all)} linhas.")
+    # Upsert por (date, code): revisões substituem a linha anterior
+    upsert(engine, TABLE, delta.df, key_cols=["date", "code"], dtype=dtypes)
+    set_watermarks(engine, SOURCE, df_all[df_all["code"] != "EUR"], symbol_col="code")
+    delta.commit()
+    for res in fetched:
+        res.commit()
+    logger.success(f"Inserido Bronze -> {TABLE}: {len(delta.df)} linhas.")
 
 if __name__ == "__main__":
     main()
@@ -1,40 +1,57 @@
-import pandas as pd
+from datetime import date
 from loguru import logger
-from etl.common.io import load_sources_yaml, ensure_dirs, http_get, save_df, today_tag
-from etl.common.db import get_engine
-from etl.common.env import START_DATE
+from etl.common.io import load_sources_yaml, http_get_cached
+from etl.common.lake import write_bronze, dedup_bronze
+from etl.common.db import get_engine, upsert
+from etl.common.watermark import incremental_start, set_watermarks
 from sqlalchemy.types import Date, Float
+from requests import HTTPError
+from etl.bronze.parsers import parse_sgs
 
-BRONZE_DIR = "data/bronze/bacen"
 TABLE = "md_bronze.ptax_usdbrl_raw"
+SOURCE = "bacen_ptax"
 
-def build_url(serie: int) -> str:
+def build_url(serie: int, start: date, end: date | None = None) -> str:
     # https://api.bcb.gov.br/dados/serie/bcdata.sgs.10813/dados?dataInicial=01/01/2025&dataFinal=31/12/2099&formato=json
+    end_str = end.strftime("%d/%m/%Y") if end else "31/12/2099"
     return (f"https://api.bcb.gov.br/dados/serie/bcdata.sgs.{serie}/dados"
-            f"?dataInicial=01/01/2025&dataFinal=31/12/2099&formato=json")
+            f"?dataInicial={start.strftime('%d/%m/%Y')}&dataFinal={end_str}&formato=json")
 
 def main():
     cfg = load_sources_yaml()
-    serie = cfg["bacen_ptax"]["serie_usdbrl"]
-    ensure_dirs(BRONZE_DIR)
-    url = build_url(serie)
+    ptax_cfg = cfg["bacen_ptax"]
+    serie = ptax_cfg["serie_usdbrl"]
+    engine = get_engine()
+    start = incremental_start(engine, SOURCE, overlap_days=ptax_cfg.get("overlap_days"))
+    url = build_url(serie, start)
     logger.info(f"BACEN GET PTAX USD/BRL: {url}")
-    raw = http_get(url)
-    df = pd.read_json(io.BytesIO(raw))
-    df.rename(columns={"data":"date","valor":"usdbrl"}, inplace=True)
-    # Datas vêm em dd/mm/yyyy
-    df["date"] = pd.to_datetime(df["date"], dayfirst=True).dt.date
-    df = df[df["date"] >= pd.to_datetime(START_DATE).date()].sort_values("date")
+    try:
+        res = http_get_cached(url)
+    except HTTPError as exc:
+        # SGS responde 404 quando a janela não tem observações (ex.: fim de semana)
+        if exc.response is not None and exc.response.status_code == 404:
+            logger.info(f"BACEN sem observações novas desde {start}")
+            return
+        raise
+    if not res.changed:
+        logger.info("BACEN: payload inalterado desde a última carga, pulando.")
+        return
+    df = parse_sgs(res.content)
+    if df.empty:
+        logger.info(f"BACEN sem observações novas desde {start}")
+        res.commit()
+        return
+    df = df[df["date"] >= start].sort_values("date")
 
-    tag = today_tag()
-    save_df(df, f"{BRONZE_DIR}/ptax_{tag}.parquet")
+    delta = dedup_bronze(df, SOURCE, keys=["date"])
+    write_bronze(delta.df, SOURCE, keys=["date"], symbol="USDBRL", revision=delta.revision)
 
-    engine = get_engine()
-    df.to_sql(TABLE.split(".")[1], engine, schema=TABLE.split(".")[0],
-              if_exists="append", index=False,
-              dtype={"date": Date(), "usdbrl": Float()})
-    logger.success(f"Inserido Bronze -> {TABLE}: {len(df)} linhas.")
+    upsert(engine, TABLE, delta.df, key_cols=["date"],
+           dtype={"date": Date(), "usdbrl": Float()})
+    set_watermarks(engine, SOURCE, df)
+    delta.commit()
+    res.commit()
+    logger.success(f"Inserido Bronze -> {TABLE}: {len(delta.df)} linhas.")
 
 if __name__ == "__main__":
-    import io
     main()
@@ -1,47 +1,59 @@
-import io
 import json
 from urllib.parse import urlencode
 
 import pandas as pd
 from loguru import logger
-from etl.common.io import load_sources_yaml, ensure_dirs, http_get, save_df, today_tag
-from etl.common.db import get_engine
+from etl.common.io import load_sources_yaml, http_get_cached, run_concurrent, with_query_params, HttpResult
+from etl.common.lake import write_bronze, dedup_bronze
+from etl.common.db import get_engine, upsert
 from etl.common.env import START_DATE
+from etl.common.watermark import incremental_start, set_watermark
 from sqlalchemy.types import Date, String, Float
+from etl.bronze.parsers import parse_stooq_csv
 
-BRONZE_DIR = "data/bronze/stooq"
 TABLE = "md_bronze.stooq_index_raw"
+# Alpha Vantage "compact" devolve os últimos 100 pregões (~140 dias corridos)
+ALPHAVANTAGE_COMPACT_DAYS = 130
+SOURCE_LABELS = {"stooq": "Stooq", "alphavantage": "Alpha Vantage"}
 
 def _cutoff_date():
     return pd.to_datetime(START_DATE).date()
 
-def _fetch_stooq(it: dict) -> pd.DataFrame | None:
+def _fetch_stooq(it: dict, start=None) -> tuple[pd.DataFrame | None, HttpResult]:
     name, code, url = it["name"], it["code"], it["url"]
-    raw = http_get(url)
+    start = start or _cutoff_date()
+    # d1/d2 limitam o CSV do Stooq à janela faltante
+    url = with_query_params(url, {"d1": start.strftime("%Y%m%d"),
+                                  "d2": pd.Timestamp.utcnow().strftime("%Y%m%d")})
+    res = http_get_cached(url)
+    if not res.changed:
+        logger.info(f"Stooq {code}: payload inalterado, pulando.")
+        return None, res
+    raw = res.content
     if len(raw) < 32:
         logger.warning(f"Stooq retornou payload muito pequeno para {code}: {raw!r}")
-        return None
-    df = pd.read_csv(io.BytesIO(raw))
-    if df.shape[1] == 1 and ";" in df.columns[0]:
-        logger.debug(f"Detecção de CSV delimitado por ';' para {code}")
-        df = pd.read_csv(io.BytesIO(raw), sep=";")
+        return None, res
     # Stooq columns: Date,Open,High,Low,Close,Volume
-    df.columns = df.columns.str.replace("\ufeff", "").str.strip().str.lower()
+    df = parse_stooq_csv(raw)
     if "date" not in df.columns:
         preview = df.head(3).to_dict(orient="records")
         logger.warning(f"Stooq sem coluna 'Date' para {code}. Bytes recebidos: {len(raw)}. Preview: {preview}")
-        return None
+        return None, res
     if df.empty:
         logger.warning(f"Stooq retornou CSV vazio para {code}. Bytes recebidos: {len(raw)}")
-        return None
-    df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.date
-    df = df.dropna(subset=["date"])
-    df = df[df["date"] >= _cutoff_date()]
+        return None, res
+    df = df[df["date"] >= start]
     df["code"] = code
     df["name"] = name
-    return df[["date","code","name","open","high","low","close","volume"]]
+    return df[["date","code","name","open","high","low","close","volume"]], res
 
-def _fetch_alphavantage(symbol_cfg: dict, alpha_cfg: dict, api_key: str) -> pd.DataFrame | None:
+def _fetch_alphavantage(symbol_cfg: dict, alpha_cfg: dict, api_key: str,
+                        start=None) -> tuple[pd.DataFrame | None, HttpResult]:
+    start = start or _cutoff_date()
+    outputsize = symbol_cfg.get("outputsize")
+    if not outputsize:
+        recent = (pd.Timestamp.utcnow().date() - start).days <= ALPHAVANTAGE_COMPACT_DAYS
+        outputsize = "compact" if recent else "full"
     base_url = alpha_cfg.get("base_url", "https://www.alphavantage.co/query")
     function = symbol_cfg.get("function", alpha_cfg.get("function", "TIME_SERIES_DAILY_ADJUSTED"))
     symbol = symbol_cfg.get("symbol", symbol_cfg["code"])
@@ -49,29 +61,34 @@ def _fetch_alphavantage(symbol_cfg: dict, alpha_cfg: dict, api_key: str) -> pd.D
         "function": function,
         "symbol": symbol,
         "apikey": api_key,
-        "outputsize": symbol_cfg.get("outputsize", "full"),
+        "outputsize": outputsize,
     }
     url = f"{base_url}?{urlencode(params)}"
-    raw = http_get(url)
+    # apikey fica fora da chave do cache (etl.common.io.cache_key)
+    res = http_get_cached(url)
+    if not res.changed:
+        logger.info(f"Alpha Vantage {symbol_cfg['code']}: payload inalterado, pulando.")
+        return None, res
+    raw = res.content
     try:
         data = json.loads(raw)
     except json.JSONDecodeError:
         logger.error(f"Resposta inválida (JSON) do Alpha Vantage para {symbol_cfg['code']}: {raw[:120]!r}")
-        return None
+        return None, res
     if "Note" in data:
         logger.warning(f"Alpha Vantage rate limit atingido para {symbol_cfg['code']}: {data['Note']}")
-        return None
+        return None, res
     if "Error Message" in data:
         logger.error(f"Alpha Vantage erro para {symbol_cfg['code']}: {data['Error Message']}")
-        return None
+        return None, res
     series_key = next((k for k in data.keys() if "Time Series" in k), None)
     if not series_key:
         logger.warning(f"Alpha Vantage sem séries temporais para {symbol_cfg['code']}: chaves={list(data.keys())}")
-        return None
+        return None, res
     series = data[series_key]
     if not series:
         logger.warning(f"Alpha Vantage retornou série vazia para {symbol_cfg['code']}")
-        return None
+        return None, res
     df = pd.DataFrame.from_dict(series, orient="index")
     df.index.name = "date"
     df.reset_index(inplace=True)
@@ -94,27 +111,25 @@ def _fetch_alphavantage(symbol_cfg: dict, alpha_cfg: dict, api_key: str) -> pd.D
             df[col] = pd.NA
     df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.date
     df = df.dropna(subset=["date", "close"])
-    df = df[df["date"] >= _cutoff_date()]
+    df = df[df["date"] >= start]
     if df.empty:
-        logger.warning(f"Alpha Vantage sem dados após {START_DATE} para {symbol_cfg['code']}")
-        return None
+        logger.warning(f"Alpha Vantage sem dados após {start} para {symbol_cfg['code']}")
+        return None, res
     df["code"] = symbol_cfg["code"]
     df["name"] = symbol_cfg["name"]
-    return df[["date","code","name","open","high","low","close","volume"]]
+    return df[["date","code","name","open","high","low","close","volume"]], res
 
 def main():
     cfg = load_sources_yaml()
-    ensure_dirs(BRONZE_DIR)
+    engine = get_engine()
     frames = []
+    loaded = []  # (fonte, code, última data) para avançar watermarks após a carga
     stooq_cfg = cfg.get("stooq", {})
+    # Jobs (fonte, símbolo, fetch) executados em paralelo; limites por host ficam no cliente HTTP
+    jobs = []
     for it in stooq_cfg.get("symbols", []):
-        try:
-            df = _fetch_stooq(it)
-        except Exception as exc:  # defensive log for parsing issues
-            logger.exception(f"Falha ao processar {it.get('code')} do Stooq: {exc}")
-            df = None
-        if df is not None and not df.empty:
-            frames.append(df)
+        start = incremental_start(engine, "stooq", it["code"], stooq_cfg.get("overlap_days"))
+        jobs.append(("stooq", it, lambda it=it, start=start: _fetch_stooq(it, start)))
 
     alpha_cfg = cfg.get("alphavantage")
     if alpha_cfg:
@@ -123,31 +138,47 @@ def main():
             logger.error("alphavantage.api_key não definido (verifique ALPHAVANTAGE_API_KEY no .env)")
         else:
             for it in alpha_cfg.get("symbols", []):
-                try:
-                    df = _fetch_alphavantage(it, alpha_cfg, api_key)
-                except Exception as exc:
-                    logger.exception(f"Falha ao processar {it.get('code')} do Alpha Vantage: {exc}")
-                    df = None
-                if df is not None and not df.empty:
-                    frames.append(df)
+                start = incremental_start(engine, "alphavantage", it["code"], alpha_cfg.get("overlap_days"))
+                jobs.append(("alphavantage", it,
+                             lambda it=it, start=start: _fetch_alphavantage(it, alpha_cfg, api_key, start)))
+
+    fetched, unchanged = [], 0
+    for (source, it, _), out in zip(jobs, run_concurrent(lambda job: job[2](), jobs)):
+        if isinstance(out, Exception):  # defensive log for parsing issues
+            logger.opt(exception=out).error(f"Falha ao processar {it.get('code')} do {SOURCE_LABELS[source]}: {out}")
+            continue
+        df, res = out
+        if not res.changed:
+            unchanged += 1
+            continue
+        if df is not None and not df.empty:
+            frames.append(df)
+            fetched.append(res)
+            loaded.append((source, it["code"], df["date"].max()))
 
     if not frames:
+        if unchanged:
+            logger.info("Stooq/Alpha Vantage: nenhum payload novo; nada a carregar.")
+            return
         raise RuntimeError("Nenhum dado de índices foi coletado (Stooq/Alpha Vantage).")
 
     all_df = pd.concat(frames, ignore_index=True).sort_values(["code","date"])
     all_df = all_df.drop_duplicates(subset=["code","date"], keep="first")
 
-    tag = today_tag()
-    save_df(all_df, f"{BRONZE_DIR}/indices_{tag}.parquet")
+    delta = dedup_bronze(all_df, "stooq", keys=["date", "code"])
+    write_bronze(delta.df, "stooq", keys=["date", "code"], symbol_col="code", revision=delta.revision)
 
-    engine = get_engine()
     dtypes = {
         "date": Date(), "code": String(16), "name": String(64),
         "open": Float(), "high": Float(), "low": Float(), "close": Float(), "volume": Float()
     }
-    all_df.to_sql(TABLE.split(".")[1], engine, schema=TABLE.split(".")[0],
-                  if_exists="append", index=False, dtype=dtypes)
-    logger.success(f"Inserido Bronze -> {TABLE}: {len(all_df)} linhas.")
+    upsert(engine, TABLE, delta.df, key_cols=["date", "code"], dtype=dtypes)
+    for source, code, last_date in loaded:
+        set_watermark(engine, source, code, last_date)
+    delta.commit()
+    for res in fetched:
+        res.commit()
+    logger.success(f"Inserido Bronze -> {TABLE}: {len(delta.df)} linhas.")
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,17 @@
-import io, time, requests
+import io, json, requests
+import dataclasses
 import pandas as pd
 from loguru import logger
 from datetime import datetime, timezone
-from etl.common.io import load_sources_yaml, ensure_dirs, save_df, today_tag
-from etl.common.db import get_engine
-from etl.common.env import START_DATE
+from etl.common.io import load_sources_yaml, http_get, http_get_cached, run_concurrent, HttpResult
+from etl.common.lake import write_bronze, dedup_bronze
+from etl.bronze.parsers import parse_yahoo_chart
+from etl.common.db import get_engine, upsert
+from etl.common.watermark import incremental_start, set_watermarks
 from sqlalchemy.types import Date, String, Float
 
-BRONZE_DIR = "data/bronze/yahoo"
 TABLE = "md_bronze.stooq_index_raw"  # mesmo schema da bronze de índices
+SOURCE = "yahoo"
 
 UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
       "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
@@ -17,9 +20,10 @@ def unix_ts(dt_str: str) -> int:
     dt = datetime.strptime(dt_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
     return int(dt.timestamp())
 
-def build_urls(ticker_enc: str, start_yyyy_mm_dd: str):
+def build_urls(ticker_enc: str, start_yyyy_mm_dd: str, end_yyyy_mm_dd: str | None = None):
     p1 = unix_ts(start_yyyy_mm_dd)
-    p2 = int(time.time())
+    # Fim do dia UTC (e não "agora"): a URL fica estável no dia e o cache HTTP reaproveita re-execuções
+    p2 = unix_ts(end_yyyy_mm_dd or datetime.now(timezone.utc).strftime("%Y-%m-%d")) + 86400
     # PÁGINA (sem encode e SEM barra antes de ?p=)
     hist_url_page = "https://finance.yahoo.com/quote/^BVSP/history?p=^BVSP"
     # CSV (encodado)
@@ -27,98 +31,107 @@ def build_urls(ticker_enc: str, start_yyyy_mm_dd: str):
         f"https://query1.finance.yahoo.com/v7/finance/download/{ticker_enc}"
         f"?period1={p1}&period2={p2}&interval=1d&events=history&includeAdjustedClose=true"
     )
-    # CHART JSON (encodado)
+    # CHART JSON (encodado) — mesma janela period1/period2 do CSV em vez de range=max
     chart_url = (
         f"https://query1.finance.yahoo.com/v8/finance/chart/{ticker_enc}"
-        f"?interval=1d&range=max&includePrePost=false"
+        f"?interval=1d&period1={p1}&period2={p2}&includePrePost=false"
     )
     return hist_url_page, dl_url, chart_url
 
-def fetch_yahoo_csv_or_chart(ticker_enc: str, start_date: str) -> bytes:
+def fetch_yahoo_csv_or_chart(ticker_enc: str, start_date: str) -> HttpResult:
     hist_url, dl_url, chart_url = build_urls(ticker_enc, start_date)
-    with requests.Session() as s:
-        # 1) tentar abrir a página (se falhar, seguimos para chart json)
-        try:
-            r1 = s.get(hist_url, headers={"User-Agent": UA}, timeout=60)
-            r1.raise_for_status()
-        except requests.HTTPError as e:
-            logger.warning(f"Hist page falhou ({e}); vou tentar direto o Chart API.")
-
-        # 2) tentar CSV
-        hdrs = {"User-Agent": UA, "Accept": "text/csv,application/json", "Referer": hist_url}
-        r2 = s.get(dl_url, headers=hdrs, timeout=60)
-        if r2.status_code == 200 and r2.content and r2.content.startswith(b"Date,"):
-            return r2.content
-
-        # 3) fallback: Chart API (JSON) → CSV equivalente
-        r3 = s.get(chart_url, headers={"User-Agent": UA, "Referer": hist_url}, timeout=60)
-        r3.raise_for_status()
-        js = r3.json()
-        result = js["chart"]["result"][0]
-        ts = result.get("timestamp", [])
-        q = result["indicators"]["quote"][0]
-        # usa adjclose quando existir; senão close
-        adj = result.get("indicators", {}).get("adjclose", [{}])[0].get("adjclose", q.get("close"))
-
-        df = pd.DataFrame({
-            "Date": pd.to_datetime(ts, unit="s").date if ts else [],
-            "Open": q.get("open"),
-            "High": q.get("high"),
-            "Low" : q.get("low"),
-            "Close": adj,
-            "Adj Close": adj,
-            "Volume": q.get("volume"),
-        })
-        if df.empty:
-            raise RuntimeError("Chart API retornou vazio.")
-        df = df[df["Date"] >= pd.to_datetime(start_date).date()]
-
-        buf = io.StringIO()
-        df.to_csv(buf, index=False)
-        return buf.getvalue().encode("utf-8")
+    # Session compartilhada do etl.common.io: keep-alive, cookies da página e retry em 429/5xx
+    # 1) tentar abrir a página (se falhar, seguimos para chart json)
+    try:
+        http_get(hist_url, headers={"User-Agent": UA})
+    except requests.HTTPError as e:
+        logger.warning(f"Hist page falhou ({e}); vou tentar direto o Chart API.")
+
+    # 2) tentar CSV
+    hdrs = {"User-Agent": UA, "Accept": "text/csv,application/json", "Referer": hist_url}
+    try:
+        res = http_get_cached(dl_url, headers=hdrs)
+        if res.content and res.content.startswith(b"Date,"):
+            return res
+    except requests.HTTPError:
+        pass
+
+    # 3) fallback: Chart API (JSON) → CSV equivalente
+    res = http_get_cached(chart_url, headers={"User-Agent": UA, "Referer": hist_url})
+    if not res.changed:
+        return res
+    df = parse_yahoo_chart(json.loads(res.content))
+    if df.empty:
+        raise RuntimeError("Chart API retornou vazio.")
+    df = df[df["Date"] >= pd.to_datetime(start_date).date()]
+
+    buf = io.StringIO()
+    df.to_csv(buf, index=False)
+    return dataclasses.replace(res, content=buf.getvalue().encode("utf-8"))
 
 def main():
     cfg = load_sources_yaml()
-    ensure_dirs(BRONZE_DIR)
+    yahoo_cfg = cfg.get("yahoo", {})
     eng = get_engine()
 
-    frames = []
-    for it in cfg.get("yahoo", {}).get("indices", []):
+    def fetch(it: dict) -> tuple[pd.DataFrame | None, HttpResult]:
         name = it["name"]            # "IBOV"
         code = it["code"]            # "^bvsp"
         ticker_enc = it["ticker"]    # "%5EBVSP"
-        logger.info(f"Yahoo GET {name} ({code})")
-
-        raw = fetch_yahoo_csv_or_chart(ticker_enc, START_DATE)
-        df = pd.read_csv(io.BytesIO(raw))  # Date,Open,High,Low,Close,Adj Close,Volume
+        start = incremental_start(eng, SOURCE, code, yahoo_cfg.get("overlap_days"))
+        logger.info(f"Yahoo GET {name} ({code}) desde {start}")
+
+        res = fetch_yahoo_csv_or_chart(ticker_enc, start.isoformat())
+        if not res.changed:
+            logger.info(f"Yahoo {code}: payload inalterado, pulando.")
+            return None, res
+        df = pd.read_csv(io.BytesIO(res.content))  # Date,Open,High,Low,Close,Adj Close,Volume
         if df.empty:
             logger.warning(f"Yahoo vazio para {code}")
-            continue
+            return None, res
 
         df.rename(columns=str.lower, inplace=True)
         df["date"] = pd.to_datetime(df["date"]).dt.date
-        df = df[df["date"] >= pd.to_datetime(START_DATE).date()]
+        df = df[df["date"] >= start]
         df["code"] = code
         df["name"] = name
+        return df[["date","code","name","open","high","low","close","volume"]].copy(), res
 
-        out = df[["date","code","name","open","high","low","close","volume"]].copy()
-        frames.append(out)
-
+    indices = yahoo_cfg.get("indices", [])
+    frames, fetched, unchanged = [], [], 0
+    for it, out in zip(indices, run_concurrent(fetch, indices)):
+        if isinstance(out, Exception):
+            logger.opt(exception=out).error(f"Yahoo falhou para {it.get('code')}: {out}")
+            continue
+        df, res = out
+        if not res.changed:
+            unchanged += 1
+        elif df is not None:
+            frames.append(df)
+            fetched.append(res)
+
+    frames = [f for f in frames if not f.empty]
     if not frames:
-        logger.error("Nenhum índice Yahoo processado.")
+        if unchanged:
+            logger.info("Yahoo: nenhum payload novo; nada a carregar.")
+        else:
+            logger.error("Nenhum índice Yahoo processado.")
         return
 
     all_df = pd.concat(frames, ignore_index=True).sort_values(["code","date"])
-    tag = today_tag()
-    save_df(all_df, f"{BRONZE_DIR}/indices_{tag}.parquet")
+    delta = dedup_bronze(all_df, SOURCE, keys=["date", "code"])
+    write_bronze(delta.df, SOURCE, keys=["date", "code"], symbol_col="code", revision=delta.revision)
 
     dtypes = {
         "date": Date(), "code": String(16), "name": String(64),
         "open": Float(), "high": Float(), "low": Float(), "close": Float(), "volume": Float()
     }
-    all_df.to_sql(TABLE.split(".")[1], eng, schema=TABLE.split(".")[0],
-                  if_exists="append", index=False, dtype=dtypes)
-    logger.success(f"Bronze: inseridos {len(all_df)} registros em {TABLE}")
+    upsert(eng, TABLE, delta.df, key_cols=["date", "code"], dtype=dtypes)
+    set_watermarks(eng, SOURCE, all_df, symbol_col="code")
+    delta.commit()
+    for res in fetched:
+        res.commit()
+    logger.success(f"Bronze: inseridos {len(delta.df)} registros em {TABLE}")
 
 if __name__ == "__main__":
     main()
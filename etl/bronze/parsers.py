@@ -0,0 +1,115 @@
+# Parsers vetorizados dos payloads brutos das fontes (sem loops por linha em Python).
+import io
+import numpy as np
+import pandas as pd
+
+ECB_COLUMNS = ["date", "code", "rate_vs_eur"]
+YAHOO_COLUMNS = ["Date", "Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+def parse_coingecko_series(payload: dict, field: str = "prices") -> pd.DataFrame:
+    """[[ts_ms, valor], ...] -> DataFrame(ts datetime64[ms, UTC-naive], value float64) numa conversão só."""
+    points = payload.get(field) or []
+    if not points:
+        return pd.DataFrame({"ts": pd.Series(dtype="datetime64[ms]"), "value": pd.Series(dtype="float64")})
+    arr = np.asarray(points, dtype="float64")
+    ts = pd.to_datetime(arr[:, 0].astype("int64"), unit="ms")
+    return pd.DataFrame({"ts": ts, "value": arr[:, 1]})
+
+def _ecb_dimension(dims: list[dict], dim_id: str) -> int | None:
+    for pos, d in enumerate(dims):
+        if d.get("id") == dim_id:
+            return pos
+    return None
+
+def parse_ecb_sdmx(payload: dict, code: str | None = None) -> pd.DataFrame:
+    """SDMX-JSON do ECB -> DataFrame(date, code, rate_vs_eur) para *todas* as séries do dataSet.
+
+    `code` força o código quando a estrutura não traz a dimensão de moeda (payload de série única).
+    """
+    data_section = payload.get("data", payload)
+    data_sets = data_section.get("dataSets", [])
+    if not data_sets:
+        raise ValueError("ECB payload sem dataSets")
+    series_map = data_sets[0].get("series")
+    if series_map is None:
+        raise KeyError("Estrutura inesperada em dataSets.series")
+
+    dimensions = data_section.get("structure", {}).get("dimensions", {})
+    series_dims = dimensions.get("series", [])
+    obs_dims = dimensions.get("observation", [])
+    times = np.array([v["id"] for v in obs_dims[0]["values"]]) if obs_dims else None
+    cur_pos = _ecb_dimension(series_dims, "CURRENCY")
+
+    frames = []
+    for skey, series in series_map.items():
+        obs = series.get("observations", {})
+        if not obs:
+            continue
+        if code is not None or cur_pos is None:
+            sym = code
+        else:
+            sym = series_dims[cur_pos]["values"][int(skey.split(":")[cur_pos])]["id"]
+        keys = list(obs.keys())
+        # Primeiro elemento de cada observação é o valor (demais são atributos)
+        values = np.fromiter((v[0] if v and v[0] is not None else np.nan for v in obs.values()),
+                             dtype="float64", count=len(keys))
+        if all(k.isdigit() for k in keys):
+            if times is None:
+                raise KeyError("Estrutura sem dimensions.observation para mapear datas")
+            dates = times[np.fromiter(map(int, keys), dtype="int64", count=len(keys))]
+        else:
+            # Alguns payloads já trazem a data como chave
+            dates = np.asarray(keys)
+        frames.append(pd.DataFrame({"date": dates, "code": sym, "rate_vs_eur": values}))
+    if not frames:
+        return pd.DataFrame(columns=ECB_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+def parse_yahoo_chart(js: dict) -> pd.DataFrame:
+    """Chart API v8 -> DataFrame no layout do CSV do Yahoo (Date,Open,High,Low,Close,Adj Close,Volume)."""
+    result = js["chart"]["result"][0]
+    ts = result.get("timestamp") or []
+    if not ts:
+        return pd.DataFrame(columns=YAHOO_COLUMNS)
+    indicators = result.get("indicators", {})
+    q = indicators["quote"][0]
+    # usa adjclose quando existir; senão close
+    adj = (indicators.get("adjclose") or [{}])[0].get("adjclose", q.get("close"))
+
+    def col(values) -> np.ndarray:
+        # None -> NaN via float64; tamanho alinhado aos timestamps
+        return np.asarray(values if values is not None else [np.nan] * len(ts), dtype="float64")
+
+    adj_arr = col(adj)
+    return pd.DataFrame({
+        "Date": pd.to_datetime(np.asarray(ts, dtype="int64"), unit="s").date,
+        "Open": col(q.get("open")),
+        "High": col(q.get("high")),
+        "Low": col(q.get("low")),
+        "Close": adj_arr,
+        "Adj Close": adj_arr,
+        "Volume": col(q.get("volume")),
+    })
+
+def parse_sgs(content: bytes) -> pd.DataFrame:
+    """SGS/BACEN [{"data": "dd/mm/aaaa", "valor": "5.1"}, ...] -> DataFrame(date, usdbrl)."""
+    df = pd.read_json(io.BytesIO(content))
+    if df.empty:
+        return pd.DataFrame({"date": [], "usdbrl": []})
+    df = df.rename(columns={"data": "date", "valor": "usdbrl"})
+    # Datas vêm em dd/mm/yyyy
+    df["date"] = pd.to_datetime(df["date"], dayfirst=True).dt.date
+    df["usdbrl"] = pd.to_numeric(df["usdbrl"], errors="coerce")
+    return df[["date", "usdbrl"]]
+
+def parse_stooq_csv(content: bytes) -> pd.DataFrame:
+    """CSV do Stooq (Date,Open,High,Low,Close,Volume; às vezes com ';' e BOM) -> colunas minúsculas.
+    Sem coluna date o frame volta como veio (o chamador decide o que logar)."""
+    df = pd.read_csv(io.BytesIO(content))
+    if df.shape[1] == 1 and ";" in df.columns[0]:
+        df = pd.read_csv(io.BytesIO(content), sep=";")
+    df.columns = df.columns.str.replace("\ufeff", "").str.strip().str.lower()
+    if "date" in df.columns:
+        df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.date
+        df = df.dropna(subset=["date"])
+    return df
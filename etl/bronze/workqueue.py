@@ -0,0 +1,309 @@
+# etl/bronze/workqueue.py
+# Fila de ingestão por (fonte, símbolo, janela) em md_catalog.ingest_tasks, consumida por N workers com lease.
+#
+#   python -m etl.bronze.workqueue enqueue --source all --from 2015-01-01
+#   python -m etl.bronze.workqueue enqueue --source ecb,stooq --incremental
+#   python -m etl.bronze.workqueue work --batch 32 [--exit-when-empty]
+#   python -m etl.bronze.workqueue status
+import argparse, os, socket, time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+import pandas as pd
+from loguru import logger
+from sqlalchemy import text, bindparam
+from etl.common.io import load_sources_yaml, iter_concurrent
+from etl.common.db import get_engine
+from etl.common.backend import upsert_sql, is_embedded
+from etl.common.schema import TASKS_TABLE, ensure_schema
+from etl.common.watermark import incremental_start
+from etl.common.bronze_input import from_lake
+from etl.common import telemetry, lake
+from etl.bronze.backfill import SOURCES, Chunk, plan, fetch_chunk, load_source, rewind_downstream, source_symbols
+
+LEASE_S = 600
+POLL_S = 10
+BATCH_TASKS = 32
+MAX_ATTEMPTS = 5
+RETRY_BASE_S = 30
+RETRY_MAX_S = 3600
+
+@dataclass
+class Task:
+    id: int
+    chunk: Chunk
+    attempts: int
+    max_attempts: int
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _now() -> datetime:
+    # UTC calculado aqui e enviado como parâmetro: o relógio dos hosts (NTP) vale, não o fuso do servidor
+    return datetime.utcnow().replace(microsecond=0)
+
+def _in(sql: str, *names: str):
+    return text(sql).bindparams(*(bindparam(n, expanding=True) for n in names))
+
+# ---------------- enqueue ----------------
+def incremental_plan(engine, cfg: dict, sources: list[str], end: date, symbols: list[str] | None = None) -> list[Chunk]:
+    """Janela por símbolo do watermark (menos o overlap) até `end`, nos mesmos blocos do backfill."""
+    out = []
+    for name in sources:
+        spec = SOURCES[name]
+        for symbol, _ in source_symbols(cfg, name):
+            if symbols and symbol not in symbols:
+                continue
+            start = incremental_start(engine, name, symbol if spec.watermark_symbol else None)
+            out += plan(cfg, [name], start, end, [symbol])
+    return out
+
+def enqueue(engine, chunks: list[Chunk], requeue: bool = False, max_attempts: int = MAX_ATTEMPTS) -> int:
+    """Insere uma tarefa por bloco; a que já existe só é reaberta se FAILED (ou DONE, com requeue).
+    RUNNING e PENDING ficam como estão, então enfileirar de novo é idempotente."""
+    if not chunks:
+        return 0
+    reopen = "('PENDING', 'DONE', 'FAILED')" if requeue else "('PENDING', 'FAILED')"
+    when = f"CASE WHEN status IN {reopen} THEN {{new}} ELSE {{old}} END"
+    cols = ["source_name", "symbol", "window_start", "window_end", "status", "attempts", "max_attempts",
+            "available_at", "message"]
+    # status por último: no MariaDB o SET é avaliado da esquerda para a direita e os CASE precisam do status antigo
+    sql = text(upsert_sql(engine, TASKS_TABLE, cols, cols[:4], {
+        "attempts": when, "max_attempts": when, "available_at": when, "message": when, "status": when}))
+    now = _now()
+    with engine.begin() as conn:
+        conn.execute(sql, [{"source_name": c.source, "symbol": c.symbol, "window_start": c.start, "window_end": c.end,
+                            "status": "PENDING", "attempts": 0, "max_attempts": max_attempts,
+                            "available_at": now, "message": None} for c in chunks])
+    logger.info(f"Fila: {len(chunks)} tarefa(s) enfileirada(s) em {TASKS_TABLE}")
+    return len(chunks)
+
+# ---------------- lease ----------------
+def reap(engine) -> int:
+    """Leases vencidos que já gastaram todas as tentativas viram FAILED (os demais são reservados de novo)."""
+    sql = text(f"UPDATE {TASKS_TABLE} SET status = 'FAILED', message = :msg "
+               f"WHERE status = 'RUNNING' AND available_at <= :now AND attempts >= max_attempts")
+    with engine.begin() as conn:
+        n = conn.execute(sql, {"now": _now(), "msg": "lease expirado na última tentativa"}).rowcount
+    if n:
+        logger.warning(f"Fila: {n} tarefa(s) FAILED por lease expirado")
+    return n
+
+def claim(engine, n: int, owner: str, lease_s: int = LEASE_S, sources: list[str] | None = None) -> list[tuple]:
+    """Reserva até n tarefas disponíveis (PENDING vencidas ou RUNNING com lease expirado) para `owner`.
+    Devolve linhas (id, source_name, symbol, window_start, window_end, attempts, max_attempts)."""
+    now = _now()
+    where = "status IN ('PENDING', 'RUNNING') AND available_at <= :now AND attempts < max_attempts"
+    if sources:
+        where += " AND source_name IN :sources"
+    params = {"now": now, "n": n, "owner": owner, "lease": now + timedelta(seconds=lease_s),
+              **({"sources": sources} if sources else {})}
+    names = ("sources",) if sources else ()
+    cols = "id, source_name, symbol, window_start, window_end, attempts, max_attempts"
+    take = "status = 'RUNNING', lease_owner = :owner, attempts = attempts + 1, available_at = :lease"
+    with engine.begin() as conn:
+        if is_embedded(conn):
+            # DuckDB/SQLite: um único UPDATE ... RETURNING (o banco serializa os escritores)
+            return conn.execute(_in(f"UPDATE {TASKS_TABLE} SET {take} WHERE id IN (SELECT id FROM {TASKS_TABLE} "
+                                    f"WHERE {where} ORDER BY available_at, id LIMIT :n) RETURNING {cols}", *names),
+                                params).fetchall()
+        # Linhas já travadas por outro worker são puladas, não esperadas
+        ids = conn.execute(_in(f"SELECT id FROM {TASKS_TABLE} WHERE {where} ORDER BY available_at, id "
+                               f"LIMIT :n FOR UPDATE SKIP LOCKED", *names), params).scalars().all()
+        if not ids:
+            return []
+        conn.execute(_in(f"UPDATE {TASKS_TABLE} SET {take} WHERE id IN :ids", "ids"), {**params, "ids": ids})
+        return conn.execute(_in(f"SELECT {cols} FROM {TASKS_TABLE} WHERE id IN :ids", "ids"), {"ids": ids}).fetchall()
+
+def extend(engine, tasks: list[Task], owner: str, lease_s: int = LEASE_S):
+    """Renova o lease antes da carga (a busca pode ter consumido boa parte dele)."""
+    if tasks:
+        with engine.begin() as conn:
+            conn.execute(_in(f"UPDATE {TASKS_TABLE} SET available_at = :lease "
+                             f"WHERE id IN :ids AND lease_owner = :owner AND status = 'RUNNING'", "ids"),
+                         {"ids": [t.id for t in tasks], "owner": owner, "lease": _now() + timedelta(seconds=lease_s)})
+
+def complete(engine, done: list[tuple[Task, int]], owner: str, lake_id: str | None = None):
+    if not done:
+        return
+    sql = text(f"UPDATE {TASKS_TABLE} SET status = 'DONE', rows_loaded = :rows, message = NULL, lake_id = :lake "
+               f"WHERE id = :id AND lease_owner = :owner AND status = 'RUNNING'")
+    with engine.begin() as conn:
+        lost = sum(conn.execute(sql, {"id": t.id, "rows": rows, "owner": owner, "lake": lake_id}).rowcount == 0
+                   for t, rows in done)
+    if lost:
+        # Outro worker reservou depois do lease vencer; a carga é idempotente (upsert + índice de hashes)
+        logger.warning(f"Fila: {lost} tarefa(s) concluída(s) com lease perdido")
+
+def fail(engine, task: Task, owner: str, exc: BaseException):
+    retry_at = _now() + timedelta(seconds=min(RETRY_MAX_S, RETRY_BASE_S * 2 ** max(task.attempts - 1, 0)))
+    sql = text(f"UPDATE {TASKS_TABLE} SET "
+               f"status = CASE WHEN attempts >= max_attempts THEN 'FAILED' ELSE 'PENDING' END, "
+               f"available_at = :retry_at, rows_loaded = 0, message = :msg "
+               f"WHERE id = :id AND lease_owner = :owner AND status = 'RUNNING'")
+    with engine.begin() as conn:
+        conn.execute(sql, {"id": task.id, "owner": owner, "retry_at": retry_at,
+                           "msg": f"{type(exc).__name__}: {exc}"[:2000]})
+    last = task.attempts >= task.max_attempts
+    c = task.chunk
+    logger.error(f"Fila {c.source}:{c.symbol} {c.start} → {c.end} falhou (tentativa {task.attempts}/"
+                 f"{task.max_attempts}{'' if last else f', de novo após {retry_at:%H:%M:%S} UTC'}): {exc}")
+
+def check_lake(engine, lake_id: str):
+    """Com a silver lendo a bronze do lake, todos os workers precisam gravar no mesmo (disco compartilhado):
+    falha se alguma tarefa já foi concluída em outro lake."""
+    with engine.connect() as conn:
+        other = conn.execute(text(f"SELECT lease_owner, lake_id FROM {TASKS_TABLE} "
+                                  f"WHERE lake_id IS NOT NULL AND lake_id <> :lake LIMIT 1"), {"lake": lake_id}).first()
+    if other:
+        raise RuntimeError(f"Lake {lake.BRONZE_LAKE_DIR} ({lake_id}) não é o mesmo do worker {other.lease_owner} "
+                           f"({other.lake_id}): com SILVER_INPUT=lake ou BRONZE_DB_WRITE=0 os workers precisam "
+                           f"compartilhar o data/bronze (ex.: NFSv4)")
+
+def _waiting(engine, sources: list[str] | None) -> int:
+    """Tarefas que ainda podem rodar: PENDING (inclusive em backoff) e RUNNING com lease vencido."""
+    where = "(status = 'PENDING' OR (status = 'RUNNING' AND available_at <= :now)) AND attempts < max_attempts"
+    if sources:
+        where += " AND source_name IN :sources"
+    with engine.connect() as conn:
+        return conn.execute(_in(f"SELECT COUNT(*) FROM {TASKS_TABLE} WHERE {where}",
+                                *(("sources",) if sources else ())),
+                            {"now": _now(), **({"sources": sources} if sources else {})}).scalar()
+
+# ---------------- worker ----------------
+def _symbol_items(cfg: dict) -> dict[tuple[str, str], dict]:
+    return {(name, symbol): item for name in SOURCES for symbol, item in source_symbols(cfg, name)}
+
+def run_batch(engine, tasks: list[Task], owner: str, lease_s: int = LEASE_S, max_workers: int | None = None,
+              lake_id: str | None = None) -> tuple[int, int, dict[str, date]]:
+    """Busca e grava um lote reservado; devolve (concluídas, falhas, fonte -> menor data carregada)."""
+    fetched, failed = [], 0
+    for t, out in iter_concurrent(lambda t: fetch_chunk(t.chunk), tasks, max_workers):
+        if isinstance(out, Exception):
+            fail(engine, t, owner, out)
+            failed += 1
+        else:
+            fetched.append((t, out))
+    extend(engine, [t for t, _ in fetched], owner, lease_s)
+    done, loaded = 0, {}
+    for source in dict.fromkeys(t.chunk.source for t, _ in fetched):
+        items = [(t, df) for t, df in fetched if t.chunk.source == source]
+        try:
+            written = load_source(engine, source, [(t.chunk, df) for t, df in items])
+        except Exception as exc:
+            logger.opt(exception=exc).error(f"Fila: carga de {source} falhou")
+            for t, _ in items:
+                fail(engine, t, owner, exc)
+            failed += len(items)
+            continue
+        complete(engine, [(t, len(df)) for t, df in items], owner, lake_id)
+        done += len(items)
+        if written:
+            loaded[source] = min(t.chunk.start for t, _ in items)
+    return done, failed, loaded
+
+def work(engine, cfg: dict, sources: list[str] | None = None, batch: int = BATCH_TASKS, lease_s: int = LEASE_S,
+         max_workers: int | None = None, poll_s: float = POLL_S, exit_when_empty: bool = False,
+         rewind: bool = True) -> tuple[int, int]:
+    """Laço do worker: reserva, busca, grava, repete. Devolve (concluídas, falhas)."""
+    owner = worker_id()
+    items = _symbol_items(cfg)
+    # Só importa quando a silver lê a bronze do lake; lendo md_bronze.*, cada host pode ter o seu
+    shared = lake.lake_id() if from_lake() else None
+    total_done = total_failed = 0
+    logger.info(f"Worker {owner}: lotes de até {batch} tarefa(s), lease de {lease_s}s"
+                + (f", fontes {','.join(sources)}" if sources else ""))
+    while True:
+        if shared:
+            check_lake(engine, shared)
+        reap(engine)
+        rows = claim(engine, batch, owner, lease_s, sources)
+        if not rows:
+            if exit_when_empty and not _waiting(engine, sources):
+                break
+            time.sleep(poll_s)
+            continue
+        tasks = []
+        for tid, source, symbol, lo, hi, attempts, max_attempts in rows:
+            task = Task(tid, Chunk(source, symbol, pd.to_datetime(lo).date(), pd.to_datetime(hi).date(), {}),
+                        attempts, max_attempts)
+            if (source, symbol) not in items:
+                fail(engine, task, owner, KeyError(f"{source}:{symbol} não está no sources.yaml"))
+                total_failed += 1
+                continue
+            task.chunk.item = items[(source, symbol)]
+            tasks.append(task)
+        if not tasks:
+            continue
+        with telemetry.stage(f"workqueue:{','.join(sorted({t.chunk.source for t in tasks}))}"):
+            done, failed, loaded = run_batch(engine, tasks, owner, lease_s, max_workers, shared)
+        total_done += done
+        total_failed += failed
+        if rewind:
+            for source, start in loaded.items():
+                rewind_downstream(engine, [source], start)
+        logger.info(f"Worker {owner}: lote de {len(rows)} — {done} concluída(s), {failed} com falha "
+                    f"(total {total_done}/{total_failed})")
+    logger.success(f"Worker {owner}: fila vazia; {total_done} tarefa(s) concluída(s), {total_failed} falha(s).")
+    return total_done, total_failed
+
+def status(engine):
+    sql = text(f"""
+        SELECT source_name, status, COUNT(*) AS tasks, MIN(window_start) AS first, MAX(window_end) AS last,
+               SUM(rows_loaded) AS rows_loaded, COUNT(DISTINCT lease_owner) AS owners
+        FROM {TASKS_TABLE} GROUP BY source_name, status ORDER BY source_name, status""")
+    with engine.connect() as conn:
+        for r in conn.execute(sql):
+            print(f"{r.source_name:<12} {r.status:<8} {r.tasks:>7} tarefas  {r.first} → {r.last}  "
+                  f"{int(r.rows_loaded or 0):>12,} linhas  {r.owners:>3} worker(s)")
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Fila de ingestão por símbolo/janela para workers distribuídos")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    q = sub.add_parser("enqueue", help="cria as tarefas")
+    q.add_argument("--source", required=True, help=f"fontes separadas por vírgula ou 'all' ({', '.join(SOURCES)})")
+    q.add_argument("--from", dest="start", type=date.fromisoformat, help="primeira data (AAAA-MM-DD)")
+    q.add_argument("--to", dest="end", type=date.fromisoformat, default=date.today(), help="última data (default: hoje)")
+    q.add_argument("--incremental", action="store_true", help="janela de cada símbolo a partir do watermark")
+    q.add_argument("--symbols", help="só estes símbolos (ex.: USD,GBP ou ^spx)")
+    q.add_argument("--chunk-months", type=int, help="tamanho da janela em meses (default por fonte)")
+    q.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    q.add_argument("--requeue", action="store_true", help="reabre também as tarefas DONE")
+    w = sub.add_parser("work", help="consome a fila")
+    w.add_argument("--source", help="só tarefas destas fontes")
+    w.add_argument("--batch", type=int, default=BATCH_TASKS, help="tarefas reservadas por vez")
+    w.add_argument("--lease", type=int, default=LEASE_S, help="segundos de lease por lote")
+    w.add_argument("--workers", type=int, help="requisições simultâneas (default: HTTP_MAX_WORKERS)")
+    w.add_argument("--poll", type=float, default=POLL_S, help="espera (s) quando a fila está vazia")
+    w.add_argument("--exit-when-empty", action="store_true", help="sai quando não houver mais o que rodar")
+    w.add_argument("--no-rewind", action="store_true", help="não recua os checkpoints da silver/gold")
+    sub.add_parser("status", help="resumo da fila")
+    args = ap.parse_args(argv)
+
+    engine = get_engine()
+    ensure_schema(engine)
+    if args.cmd == "status":
+        status(engine)
+        return 0
+    sources = None
+    if args.source:
+        sources = list(SOURCES) if args.source == "all" else [s.strip() for s in args.source.split(",") if s.strip()]
+        unknown = [s for s in sources if s not in SOURCES]
+        if unknown:
+            ap.error(f"fonte(s) sem spec de janela: {', '.join(unknown)}")
+    cfg = load_sources_yaml()
+    if args.cmd == "enqueue":
+        symbols = [s.strip() for s in args.symbols.split(",")] if args.symbols else None
+        if args.incremental:
+            chunks = incremental_plan(engine, cfg, sources, args.end, symbols)
+        elif args.start:
+            chunks = plan(cfg, sources, args.start, args.end, symbols, args.chunk_months)
+        else:
+            ap.error("informe --from ou --incremental")
+        enqueue(engine, chunks, args.requeue, args.max_attempts)
+        return 0
+    _, failed = work(engine, cfg, sources, args.batch, args.lease, args.workers, args.poll,
+                     args.exit_when_empty, not args.no_rewind)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,181 @@
+# etl/common/backend.py
+# Diferenças de dialeto entre MariaDB, DuckDB e SQLite (pelo SQLALCHEMY_URL): upsert, carga e views sobre o lake.
+import glob, os
+import pandas as pd
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, Connection
+from loguru import logger
+from .env import DUCKDB_BRONZE_FROM_LAKE
+
+SCHEMAS = ("md_catalog", "md_bronze", "md_silver", "md_gold")
+SQLITE_TIMEOUT_S = 60
+
+def kind(con: Engine | Connection) -> str:
+    """"mariadb", "duckdb" ou "sqlite"."""
+    name = con.dialect.name
+    return "mariadb" if name in ("mysql", "mariadb") else name
+
+def is_embedded(con: Engine | Connection) -> bool:
+    return kind(con) in ("duckdb", "sqlite")
+
+def quote(con: Engine | Connection, name: str) -> str:
+    return f"`{name}`" if kind(con) == "mariadb" else f'"{name}"'
+
+# ---------------- engines ----------------
+def _sqlite_engine(path: str) -> Engine:
+    base = os.path.dirname(os.path.abspath(path))
+    os.makedirs(base, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": SQLITE_TIMEOUT_S, "check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def _attach(dbapi_conn, _):
+        # Um arquivo por schema, ao lado do principal: md.sqlite -> md.md_gold.sqlite, ...
+        for schema in SCHEMAS:
+            dbapi_conn.execute(f"ATTACH DATABASE '{os.path.join(base, f'{stem}.{schema}.sqlite')}' AS {schema}")
+            dbapi_conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+    return engine
+
+def _duckdb_engine(path: str) -> Engine:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    engine = create_engine(f"duckdb:///{path}")
+
+    @event.listens_for(engine, "connect")
+    def _schemas(dbapi_conn, _):
+        for schema in SCHEMAS:
+            dbapi_conn.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+    return engine
+
+def embedded_engine(url: str) -> Engine:
+    """duckdb:///arquivo ou sqlite:///arquivo; sem o duckdb-engine instalado cai para SQLite no mesmo diretório."""
+    scheme, _, path = url.partition(":///")
+    if scheme == "duckdb":
+        try:
+            import duckdb_engine  # noqa: F401
+        except ImportError:
+            fallback = os.path.splitext(path)[0] + ".sqlite"
+            logger.warning(f"duckdb/duckdb-engine não instalados; usando SQLite em {fallback}")
+            return _sqlite_engine(fallback)
+        return _duckdb_engine(path)
+    return _sqlite_engine(path)
+
+# ---------------- upsert ----------------
+def upsert_sql(con: Engine | Connection, table_full: str, cols: list[str], key_cols: list[str],
+               updates: dict[str, str] | None = None) -> str:
+    """INSERT de uma linha (:col) que atualiza a existente com a mesma chave.
+
+    updates: coluna -> expressão com {old} (valor gravado) e {new} (valor enviado); default = {new} para
+    todas as colunas fora da chave."""
+    q = lambda c: quote(con, c)
+    if updates is None:
+        updates = {c: "{new}" for c in cols if c not in key_cols}
+    head = (f"INSERT INTO {table_full} ({', '.join(map(q, cols))}) "
+            f"VALUES ({', '.join(f':{c}' for c in cols)})")
+    if kind(con) == "mariadb":
+        sets = [f"{q(c)} = " + e.format(old=q(c), new=f"VALUES({q(c)})") for c, e in updates.items()]
+        return head + (f" ON DUPLICATE KEY UPDATE {', '.join(sets)}" if sets else "")
+    sets = [f"{q(c)} = " + e.format(old=q(c), new=f"excluded.{q(c)}") for c, e in updates.items()]
+    conflict = f" ON CONFLICT ({', '.join(map(q, key_cols))}) DO "
+    return head + conflict + (f"UPDATE SET {', '.join(sets)}" if sets else "NOTHING")
+
+def _rows(df: pd.DataFrame) -> list[tuple]:
+    # sqlite3 não sabe ligar pd.Timestamp: datetimes viram texto ISO (o formato do adaptador padrão dele)
+    stamps = [c for c, dt in df.dtypes.items() if dt.kind == "M"]
+    if stamps:
+        df = df.assign(**{c: df[c].dt.strftime("%Y-%m-%d %H:%M:%S") for c in stamps})
+    return list(df.astype(object).where(pd.notna(df), None).itertuples(index=False, name=None))
+
+def _stage(conn: Connection, table_full: str, df: pd.DataFrame) -> str:
+    """Disponibiliza o frame como relação consultável na conexão e devolve o nome dela."""
+    name = f"_stage_{table_full.replace('.', '_')}"
+    if kind(conn) == "duckdb":
+        # O DuckDB lê o DataFrame em memória direto (sem INSERT linha a linha)
+        conn.connection.driver_connection.register(name, df)
+        return name
+    cols = ", ".join(quote(conn, c) for c in df.columns)
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS temp.{name}")
+    conn.exec_driver_sql(f"CREATE TEMP TABLE {name} AS SELECT {cols} FROM {table_full} WHERE 0")
+    conn.exec_driver_sql(f"INSERT INTO temp.{name} ({cols}) VALUES ({', '.join(['?'] * len(df.columns))})",
+                         _rows(df))
+    return f"temp.{name}"
+
+def _unstage(conn: Connection, name: str):
+    if kind(conn) == "duckdb":
+        conn.connection.driver_connection.unregister(name)
+    else:
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {name}")
+
+def append_frame(conn: Connection, table_full: str, df: pd.DataFrame):
+    cols = ", ".join(quote(conn, c) for c in df.columns)
+    stage = _stage(conn, table_full, df)
+    try:
+        conn.exec_driver_sql(f"INSERT INTO {table_full} ({cols}) SELECT {cols} FROM {stage}")
+    finally:
+        _unstage(conn, stage)
+
+def merge_frame(conn: Connection, table_full: str, df: pd.DataFrame, key_cols: list[str], unique: bool):
+    """Upsert do frame inteiro num INSERT ... SELECT ... ON CONFLICT (com PK) ou DELETE + INSERT (sem)."""
+    q = lambda c: quote(conn, c)
+    cols = ", ".join(map(q, df.columns))
+    stage = _stage(conn, table_full, df)
+    try:
+        if unique:
+            sets = ", ".join(f"{q(c)} = excluded.{q(c)}" for c in df.columns if c not in key_cols)
+            # WHERE true: o SQLite exige para não confundir ON CONFLICT com um JOIN ... ON
+            conn.exec_driver_sql(f"INSERT INTO {table_full} ({cols}) SELECT {cols} FROM {stage} WHERE true "
+                                 f"ON CONFLICT ({', '.join(map(q, key_cols))}) DO "
+                                 + (f"UPDATE SET {sets}" if sets else "NOTHING"))
+        else:
+            same = "IS NOT DISTINCT FROM" if kind(conn) == "duckdb" else "IS"
+            match = " AND ".join(f"t.{q(k)} {same} s.{q(k)}" for k in key_cols)
+            conn.exec_driver_sql(f"DELETE FROM {table_full} AS t WHERE EXISTS (SELECT 1 FROM {stage} s WHERE {match})")
+            conn.exec_driver_sql(f"INSERT INTO {table_full} ({cols}) SELECT {cols} FROM {stage}")
+    finally:
+        _unstage(conn, stage)
+
+# ---------------- bronze direto do lake (DuckDB) ----------------
+# Tabela bronze -> fontes do lake (etl.common.lake) que a alimentam
+LAKE_SOURCES = {
+    "md_bronze.ecb_fx_raw": ("ecb",),
+    "md_bronze.ptax_usdbrl_raw": ("bacen_ptax",),
+    "md_bronze.coingecko_btcusd_raw": ("coingecko",),
+    "md_bronze.coingecko_points_raw": ("coingecko_points",),
+    "md_bronze.stooq_index_raw": ("stooq", "yahoo"),
+}
+
+def bronze_from_lake(con: Engine | Connection) -> bool:
+    return DUCKDB_BRONZE_FROM_LAKE and kind(con) == "duckdb"
+
+def is_lake_view(con: Engine | Connection, table_full: str) -> bool:
+    return bronze_from_lake(con) and table_full in LAKE_SOURCES
+
+def lake_view_sql(table_full: str, columns: list[tuple[str, str]], key_cols: list[str]) -> str:
+    """View sobre os Parquet das fontes da tabela, com dedup pela chave (o arquivo mais novo vence: o nome
+    part-<timestamp>-... ordena por criação dentro da partição; entre fontes, a de nome maior)."""
+    from .lake import BRONZE_LAKE_DIR, source_dir
+    globs = [os.path.join(os.path.abspath(source_dir(s, BRONZE_LAKE_DIR)), "symbol=*", "**", "*.parquet")
+             for s in LAKE_SOURCES[table_full]]
+    globs = [g for g in globs if next(glob.iglob(g, recursive=True), None)]
+    names = [c for c, _ in columns]
+    if not globs:
+        # Lake ainda vazio: view tipada sem linhas (a primeira carga a recria sobre os arquivos)
+        typed = ", ".join(f"CAST(NULL AS {typ.replace(' NOT NULL', '')}) AS \"{c}\"" for c, typ in columns)
+        return f"CREATE OR REPLACE VIEW {table_full} AS SELECT {typed} WHERE false"
+    files = ", ".join(f"'{g}'" for g in globs)
+    keys = ", ".join(f'"{k}"' for k in key_cols)
+    cols = ", ".join(f'"{c}"' for c in names)
+    return (f"CREATE OR REPLACE VIEW {table_full} AS SELECT {cols} FROM ("
+            f"SELECT *, row_number() OVER (PARTITION BY {keys} ORDER BY filename DESC) AS _rn "
+            f"FROM read_parquet([{files}], union_by_name = true, filename = true, hive_partitioning = false)"
+            f") WHERE _rn = 1")
+
+def refresh_lake_view(con: Engine | Connection, table_full: str):
+    from .schema import TABLES
+    t = TABLES[table_full]
+    sql = lake_view_sql(table_full, list(t.columns), list(t.primary_key))
+    if isinstance(con, Engine):
+        with con.begin() as conn:
+            conn.exec_driver_sql(sql)
+    else:
+        con.exec_driver_sql(sql)
+    logger.debug(f"View {table_full} sobre o lake ({', '.join(LAKE_SOURCES[table_full])})")
@@ -0,0 +1,24 @@
+# etl/common/bronze_input.py
+# Leitura da bronze pela silver: lake Parquet (SILVER_INPUT=lake ou BRONZE_DB_WRITE=0) ou md_bronze.*.
+from datetime import date
+import pandas as pd
+from sqlalchemy.engine import Engine
+from .env import SILVER_INPUT, BRONZE_DB_WRITE
+from .db import read_sql
+from .backend import LAKE_SOURCES
+from . import lake
+
+def from_lake() -> bool:
+    return SILVER_INPUT == "lake" or not BRONZE_DB_WRITE
+
+def read_table(engine: Engine, table: str, columns: list[str], lo: date, hi: date) -> pd.DataFrame:
+    """Colunas de uma tabela bronze nas datas [lo, hi], do lake ou do banco conforme SILVER_INPUT."""
+    if from_lake():
+        return lake.read_bronze(LAKE_SOURCES[table], lo, hi, columns=columns)
+    return read_sql(f"SELECT {', '.join(columns)} FROM {table} WHERE date BETWEEN %(lo)s AND %(hi)s",
+                    engine, params={"lo": lo, "hi": hi})
+
+def date_counts(tables: list[str], start: date) -> pd.Series:
+    """Linhas por data (estimadas pelo manifest) das tabelas bronze no lake, para as faixas de etl.common.stream."""
+    sources = [s for t in tables for s in LAKE_SOURCES[t]]
+    return lake.count_bronze(sources, start)
@@ -0,0 +1,108 @@
+import importlib, time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from loguru import logger
+from . import telemetry
+
+@dataclass(frozen=True)
+class Node:
+    name: str
+    module: str
+    deps: tuple[str, ...] = ()
+    hard: tuple[str, ...] = ()      # deps sem as quais o nó não roda (ex.: PTAX para a silver de FX/cripto)
+
+@dataclass
+class RunResult:
+    status: dict[str, str] = field(default_factory=dict)   # SUCCESS | FAILED | SKIPPED
+    elapsed: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return all(s != "FAILED" for s in self.status.values())
+
+def _validate(nodes: list[Node]) -> dict[str, Node]:
+    by_name = {n.name: n for n in nodes}
+    for n in nodes:
+        missing = [d for d in n.deps if d not in by_name]
+        if missing:
+            raise ValueError(f"{n.name}: dependências desconhecidas {missing}")
+        if not set(n.hard) <= set(n.deps):
+            raise ValueError(f"{n.name}: dependências obrigatórias fora de deps {sorted(set(n.hard) - set(n.deps))}")
+    return by_name
+
+def downstream(nodes: list[Node], roots: set[str]) -> set[str]:
+    """roots + tudo que depende (transitivamente) deles."""
+    selected = set(roots)
+    changed = True
+    while changed:
+        changed = False
+        for n in nodes:
+            if n.name not in selected and selected.intersection(n.deps):
+                selected.add(n.name)
+                changed = True
+    return selected
+
+def select(nodes: list[Node], only: list[str] | None = None, start_from: list[str] | None = None) -> list[Node]:
+    by_name = _validate(nodes)
+    wanted = set(by_name)
+    if only:
+        unknown = set(only) - set(by_name)
+        if unknown:
+            raise ValueError(f"Etapas desconhecidas: {sorted(unknown)}")
+        wanted = set(only)
+    if start_from:
+        unknown = set(start_from) - set(by_name)
+        if unknown:
+            raise ValueError(f"Etapas desconhecidas: {sorted(unknown)}")
+        wanted &= downstream(nodes, set(start_from))
+    # Dependências fora da seleção são tratadas como já satisfeitas
+    return [Node(n.name, n.module, tuple(d for d in n.deps if d in wanted), tuple(d for d in n.hard if d in wanted))
+            for n in nodes if n.name in wanted]
+
+def _run_node(node: Node) -> float:
+    t0 = time.perf_counter()
+    # Uma linha por etapa no md_catalog.ingestion_log (tempo, linhas, bytes, latência HTTP, escrita, RSS)
+    with telemetry.stage(node.name):
+        importlib.import_module(node.module).main()
+    return time.perf_counter() - t0
+
+def run_dag(nodes: list[Node], max_workers: int = 4) -> RunResult:
+    """Executa os nós em paralelo (threads) respeitando dependências. Um nó é pulado quando uma dependência
+    `hard` não terminou com sucesso ou quando todas as dependências falharam/foram puladas."""
+    by_name = _validate(nodes)
+    result = RunResult()
+    pending = dict(by_name)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="etl") as pool:
+        while pending or running:
+            for name, node in list(pending.items()):
+                dep_status = [result.status.get(d) for d in node.deps]
+                if any(s is None for s in dep_status):
+                    continue
+                del pending[name]
+                broken = [d for d in node.hard if result.status[d] != "SUCCESS"]
+                if broken:
+                    logger.warning(f"[{name}] pulado: dependência obrigatória {', '.join(broken)} não concluiu")
+                    result.status[name] = "SKIPPED"
+                    continue
+                if node.deps and all(s != "SUCCESS" for s in dep_status):
+                    logger.warning(f"[{name}] pulado: nenhuma dependência concluiu com sucesso")
+                    result.status[name] = "SKIPPED"
+                    continue
+                logger.info(f">>> [{name}] {node.module}")
+                running[pool.submit(_run_node, node)] = name
+            if not running:
+                if pending and all(any(result.status.get(d) is None for d in n.deps) for n in pending.values()):
+                    raise ValueError(f"Ciclo de dependências entre: {sorted(pending)}")
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    result.elapsed[name] = fut.result()
+                    result.status[name] = "SUCCESS"
+                    logger.success(f"<<< [{name}] ok em {result.elapsed[name]:.1f}s")
+                except Exception as exc:
+                    result.status[name] = "FAILED"
+                    logger.opt(exception=exc).error(f"<<< [{name}] falhou: {exc}")
+    return result
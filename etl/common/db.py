@@ -1,15 +1,263 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+import os, re, tempfile, threading, time
+from collections import defaultdict
+from collections.abc import Iterator
+from functools import lru_cache
+import pandas as pd
+from sqlalchemy import create_engine, text, inspect, bindparam
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy.exc import DBAPIError
 from loguru import logger
-from .env import SQLALCHEMY_URL
+from .env import SQLALCHEMY_URL, DB_LOCAL_INFILE, BRONZE_DB_WRITE
+from . import telemetry, backend
 
+@lru_cache(maxsize=1)
 def get_engine() -> Engine:
+    # Um engine (e um pool) por processo: o runner in-process compartilha entre todas as etapas
     if not SQLALCHEMY_URL:
         raise RuntimeError("SQLALCHEMY_URL não definido no .env")
-    engine = create_engine(SQLALCHEMY_URL, pool_pre_ping=True, pool_recycle=1800)
+    if SQLALCHEMY_URL.startswith(("duckdb:", "sqlite:")):
+        return backend.embedded_engine(SQLALCHEMY_URL)
+    connect_args = {}
+    if SQLALCHEMY_URL.startswith("mysql+pymysql") and DB_LOCAL_INFILE:
+        connect_args["local_infile"] = True
+    engine = create_engine(SQLALCHEMY_URL, pool_pre_ping=True, pool_recycle=1800,
+                           connect_args=connect_args)
     return engine
 
 def exec_sql(engine: Engine, sql: str, params: dict | None = None):
     with engine.begin() as conn:
         conn.execute(text(sql), params or {})
         logger.debug("SQL executado.")
+
+def split_table(table_full: str) -> tuple[str, str]:
+    schema, table = table_full.split(".")
+    return schema, table
+
+_PYFORMAT = re.compile(r"%\((\w+)\)s")
+
+def bind(sql: str, params: dict | None):
+    """SQL com %(nome)s (estilo PyMySQL) -> text() com :nome, que o SQLAlchemy traduz para o driver de cada
+    backend; valores list/tuple viram IN expandido (`col IN %(keys)s`)."""
+    if not params:
+        return sql
+    clause = text(_PYFORMAT.sub(r":\1", sql))
+    expanding = [bindparam(k, expanding=True) for k, v in params.items() if isinstance(v, (list, tuple))]
+    return clause.bindparams(*expanding) if expanding else clause
+
+def read_sql(sql: str, con: Engine | Connection | None = None, params: dict | None = None, **kwargs) -> pd.DataFrame:
+    # pd.read_sql com contagem de linhas lidas para a telemetria da etapa
+    df = pd.read_sql(bind(sql, params), con if con is not None else get_engine(), params=params, **kwargs)
+    telemetry.record_rows_in(len(df))
+    return df
+
+def read_sql_chunks(sql: str, con: Engine | None = None, params: dict | None = None,
+                    chunksize: int | None = None, **kwargs) -> Iterator[pd.DataFrame]:
+    """read_sql em lotes de `chunksize` linhas com cursor do lado do servidor (stream_results): nem o driver
+    nem o pandas materializam o resultado inteiro. chunksize=None lê tudo de uma vez."""
+    if not chunksize:
+        yield read_sql(sql, con, params, **kwargs)
+        return
+    engine = con if con is not None else get_engine()
+    # Conexão própria: o cursor fica aberto enquanto o consumidor grava os lotes por outras conexões do pool
+    with engine.connect().execution_options(stream_results=True) as conn:
+        for df in pd.read_sql(bind(sql, params), conn, params=params, chunksize=chunksize, **kwargs):
+            telemetry.record_rows_in(len(df))
+            yield df
+
+def table_exists(engine: Engine, table_full: str) -> bool:
+    schema, table = split_table(table_full)
+    return inspect(engine).has_table(table, schema=schema)
+
+def ensure_table(con: Engine | Connection, table_full: str, df: pd.DataFrame, dtype: dict | None = None):
+    """Garante que table_full existe: tabelas gerenciadas vêm do DDL de etl.common.schema (com PK/índices);
+    as demais (ex.: benchmarks) são criadas a partir do frame como antes."""
+    schema, table = split_table(table_full)
+    if inspect(con).has_table(table, schema=schema):
+        return
+    from .schema import TABLES, ensure_schema
+    if table_full in TABLES:
+        ensure_schema(con if isinstance(con, Engine) else con.engine)
+        if inspect(con).has_table(table, schema=schema):
+            return
+    df.head(0).to_sql(table, con, schema=schema, index=False, dtype=dtype)
+
+UPSERT_BATCH_ROWS = 200_000
+# Serializa upserts concorrentes na mesma tabela (ex.: Stooq e Yahoo em paralelo no runner)
+_TABLE_LOCKS: dict[str, threading.Lock] = defaultdict(threading.Lock)
+# Limiares da escolha automática de estratégia do bulk_write
+BULK_PLAIN_MAX_ROWS = 1_000
+BULK_LOAD_DATA_MIN_ROWS = 100_000
+BULK_EXECUTEMANY_BATCH = 50_000
+
+def _quote(col: str) -> str:
+    return f"`{col}`"
+
+def _df_rows(df: pd.DataFrame) -> list[tuple]:
+    # NaN/NaT -> NULL; astype(object) devolve tipos Python que o PyMySQL sabe escapar
+    return list(df.astype(object).where(pd.notna(df), None).itertuples(index=False, name=None))
+
+def _write_executemany(conn: Connection, table_full: str, df: pd.DataFrame):
+    # PyMySQL reescreve executemany de INSERT ... VALUES em INSERTs multi-linha (até max_allowed_packet)
+    cols = ", ".join(_quote(c) for c in df.columns)
+    sql = f"INSERT INTO {table_full} ({cols}) VALUES ({', '.join(['%s'] * len(df.columns))})"
+    for start in range(0, len(df), BULK_EXECUTEMANY_BATCH):
+        conn.exec_driver_sql(sql, _df_rows(df.iloc[start:start + BULK_EXECUTEMANY_BATCH]))
+
+def _write_load_data(conn: Connection, table_full: str, df: pd.DataFrame):
+    cols = ", ".join(_quote(c) for c in df.columns)
+    fd, path = tempfile.mkstemp(prefix="md_bulk_", suffix=".csv")
+    os.close(fd)
+    try:
+        # \N = NULL no formato do LOAD DATA; datas saem em ISO
+        df.to_csv(path, index=False, header=False, na_rep="\\N", date_format="%Y-%m-%d %H:%M:%S",
+                  lineterminator="\n")
+        conn.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {table_full} CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' ({cols})")
+    finally:
+        os.remove(path)
+
+def _write_plain(conn: Connection, table_full: str, df: pd.DataFrame):
+    # Fallback genérico: INSERT parametrizado do SQLAlchemy, sem depender do driver
+    cols = list(df.columns)
+    sql = text(f"INSERT INTO {table_full} ({', '.join(_quote(c) for c in cols)}) "
+               f"VALUES ({', '.join(f':p{i}' for i in range(len(cols)))})")
+    conn.execute(sql, [{f"p{i}": v for i, v in enumerate(row)} for row in _df_rows(df)])
+
+def _write_embedded(conn: Connection, table_full: str, df: pd.DataFrame):
+    # DuckDB/SQLite: INSERT ... SELECT a partir do frame registrado (ver etl.common.backend)
+    backend.append_frame(conn, table_full, df)
+
+def _choose_strategy(rows: int) -> str:
+    if rows <= BULK_PLAIN_MAX_ROWS:
+        return "plain"
+    if rows >= BULK_LOAD_DATA_MIN_ROWS and DB_LOCAL_INFILE:
+        return "load_data"
+    return "executemany"
+
+BULK_STRATEGIES = {"plain": _write_plain, "executemany": _write_executemany, "load_data": _write_load_data,
+                   "embedded": _write_embedded}
+
+def bulk_write(df: pd.DataFrame, table_full: str, dtype: dict | None = None,
+               con: Engine | Connection | None = None, strategy: str = "auto") -> int:
+    """Append em massa em table_full (cria a tabela com dtype se não existir).
+
+    strategy: "auto" (pelo tamanho do frame), "plain" (INSERT parametrizado do SQLAlchemy),
+    "executemany" (INSERT multi-linha em lotes) ou "load_data" (LOAD DATA LOCAL INFILE de um CSV temporário).
+    """
+    if df.empty:
+        return 0
+    con = con if con is not None else get_engine()
+    if isinstance(con, Engine):
+        with con.begin() as conn:
+            return bulk_write(df, table_full, dtype, conn, strategy)
+
+    ensure_table(con, table_full, df, dtype)
+    t0 = time.perf_counter()
+    n = _bulk_load(con, table_full, df, strategy)
+    telemetry.record_db_write(time.perf_counter() - t0, n)
+    return n
+
+def _bulk_load(con: Connection, table_full: str, df: pd.DataFrame, strategy: str = "auto") -> int:
+    if strategy == "auto":
+        strategy = "embedded" if backend.is_embedded(con) else _choose_strategy(len(df))
+    if strategy not in BULK_STRATEGIES:
+        raise ValueError(f"Estratégia de bulk_write desconhecida: {strategy}")
+    if strategy == "load_data" and not DB_LOCAL_INFILE:
+        # Conexão aberta sem local_infile (DB_LOCAL_INFILE=0): o LOAD DATA LOCAL seria recusado pelo cliente
+        strategy = "executemany"
+
+    t0 = time.perf_counter()
+    try:
+        BULK_STRATEGIES[strategy](con, table_full, df)
+    except DBAPIError as exc:
+        if strategy != "load_data":
+            raise
+        # Servidor sem local_infile: cai para o INSERT multi-linha
+        logger.warning(f"LOAD DATA indisponível ({exc.orig}); usando executemany em {table_full}.")
+        strategy = "executemany"
+        _write_executemany(con, table_full, df)
+    dt = max(time.perf_counter() - t0, 1e-9)
+    logger.info(f"bulk_write {table_full} [{strategy}]: {len(df)} linhas em {dt:.2f}s ({len(df) / dt:,.0f} linhas/s)")
+    return len(df)
+
+def has_unique_key(engine: Engine, table_full: str, key_cols: list[str]) -> bool:
+    schema, table = split_table(table_full)
+    insp = inspect(engine)
+    keys = set(key_cols)
+    pk = insp.get_pk_constraint(table, schema=schema).get("constrained_columns") or []
+    if pk and set(pk) <= keys:
+        return True
+    for ix in insp.get_indexes(table, schema=schema):
+        if ix.get("unique") and set(ix["column_names"]) <= keys:
+            return True
+    return False
+
+def _upsert_embedded(engine: Engine, table_full: str, df: pd.DataFrame, key_cols: list[str]) -> int:
+    from .schema import TABLES
+    df = df.drop_duplicates(subset=key_cols, keep="last")
+    unique = table_full in TABLES or has_unique_key(engine, table_full, key_cols)
+    t0 = time.perf_counter()
+    with _TABLE_LOCKS[table_full], engine.begin() as conn:
+        backend.merge_frame(conn, table_full, df, key_cols, unique)
+    telemetry.record_db_write(time.perf_counter() - t0, len(df))
+    logger.debug(f"Upsert {table_full} ({backend.kind(engine)}): {len(df)} linhas.")
+    return len(df)
+
+def upsert(engine: Engine, table_full: str, df: pd.DataFrame, key_cols: list[str],
+           dtype: dict | None = None, strategy: str = "auto",
+           batch_rows: int = UPSERT_BATCH_ROWS) -> int:
+    """Upsert set-based: carrega lotes numa tabela temporária e aplica um único
+    INSERT ... ON DUPLICATE KEY UPDATE (se houver chave única) ou DELETE-JOIN + INSERT-SELECT
+    por lote, tudo na mesma transação."""
+    if df.empty:
+        return 0
+    if backend.is_lake_view(engine, table_full):
+        # DuckDB com a bronze no lake: os dados já estão no Parquet (write_bronze); só a view é renovada
+        backend.refresh_lake_view(engine, table_full)
+        return len(df)
+    if not BRONZE_DB_WRITE and table_full.startswith("md_bronze."):
+        # Bronze só no lake (BRONZE_DB_WRITE=0): a silver lê os Parquet (etl.common.bronze_input)
+        return len(df)
+    schema, table = split_table(table_full)
+    ensure_table(engine, table_full, df, dtype)
+    if backend.is_embedded(engine):
+        return _upsert_embedded(engine, table_full, df, key_cols)
+    if strategy == "auto":
+        strategy = "on_duplicate" if has_unique_key(engine, table_full, key_cols) else "delete_join"
+
+    cols = list(df.columns)
+    col_list = ", ".join(_quote(c) for c in cols)
+    stage = f"{schema}._stage_{table}"
+    join_on = " AND ".join(f"t.{_quote(k)} <=> s.{_quote(k)}" for k in key_cols)
+    updates = ", ".join(f"{_quote(c)} = VALUES({_quote(c)})" for c in cols if c not in key_cols)
+    if strategy == "on_duplicate":
+        apply_sql = [f"INSERT INTO {table_full} ({col_list}) SELECT {col_list} FROM {stage}"
+                     + (f" ON DUPLICATE KEY UPDATE {updates}" if updates else "")]
+    elif strategy == "delete_join":
+        apply_sql = [f"DELETE t FROM {table_full} t JOIN {stage} s ON {join_on}",
+                     f"INSERT INTO {table_full} ({col_list}) SELECT {col_list} FROM {stage}"]
+    else:
+        raise ValueError(f"Estratégia de upsert desconhecida: {strategy}")
+
+    # Dedup no próprio lote: a última ocorrência da chave vence
+    df = df.drop_duplicates(subset=key_cols, keep="last")
+    t0 = time.perf_counter()
+    with _TABLE_LOCKS[table_full], engine.begin() as conn:
+        conn.exec_driver_sql(f"DROP TEMPORARY TABLE IF EXISTS {stage}")
+        # CREATE/DROP TEMPORARY não fazem commit implícito (ALTER/TRUNCATE fariam)
+        conn.exec_driver_sql(
+            f"CREATE TEMPORARY TABLE {stage} "
+            f"(INDEX ix_stage_keys ({', '.join(_quote(k) for k in key_cols)})) "
+            f"SELECT {col_list} FROM {table_full} LIMIT 0")
+        for start in range(0, len(df), batch_rows):
+            batch = df.iloc[start:start + batch_rows]
+            if start:
+                conn.exec_driver_sql(f"DELETE FROM {stage}")
+            _bulk_load(conn, stage, batch)
+            for sql in apply_sql:
+                conn.exec_driver_sql(sql)
+        conn.exec_driver_sql(f"DROP TEMPORARY TABLE IF EXISTS {stage}")
+    telemetry.record_db_write(time.perf_counter() - t0, len(df))
+    logger.debug(f"Upsert {table_full} ({strategy}): {len(df)} linhas.")
+    return len(df)
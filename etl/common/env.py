@@ -9,3 +9,47 @@ TZ = os.getenv("TZ", "America/Sao_Paulo")
 COINGECKO_API_KEY = os.getenv("COINGECKO_API_KEY")
 COINGECKO_API_KEY_HEADER = os.getenv("COINGECKO_API_KEY_HEADER", "")
 COINGECKO_API_KEY_QUERY_PARAM = os.getenv("COINGECKO_API_KEY_QUERY_PARAM", "")
+# Janela de sobreposição (dias) re-buscada a partir do watermark para capturar revisões
+WATERMARK_OVERLAP_DAYS = int(os.getenv("WATERMARK_OVERLAP_DAYS", "5"))
+# Checkpoint de etapa com várias séries de entrada fica na última data da mais atrasada (etl.common.watermark);
+# uma série parada há mais que isso em relação à mais adiantada deixa de segurá-lo
+WATERMARK_MAX_LAG_DAYS = int(os.getenv("WATERMARK_MAX_LAG_DAYS", "30"))
+# FULL_REFRESH=1 ignora watermarks e rebusca desde START_DATE
+FULL_REFRESH = os.getenv("FULL_REFRESH", "0").lower() in ("1", "true", "yes")
+# LOAD DATA LOCAL INFILE (opt-in): precisa de local_infile=1 no cliente e no servidor (docker/mariadb/my.cnf).
+# Desligado por padrão: com local_infile no cliente, um servidor comprometido pode ler arquivos da máquina do ETL
+DB_LOCAL_INFILE = os.getenv("DB_LOCAL_INFILE", "0").lower() in ("1", "true", "yes")
+# Backend DuckDB (SQLALCHEMY_URL=duckdb:///...): tabelas md_bronze.* viram views sobre o lake Parquet (etl.common.backend)
+DUCKDB_BRONZE_FROM_LAKE = os.getenv("DUCKDB_BRONZE_FROM_LAKE", "0").lower() in ("1", "true", "yes")
+# Entrada da silver (etl.common.bronze_input): "db" lê as tabelas md_bronze.* com read_sql; "lake" lê os Parquet
+# do lake direto com pyarrow.dataset (projeção + filtro de data/símbolo no leitor, sem passar pelo banco)
+SILVER_INPUT = os.getenv("SILVER_INPUT", "db").lower()
+# BRONZE_DB_WRITE=0: ingestores gravam só o lake (a cópia md_bronze.* no banco deixa de existir; silver lê do lake)
+BRONZE_DB_WRITE = os.getenv("BRONZE_DB_WRITE", "1").lower() in ("1", "true", "yes")
+# Destino do etl.common.sync (cópia silver/gold de um backend embarcado para o MariaDB do Power BI)
+SYNC_SQLALCHEMY_URL = os.getenv("SYNC_SQLALCHEMY_URL")
+# Particiona as tabelas diárias (bronze, silver e fatos gold) por ano (RANGE YEAR(date)) nas migrações de etl.common.schema
+DB_PARTITION_BY_YEAR = os.getenv("DB_PARTITION_BY_YEAR", "0").lower() in ("1", "true", "yes")
+# Orçamento de memória (MB) das etapas silver/gold: define o tamanho das partições lidas por vez (etl.common.stream);
+# 0 = sem limite (a janela inteira numa partição só)
+ETL_MEMORY_BUDGET_MB = float(os.getenv("ETL_MEMORY_BUDGET_MB", "512"))
+# Cliente HTTP compartilhado (etl.common.io)
+HTTP_MAX_WORKERS = int(os.getenv("HTTP_MAX_WORKERS", "8"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "5"))
+HTTP_HOST_CONCURRENCY = int(os.getenv("HTTP_HOST_CONCURRENCY", "4"))
+HTTP_HOST_RATE = float(os.getenv("HTTP_HOST_RATE", "5"))  # requisições/s por host
+# Cache HTTP condicional (ETag/Last-Modified) em data/http_cache
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", "data/http_cache")
+HTTP_CACHE_TTL_DAYS = float(os.getenv("HTTP_CACHE_TTL_DAYS", "30"))
+HTTP_CACHE_MAX_MB = float(os.getenv("HTTP_CACHE_MAX_MB", "512"))
+# Benchmarks offline: todo GET vai para <HTTP_REPLAY_URL>/<host>/<path>?<query> (benchmarks/replay_server.py)
+HTTP_REPLAY_URL = os.getenv("HTTP_REPLAY_URL", "")
+# API local de leitura da gold (etl.gold.serve): séries mantidas em memória (LRU) e arquivo que build_gold
+# regrava ao terminar; quando ele muda, o cache é descartado
+GOLD_SERVE_CACHE_SERIES = int(os.getenv("GOLD_SERVE_CACHE_SERIES", "512"))
+GOLD_VERSION_FILE = os.getenv("GOLD_VERSION_FILE", "data/gold/_version.json")
+# Snapshots Parquet versionados da gold (etl.gold.snapshot), publicados pelo build_gold a cada execução
+GOLD_SNAPSHOT = os.getenv("GOLD_SNAPSHOT", "1").lower() in ("1", "true", "yes")
+GOLD_SNAPSHOT_DIR = os.getenv("GOLD_SNAPSHOT_DIR", "data/gold")
+# Export da telemetria por execução (run_<id>.json + etl.prom para o textfile collector do Prometheus)
+METRICS_DIR = os.getenv("METRICS_DIR", "data/metrics")
@@ -0,0 +1,20 @@
+# etl/common/gold_version.py
+# Versão da gold: build_gold regrava GOLD_VERSION_FILE ao terminar e etl.gold.serve descarta o cache quando ele muda.
+import json, os
+from datetime import datetime, timezone
+from .env import GOLD_VERSION_FILE
+
+def mark_version(last_date=None, path: str = GOLD_VERSION_FILE):
+    """Chamado por build_gold ao terminar: invalida o cache dos servidores em execução."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"built_at": datetime.now(timezone.utc).isoformat(), "last_date": last_date}, f, default=str)
+    os.replace(tmp, path)
+
+def current_version(path: str = GOLD_VERSION_FILE) -> int | None:
+    """mtime (ns) do arquivo de versão; None se a gold ainda não foi publicada."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
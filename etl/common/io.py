@@ -1,30 +1,315 @@
-import os, io, yaml, pandas as pd
+import os, io, re, copy, json, hashlib, random, threading, time, contextvars, yaml, pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from functools import lru_cache
 from loguru import logger
 import requests
+from requests.adapters import HTTPAdapter
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
 from datetime import datetime
-from .env import START_DATE
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+from .env import (START_DATE, HTTP_MAX_WORKERS, HTTP_MAX_RETRIES,
+                  HTTP_HOST_CONCURRENCY, HTTP_HOST_RATE,
+                  HTTP_CACHE_DIR, HTTP_CACHE_TTL_DAYS, HTTP_CACHE_MAX_MB, HTTP_REPLAY_URL)
+from . import telemetry
 
-def load_sources_yaml(path="configs/sources.yaml") -> dict:
+@lru_cache(maxsize=None)
+def _parse_sources_yaml(path: str) -> dict:
     with open(path, "r", encoding="utf-8") as f:
         raw = f.read()
     os.environ.setdefault("START_DATE", START_DATE)
     raw = os.path.expandvars(raw)
     return yaml.safe_load(raw)
 
+def load_sources_yaml(path="configs/sources.yaml") -> dict:
+    # Parse uma vez por processo; cada chamador recebe sua própria cópia
+    return copy.deepcopy(_parse_sources_yaml(path))
+
 def ensure_dirs(*paths):
     for p in paths:
         os.makedirs(p, exist_ok=True)
 
 DEFAULT_UA = "Mozilla/5.0 (X11; Linux x86_64) MarketDataETL/1.0"
 
-def http_get(url: str, headers: dict | None = None, timeout: int = 60) -> bytes:
-    # Alguns provedores (ex: Stooq) bloqueiam User-Agent padrão do requests.
-    merged_headers = {"User-Agent": DEFAULT_UA}
-    if headers:
-        merged_headers.update(headers)
-    r = requests.get(url, headers=merged_headers, timeout=timeout)
+# ---------------- Cliente HTTP compartilhado ----------------
+# (concorrência simultânea, requisições/s) por host; demais hosts usam HTTP_HOST_*.
+# Sobrescreva em configs/sources.yaml -> http.hosts.<host>: {concurrency: N, rate: R}
+HOST_LIMITS = {
+    "www.alphavantage.co": (1, 1 / 12),     # free tier: 5 req/min
+    "api.coingecko.com": (1, 0.5),          # demo: 30 req/min
+    "pro-api.coingecko.com": (2, 5),
+    "stooq.com": (2, 2),
+    "api.bcb.gov.br": (2, 2),
+    "query1.finance.yahoo.com": (2, 2),
+}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class HostLimiter:
+    """Limita requisições simultâneas e a taxa (req/s) para um host."""
+
+    def __init__(self, concurrency: int, rate: float):
+        self._sem = threading.BoundedSemaphore(max(1, int(concurrency)))
+        self._interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def __enter__(self):
+        self._sem.acquire()
+        with self._lock:
+            now = time.monotonic()
+            wait_s = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if wait_s > 0:
+            time.sleep(wait_s)
+        return self
+
+    def __exit__(self, *exc):
+        self._sem.release()
+
+_limiters: dict[str, HostLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def configure_host(host: str, concurrency: int, rate: float):
+    with _limiters_lock:
+        _limiters[host] = HostLimiter(concurrency, rate)
+
+def _limiter(host: str) -> HostLimiter:
+    with _limiters_lock:
+        if host not in _limiters:
+            concurrency, rate = HOST_LIMITS.get(host, (HTTP_HOST_CONCURRENCY, HTTP_HOST_RATE))
+            try:
+                override = (_parse_sources_yaml("configs/sources.yaml").get("http") or {}).get("hosts", {}).get(host)
+            except FileNotFoundError:
+                override = None
+            if override:
+                concurrency = override.get("concurrency", concurrency)
+                rate = override.get("rate", rate)
+            _limiters[host] = HostLimiter(concurrency, rate)
+        return _limiters[host]
+
+@lru_cache(maxsize=1)
+def get_session() -> requests.Session:
+    # Uma Session (keep-alive) por processo; pool de conexões por host do tamanho do fan-out
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=max(HTTP_MAX_WORKERS, HTTP_HOST_CONCURRENCY))
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers["User-Agent"] = DEFAULT_UA
+    return s
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in RETRY_STATUS
+    return False
+
+def _wait_retry_after(retry_state) -> float:
+    # Respeita Retry-After (429/503) quando numérico; senão backoff exponencial com jitter
+    exc = retry_state.outcome.exception()
+    resp = getattr(exc, "response", None)
+    retry_after = resp.headers.get("Retry-After") if resp is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), 120.0) + random.uniform(0, 1)
+    return wait_random_exponential(multiplier=1, max=30)(retry_state)
+
+def _log_retry(retry_state):
+    exc = retry_state.outcome.exception()
+    logger.warning(f"HTTP retry {retry_state.attempt_number}/{HTTP_MAX_RETRIES}: {exc}")
+
+def replay_url(url: str) -> str:
+    # Sem HTTP_REPLAY_URL devolve a própria URL; com ele, o host original vira o 1º segmento do path
+    if not HTTP_REPLAY_URL:
+        return url
+    p = urlparse(url)
+    return f"{HTTP_REPLAY_URL.rstrip('/')}/{p.netloc}{p.path}" + (f"?{p.query}" if p.query else "")
+
+@retry(retry=retry_if_exception(_is_retryable), wait=_wait_retry_after,
+       stop=stop_after_attempt(HTTP_MAX_RETRIES), before_sleep=_log_retry, reraise=True)
+def _get(url: str, headers: dict | None, timeout: int) -> requests.Response:
+    host = urlparse(url).netloc
+    with _limiter(host):
+        t0 = time.perf_counter()
+        r = get_session().get(replay_url(url), headers=headers, timeout=timeout)
+        # Latência só da requisição (sem a espera do rate limit); 304 conta 0 bytes
+        telemetry.record_http(host, time.perf_counter() - t0, len(r.content))
     r.raise_for_status()
-    return r.content
+    return r
+
+def http_get(url: str, headers: dict | None = None, timeout: int = 60) -> bytes:
+    # Alguns provedores (ex: Stooq) bloqueiam User-Agent padrão do requests (a Session já usa DEFAULT_UA).
+    return _get(url, headers, timeout).content
+
+# ---------------- Cache HTTP condicional ----------------
+# Um arquivo de corpo + um JSON de metadados por URL normalizada (sem chaves de API).
+# "acked_sha256" é o hash do último corpo efetivamente carregado (HttpResult.commit());
+# assim um crash entre o download e a carga reprocessa o corpo em cache sem baixar de novo.
+_SECRET_PARAM = re.compile(r"(api_?key|apikey|token|secret|key)$", re.IGNORECASE)
+
+def cache_key(url: str) -> str:
+    parsed = urlparse(url)
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+                   if not _SECRET_PARAM.search(k))
+    return urlunparse(parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(),
+                                      query=urlencode(query), fragment=""))
+
+def _cache_paths(key: str) -> tuple[str, str]:
+    h = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    base = os.path.join(HTTP_CACHE_DIR, h[:2], h)
+    return base + ".body", base + ".json"
+
+def _read_meta(path: str) -> dict | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _atomic_write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+@dataclass
+class HttpResult:
+    url_key: str
+    content: bytes
+    status: int
+    changed: bool           # corpo difere do último carregado com sucesso
+    from_cache: bool        # 304: corpo veio do disco
+    sha256: str = ""
+    meta: dict = field(default_factory=dict, repr=False)
+
+    def commit(self):
+        """Marca o corpo como carregado; chamar só depois de persistir os dados."""
+        if not self.meta:
+            return
+        self.meta["acked_sha256"] = self.sha256
+        _atomic_write(_cache_paths(self.url_key)[1], json.dumps(self.meta).encode("utf-8"))
+
+def evict_http_cache(ttl_days: float = HTTP_CACHE_TTL_DAYS, max_mb: float = HTTP_CACHE_MAX_MB) -> int:
+    """Remove entradas não usadas há mais de ttl_days e, se preciso, as menos recentes até caber em max_mb."""
+    if not os.path.isdir(HTTP_CACHE_DIR):
+        return 0
+    entries = []
+    for root, _, files in os.walk(HTTP_CACHE_DIR):
+        for name in files:
+            if name.endswith(".json"):
+                meta_path = os.path.join(root, name)
+                body_path = meta_path[:-5] + ".body"
+                size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+                entries.append((os.path.getmtime(meta_path), size, meta_path, body_path))
+    entries.sort()
+    now, removed = time.time(), 0
+    total = sum(e[1] for e in entries)
+    for mtime, size, meta_path, body_path in entries:
+        if now - mtime <= ttl_days * 86400 and total <= max_mb * 1024 * 1024:
+            continue
+        for p in (meta_path, body_path):
+            if os.path.exists(p):
+                os.remove(p)
+        total -= size
+        removed += 1
+    if removed:
+        logger.debug(f"HTTP cache: {removed} entradas removidas")
+    return removed
+
+@lru_cache(maxsize=1)
+def _evict_once() -> int:
+    # Eviction uma vez por processo, na primeira requisição com cache
+    return evict_http_cache()
+
+def http_get_cached(url: str, headers: dict | None = None, timeout: int = 60) -> HttpResult:
+    """GET condicional (If-None-Match / If-Modified-Since) com corpo guardado em HTTP_CACHE_DIR.
+
+    Em 304 ou corpo idêntico ao último carregado, HttpResult.changed é False e o chamador pode pular parse e carga.
+    """
+    _evict_once()
+    key = cache_key(url)
+    body_path, meta_path = _cache_paths(key)
+    meta = _read_meta(meta_path) or {}
+    if meta and not os.path.exists(body_path):
+        meta = {}
+    cond = dict(headers or {})
+    if meta.get("etag"):
+        cond["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        cond["If-Modified-Since"] = meta["last_modified"]
+
+    r = _get(url, cond, timeout)
+    if r.status_code == 304:
+        with open(body_path, "rb") as f:
+            content = f.read()
+        os.utime(meta_path)  # LRU da eviction
+        logger.debug(f"HTTP 304 (cache): {key}")
+        return HttpResult(key, content, 304, meta.get("acked_sha256") != meta.get("sha256"), True,
+                          meta.get("sha256", ""), meta)
+
+    content = r.content
+    digest = hashlib.sha256(content).hexdigest()
+    meta = {"url": key, "etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified"),
+            "sha256": digest, "acked_sha256": meta.get("acked_sha256"), "fetched_at": time.time()}
+    _atomic_write(body_path, content)
+    _atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+    return HttpResult(key, content, r.status_code, meta["acked_sha256"] != digest, False, digest, meta)
+
+@dataclass(frozen=True)
+class FetchRequest:
+    url: str
+    headers: dict | None = None
+    key: object = None      # identificador devolvido junto do resultado (ex.: código do símbolo)
+    timeout: int = 60
+
+def run_concurrent(fn, items: list, max_workers: int | None = None) -> list:
+    """Aplica fn a cada item num pool de threads; devolve resultados (ou a exceção) na ordem de entrada."""
+    def safe(item):
+        try:
+            return fn(item)
+        except Exception as exc:
+            return exc
+    if not items:
+        return []
+    workers = min(max_workers or HTTP_MAX_WORKERS, len(items))
+    # Cada item roda numa cópia do contexto do chamador: a telemetria da etapa segue para as threads
+    ctx = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http") as pool:
+        return list(pool.map(lambda item: ctx.copy().run(safe, item), items))
+
+def iter_concurrent(fn, items: list, max_workers: int | None = None):
+    """Como run_concurrent, mas gera (item, resultado ou exceção) à medida que cada um termina."""
+    def safe(item):
+        try:
+            return fn(item)
+        except Exception as exc:
+            return exc
+    if not items:
+        return
+    workers = min(max_workers or HTTP_MAX_WORKERS, len(items))
+    ctx = contextvars.copy_context()
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http")
+    try:
+        futures = {pool.submit(ctx.copy().run, safe, item): item for item in items}
+        for fut in as_completed(futures):
+            yield futures[fut], fut.result()
+    finally:
+        # Consumidor parou (erro/Ctrl+C): não inicia o que ainda está na fila
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def fetch_many(reqs: list[FetchRequest], max_workers: int | None = None) -> list[HttpResult | Exception]:
+    """Busca várias URLs em paralelo (GET condicional com cache), respeitando limites por host e com retry em 429/5xx.
+
+    O resultado de cada requisição é um HttpResult ou a exceção final; uma falha não derruba as demais.
+    """
+    return run_concurrent(lambda r: http_get_cached(r.url, r.headers, r.timeout), reqs, max_workers)
+
+def with_query_params(url: str, params: dict) -> str:
+    # Sobrescreve/adiciona parâmetros de query preservando os demais
+    parsed = urlparse(url)
+    query = dict(parse_qsl(parsed.query, keep_blank_values=True))
+    query.update({k: str(v) for k, v in params.items() if v is not None})
+    return urlunparse(parsed._replace(query=urlencode(query, safe="^")))
 
 def save_df(df: pd.DataFrame, path: str):
     os.makedirs(os.path.dirname(path), exist_ok=True)
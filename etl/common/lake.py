@@ -0,0 +1,353 @@
+import os, json, threading, uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from urllib.parse import quote, unquote
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+from loguru import logger
+from .env import FULL_REFRESH
+from . import telemetry
+
+# Bronze em Parquet particionado estilo Hive:
+#   data/bronze/source=<fonte>/symbol=<símbolo>/year=YYYY/month=MM/part-<tag>-<id>.parquet
+# e um manifest por fonte (data/bronze/source=<fonte>/_manifest.json) com min/max de data por arquivo,
+# usado para abrir só os arquivos que cobrem um intervalo. Antes de gravar, dedup_bronze descarta as linhas
+# idênticas às já gravadas pelo índice de conteúdo da fonte (source=<fonte>/_hashes.parquet: hash da chave
+# natural -> hash da linha): o overlap re-enviado a cada execução não vira arquivo nem linha nova no banco.
+BRONZE_LAKE_DIR = "data/bronze"
+ROW_GROUP_SIZE = 64_000
+# Partições com pelo menos esse número de arquivos entram na compactação
+COMPACT_MIN_FILES = 2
+
+_manifest_locks: dict[str, threading.Lock] = {}
+_manifest_guard = threading.Lock()
+
+try:
+    import fcntl
+except ImportError:             # Windows: só o lock entre threads
+    fcntl = None
+
+@contextmanager
+def _lock(source: str, root: str = BRONZE_LAKE_DIR):
+    """Exclusão no manifest/índice da fonte entre threads e, via flock em source=<fonte>/.lock, entre processos
+    do mesmo host (workers do etl.bronze.workqueue gravando a mesma fonte)."""
+    with _manifest_guard:
+        lock = _manifest_locks.setdefault(source, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        path = os.path.join(source_dir(source, root), ".lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def source_dir(source: str, root: str = BRONZE_LAKE_DIR) -> str:
+    return os.path.join(root, f"source={quote(source, safe='')}")
+
+def _manifest_path(source: str, root: str) -> str:
+    return os.path.join(source_dir(source, root), "_manifest.json")
+
+def load_manifest(source: str, root: str = BRONZE_LAKE_DIR) -> dict:
+    try:
+        with open(_manifest_path(source, root), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"source": source, "keys": [], "date_col": "date", "files": []}
+
+def _save_manifest(manifest: dict, root: str):
+    path = _manifest_path(manifest["source"], root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, default=str)
+    os.replace(tmp, path)
+
+def _hash_index_path(source: str, root: str) -> str:
+    return os.path.join(source_dir(source, root), "_hashes.parquet")
+
+def load_hashes(source: str, root: str = BRONZE_LAKE_DIR) -> pd.Series:
+    """Índice de conteúdo da fonte: hash da chave (índice) -> hash da linha gravada por último."""
+    try:
+        t = pq.read_table(_hash_index_path(source, root))
+    except FileNotFoundError:
+        return pd.Series(dtype="uint64", index=pd.Index([], dtype="uint64"))
+    return pd.Series(t["row"].to_numpy(), index=pd.Index(t["key"].to_numpy()))
+
+def _canon(col: pd.Series, is_date: bool) -> pd.Series:
+    # Representação estável entre execuções e ingestores (date vs Timestamp, int vs float na mesma coluna)
+    if is_date:
+        return pd.Series(pd.to_datetime(col).to_numpy().astype("datetime64[D]").astype("int64"), index=col.index)
+    if col.dtype.kind in "biuf":
+        return col.astype("float64")
+    if col.dtype.kind == "M":
+        return col.dt.as_unit("ns").astype("int64")
+    return col.astype(str)
+
+def row_hashes(df: pd.DataFrame, keys: list[str], date_col: str = "date") -> tuple[np.ndarray, np.ndarray]:
+    """(hash da chave natural, hash da linha inteira) em uint64, estáveis entre execuções (hash_pandas_object
+    tem chave fixa); as colunas entram em ordem alfabética, então a ordem do frame não importa."""
+    canon = pd.DataFrame({c: _canon(df[c], c == date_col) for c in sorted(df.columns)}, index=df.index)
+    key_h = pd.util.hash_pandas_object(canon[keys], index=False).to_numpy()
+    row_h = pd.util.hash_pandas_object(canon, index=False).to_numpy()
+    return key_h, row_h
+
+@dataclass
+class BronzeDelta:
+    """Linhas de um frame que ainda não estão na bronze (novas ou revisadas) + índice pendente de gravação."""
+    source: str
+    df: pd.DataFrame
+    revision: pd.Series             # True = chave já gravada com outro conteúdo
+    skipped: int                    # linhas idênticas às já gravadas (descartadas)
+    root: str = BRONZE_LAKE_DIR
+    hashes: pd.Series = field(default_factory=lambda: pd.Series(dtype="uint64"), repr=False)
+
+    def commit(self):
+        """Registra os hashes no índice da fonte; chamar só depois de gravar lake e banco."""
+        if self.hashes.empty:
+            return
+        with _lock(self.source, self.root):
+            _save_hashes(self.source, pd.concat([load_hashes(self.source, self.root), self.hashes]), self.root)
+
+def _save_hashes(source: str, idx: pd.Series, root: str):
+    idx = idx[~idx.index.duplicated(keep="last")]
+    path = _hash_index_path(source, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    pq.write_table(pa.table({"key": pa.array(idx.index.to_numpy(), pa.uint64()),
+                             "row": pa.array(idx.to_numpy(), pa.uint64())}), tmp, compression="zstd")
+    os.replace(tmp, path)
+
+def dedup_bronze(df: pd.DataFrame, source: str, keys: list[str], date_col: str = "date",
+                 root: str = BRONZE_LAKE_DIR) -> BronzeDelta:
+    """Filtra df para as linhas novas ou com conteúdo diferente do já gravado na fonte (revisões).
+
+    Repetições da chave dentro do próprio frame ficam com a última. FULL_REFRESH ignora o índice (regrava tudo)
+    para a bronze do banco poder ser reconstruída do zero."""
+    if df.empty:
+        return BronzeDelta(source, df, pd.Series(False, index=df.index), 0, root)
+    key_h, row_h = row_hashes(df, keys, date_col)
+    last = ~pd.Series(key_h).duplicated(keep="last").to_numpy()
+    df, key_h, row_h = df[last], key_h[last], row_h[last]
+    stored = pd.Series(dtype="uint64") if FULL_REFRESH else load_hashes(source, root)
+    pos = stored.index.get_indexer(key_h) if not stored.empty else np.full(len(key_h), -1)
+    known = pos >= 0
+    revised = known & (stored.to_numpy()[np.maximum(pos, 0)] != row_h) if known.any() else known
+    keep = ~known | revised
+    delta = BronzeDelta(source, df[keep], pd.Series(revised[keep], index=df.index[keep]),
+                        int((~keep).sum()), root, pd.Series(row_h[keep], index=pd.Index(key_h[keep])))
+    if delta.skipped or revised.any():
+        logger.info(f"Bronze dedup {source}: {int((~known).sum())} nova(s), {int(revised.sum())} revisada(s), "
+                    f"{delta.skipped} repetida(s) descartada(s)")
+    return delta
+
+def _write_file(df: pd.DataFrame, path: str, date_col: str) -> dict:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(df.sort_values(date_col, kind="stable"), preserve_index=False)
+    # Ordenado por data + estatísticas por row group => pruning por min/max na leitura
+    pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE, write_statistics=True, compression="zstd")
+    return {"rows": len(df), "bytes": os.path.getsize(path),
+            **({"revisions": int(df["revision"].sum())} if "revision" in df.columns else {}),
+            "min_date": str(df[date_col].min()), "max_date": str(df[date_col].max())}
+
+def _conform(df: pd.DataFrame, source: str) -> pd.DataFrame:
+    """Colunas DOUBLE do DDL da tabela bronze da fonte sempre como float64: o parser devolve int64 quando não falta
+    nenhum valor (ex.: volume do Stooq) e float64 quando falta, e os arquivos de uma partição divergiriam no tipo."""
+    from .backend import LAKE_SOURCES
+    from .schema import TABLES
+    table = next((t for t, srcs in LAKE_SOURCES.items() if source in srcs), None)
+    if table is None:
+        return df
+    floats = [c for c, typ in TABLES[table].columns if typ.split()[0] in ("DOUBLE", "FLOAT") and c in df.columns]
+    return df.assign(**{c: pd.to_numeric(df[c]).astype("float64") for c in floats}) if floats else df
+
+def write_bronze(df: pd.DataFrame, source: str, keys: list[str], symbol_col: str | None = None,
+                 symbol: str | None = None, date_col: str = "date", root: str = BRONZE_LAKE_DIR,
+                 revision: pd.Series | None = None) -> list[str]:
+    """Grava df no lake particionado por source/symbol/year/month e registra no manifest.
+
+    keys são as chaves naturais da compactação/dedup; revision vira a coluna booleana `revision`."""
+    if df.empty:
+        return []
+    df = _conform(df.copy(), source)
+    if revision is not None:
+        df["revision"] = revision.reindex(df.index, fill_value=False).astype(bool)
+    df[date_col] = pd.to_datetime(df[date_col]).dt.date
+    dts = pd.to_datetime(df[date_col])
+    sym = df[symbol_col].astype(str) if symbol_col else pd.Series(symbol or source, index=df.index)
+    tag = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    written = []
+    with _lock(source, root):
+        manifest = load_manifest(source, root)
+        manifest["keys"] = keys
+        manifest["date_col"] = date_col
+        for (s, y, m), part in df.groupby([sym, dts.dt.year, dts.dt.month], sort=True):
+            rel = os.path.join(f"symbol={quote(s, safe='')}", f"year={y:04d}", f"month={m:02d}",
+                               f"part-{tag}-{uuid.uuid4().hex[:8]}.parquet")
+            stats = _write_file(part, os.path.join(source_dir(source, root), rel), date_col)
+            manifest["files"].append({"path": rel, "symbol": s, "year": int(y), "month": int(m),
+                                      "created_at": tag, **stats})
+            written.append(rel)
+        _save_manifest(manifest, root)
+    logger.info(f"Bronze lake {source}: {len(df)} linhas em {len(written)} arquivo(s).")
+    return written
+
+def select_files(source: str, start: date | None = None, end: date | None = None,
+                 symbols: list[str] | None = None, root: str = BRONZE_LAKE_DIR) -> list[str]:
+    """Arquivos do manifest cujo [min_date, max_date] intersecta [start, end] (em ordem de criação)."""
+    manifest = load_manifest(source, root)
+    wanted = set(map(str, symbols)) if symbols else None
+    out = []
+    for f in manifest["files"]:
+        if wanted is not None and f["symbol"] not in wanted:
+            continue
+        if start is not None and f["max_date"] < str(start):
+            continue
+        if end is not None and f["min_date"] > str(end):
+            continue
+        out.append(os.path.join(source_dir(source, root), f["path"]))
+    return out
+
+def _scan(source: str, start: date | None, end: date | None, symbols: list[str] | None,
+          columns: list[str] | None, date_col: str, root: str) -> pa.Table | None:
+    """Scanner pyarrow.dataset sobre os arquivos da fonte que cobrem o intervalo: projeção de colunas e filtro de
+    data empurrados para o leitor Parquet (row groups fora da faixa nem são lidos, pelas estatísticas min/max).
+    Símbolos são podados no nível de arquivo (partição symbol= do manifest)."""
+    files = select_files(source, start, end, symbols, root)
+    if not files:
+        return None
+    # Arquivos de cargas diferentes podem divergir no tipo (ex.: coluna toda nula); o schema unificado cobre todos
+    schema = pa.unify_schemas([pq.read_schema(f).remove_metadata() for f in files], promote_options="permissive")
+    dataset = ds.dataset(files, schema=schema, format="parquet")
+    cond = None
+    if start is not None:
+        cond = ds.field(date_col) >= pa.scalar(pd.Timestamp(start).date(), pa.date32())
+    if end is not None:
+        upper = ds.field(date_col) <= pa.scalar(pd.Timestamp(end).date(), pa.date32())
+        cond = upper if cond is None else cond & upper
+    cols = None if columns is None else [c for c in columns if c in schema.names]
+    # to_table mantém a ordem dos arquivos (ordem de criação): o dedup "último vence" continua valendo
+    return dataset.to_table(columns=cols, filter=cond)
+
+def read_bronze(source: str | list[str], start: date | None = None, end: date | None = None,
+                symbols: list[str] | None = None, columns: list[str] | None = None,
+                date_col: str = "date", root: str = BRONZE_LAKE_DIR) -> pd.DataFrame:
+    """Lê um intervalo do lake abrindo só os arquivos que o cobrem; dedup pelas chaves naturais (último vence).
+
+    Várias fontes (ex.: stooq + yahoo, que alimentam a mesma tabela) são lidas em ordem e a última vence."""
+    srcs = [source] if isinstance(source, str) else list(source)
+    keys = list(dict.fromkeys(k for s in srcs for k in load_manifest(s, root)["keys"]))
+    cols = None if columns is None else list(dict.fromkeys([*columns, *keys]))
+    tables = [t for s in srcs if (t := _scan(s, start, end, symbols, cols, date_col, root)) is not None]
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    df = pa.concat_tables(tables, promote_options="permissive").to_pandas()
+    if keys:
+        df = df.drop_duplicates(subset=[k for k in keys if k in df.columns], keep="last")
+    telemetry.record_rows_in(len(df))
+    if columns:
+        # Coluna pedida que nenhum arquivo tem (fonte antiga): vem nula, como no SELECT da tabela
+        return df.reindex(columns=columns)
+    return df
+
+def count_bronze(source: str | list[str], start: date | None = None, root: str = BRONZE_LAKE_DIR) -> pd.Series:
+    """Estimativa de linhas por data a partir de `start` só pelo manifest (nenhum arquivo é aberto): as linhas de
+    cada arquivo são espalhadas por igual entre min_date e max_date. Basta para planejar faixas de leitura."""
+    srcs = [source] if isinstance(source, str) else list(source)
+    parts = []
+    for s in srcs:
+        for f in load_manifest(s, root)["files"]:
+            if start is not None and f["max_date"] < str(start):
+                continue
+            days = pd.date_range(f["min_date"], f["max_date"], freq="D")
+            parts.append(pd.Series(f["rows"] / len(days), index=days))
+    if not parts:
+        return pd.Series(dtype="int64")
+    counts = pd.concat(parts).groupby(level=0).sum()
+    if start is not None:
+        counts = counts[counts.index >= pd.Timestamp(start)]
+    return np.ceil(counts).astype("int64")
+
+def compact(source: str, root: str = BRONZE_LAKE_DIR, min_files: int = COMPACT_MIN_FILES) -> int:
+    """Junta os arquivos de cada partição symbol/year/month num só, com dedup pelas chaves naturais."""
+    with _lock(source, root):
+        manifest = load_manifest(source, root)
+        keys = manifest["keys"]
+        date_col = manifest.get("date_col", "date")
+        by_part: dict[tuple, list[dict]] = {}
+        for f in manifest["files"]:
+            by_part.setdefault((f["symbol"], f["year"], f["month"]), []).append(f)
+
+        base = source_dir(source, root)
+        kept, compacted = [], 0
+        tag = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        for (s, y, m), files in sorted(by_part.items()):
+            if len(files) < min_files:
+                kept.extend(files)
+                continue
+            files = sorted(files, key=lambda f: f["created_at"])
+            tables = [pq.read_table(os.path.join(base, f["path"])) for f in files]
+            # Arquivos gravados antes do _conform podem divergir no tipo (int64 vs double): promoção como no _scan
+            df = pa.concat_tables(tables, promote_options="permissive").to_pandas()
+            before = len(df)
+            if keys:
+                df = df.drop_duplicates(subset=keys, keep="last")
+            rel = os.path.join(f"symbol={quote(s, safe='')}", f"year={y:04d}", f"month={m:02d}",
+                               f"part-{tag}-c{uuid.uuid4().hex[:8]}.parquet")
+            stats = _write_file(df, os.path.join(base, rel), date_col)
+            kept.append({"path": rel, "symbol": s, "year": y, "month": m, "created_at": tag, **stats})
+            for f in files:
+                os.remove(os.path.join(base, f["path"]))
+            compacted += 1
+            logger.debug(f"Compactado {source}/{s}/{y}-{m:02d}: {len(files)} arquivos, "
+                         f"{before} -> {len(df)} linhas")
+        manifest["files"] = kept
+        _save_manifest(manifest, root)
+        if not os.path.exists(_hash_index_path(source, root)):
+            # Lake gravado antes do índice (ou índice perdido): sem ele o próximo dedup regravaria tudo
+            _rebuild_hashes(source, root)
+    logger.info(f"Bronze lake {source}: {compacted} partição(ões) compactada(s).")
+    return compacted
+
+def _rebuild_hashes(source: str, root: str) -> int:
+    manifest = load_manifest(source, root)
+    keys, date_col = manifest["keys"], manifest.get("date_col", "date")
+    table = _scan(source, None, None, None, None, date_col, root) if keys else None
+    if table is None:
+        return 0
+    # Última versão de cada chave, sem a coluna `revision` (o dedup compara o frame do ingestor)
+    df = table.to_pandas().drop(columns=["revision"], errors="ignore").drop_duplicates(subset=keys, keep="last")
+    key_h, row_h = row_hashes(df, keys, date_col)
+    _save_hashes(source, pd.Series(row_h, index=pd.Index(key_h)), root)
+    logger.info(f"Bronze lake {source}: índice de conteúdo reconstruído ({len(df)} chaves).")
+    return len(df)
+
+def rebuild_hashes(source: str, root: str = BRONZE_LAKE_DIR) -> int:
+    """Recria source=<fonte>/_hashes.parquet a partir dos arquivos do lake (o último de cada chave vence)."""
+    with _lock(source, root):
+        return _rebuild_hashes(source, root)
+
+def lake_id(root: str = BRONZE_LAKE_DIR) -> str:
+    """Identidade do lake (root/_lake_id, criado na primeira chamada): hosts com o mesmo id veem o mesmo disco."""
+    path = os.path.join(root, "_lake_id")
+    os.makedirs(root, exist_ok=True)
+    try:
+        with open(path, "x", encoding="utf-8") as f:
+            f.write(str(uuid.uuid4()))
+    except FileExistsError:
+        pass
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+def sources(root: str = BRONZE_LAKE_DIR) -> list[str]:
+    if not os.path.isdir(root):
+        return []
+    return sorted(unquote(d.split("=", 1)[1]) for d in os.listdir(root) if d.startswith("source="))
@@ -0,0 +1,535 @@
+# etl/common/schema.py
+# DDL gerenciado das camadas como migrações versionadas (md_catalog.schema_migrations).
+#
+#   python -m etl.common.schema            # aplica as migrações pendentes
+#   python -m etl.common.schema --status   # mostra versão atual e pendências
+import argparse, threading
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable
+import pandas as pd
+from sqlalchemy import text, inspect, bindparam
+from sqlalchemy.engine import Engine, Connection
+from loguru import logger
+from .env import START_DATE, DB_PARTITION_BY_YEAR
+from . import backend
+from .watermark import WATERMARK_TABLE, watermark_key
+
+MIGRATIONS_TABLE = "md_catalog.schema_migrations"
+
+@dataclass(frozen=True)
+class Table:
+    name: str                                       # schema.tabela
+    columns: tuple[tuple[str, str], ...]            # (coluna, tipo SQL)
+    primary_key: tuple[str, ...]
+    indexes: tuple[tuple[str, tuple[str, ...]], ...] = ()
+    partition_col: str | None = None                # coluna DATE usada no RANGE por ano
+
+    @property
+    def column_names(self) -> list[str]:
+        return [c for c, _ in self.columns]
+
+def _ohlc(close: str = "close") -> tuple[tuple[str, str], ...]:
+    return (("open", "DOUBLE"), ("high", "DOUBLE"), ("low", "DOUBLE"), (close, "DOUBLE"), ("volume", "DOUBLE"))
+
+TABLES: dict[str, Table] = {t.name: t for t in [
+    # ---------------- BRONZE ----------------
+    Table("md_bronze.ecb_fx_raw",
+          (("date", "DATE NOT NULL"), ("code", "VARCHAR(10) NOT NULL"), ("rate_vs_eur", "DOUBLE")),
+          ("date", "code"), partition_col="date"),
+    Table("md_bronze.ptax_usdbrl_raw",
+          (("date", "DATE NOT NULL"), ("usdbrl", "DOUBLE")),
+          ("date",), partition_col="date"),
+    Table("md_bronze.coingecko_btcusd_raw",
+          (("date", "DATE NOT NULL"), ("btc_usd", "DOUBLE")),
+          ("date",), partition_col="date"),
+    # Pontos intraday da CoinGecko (preço e volume 24h por timestamp), várias moedas
+    Table("md_bronze.coingecko_points_raw",
+          (("date", "DATE NOT NULL"), ("coin", "VARCHAR(64) NOT NULL"), ("ts", "DATETIME NOT NULL"),
+           ("price", "DOUBLE"), ("volume", "DOUBLE")),
+          ("date", "coin", "ts"), partition_col="date"),
+    Table("md_bronze.stooq_index_raw",
+          (("date", "DATE NOT NULL"), ("code", "VARCHAR(16) NOT NULL"), ("name", "VARCHAR(64)"), *_ohlc()),
+          ("date", "code"), partition_col="date"),
+    # ---------------- SILVER ----------------
+    Table("md_silver.fx_rates",
+          (("date", "DATE NOT NULL"), ("pair", "VARCHAR(16) NOT NULL"), ("rate", "DOUBLE")),
+          ("date", "pair"), (("ix_fx_rates_pair", ("pair", "date", "rate")),), partition_col="date"),
+    Table("md_silver.crypto_rates",
+          (("date", "DATE NOT NULL"), ("symbol", "VARCHAR(16) NOT NULL"), ("price", "DOUBLE")),
+          ("date", "symbol"), (("ix_crypto_rates_symbol", ("symbol", "date", "price")),), partition_col="date"),
+    Table("md_silver.crypto_ohlc",
+          (("date", "DATE NOT NULL"), ("symbol", "VARCHAR(16) NOT NULL"), *_ohlc(), ("vwap", "DOUBLE"),
+           ("n_points", "INT")),
+          ("date", "symbol"), (("ix_crypto_ohlc_symbol", ("symbol", "date")),), partition_col="date"),
+    Table("md_silver.index_ohlc",
+          (("date", "DATE NOT NULL"), ("index_code", "VARCHAR(16) NOT NULL"), ("index_name", "VARCHAR(64)"),
+           *_ohlc(), ("is_trading_day", "BOOLEAN")),
+          ("date", "index_code"), (("ix_index_ohlc_code", ("index_code", "date")),), partition_col="date"),
+    # ---------------- GOLD ----------------
+    Table("md_gold.dim_currency",
+          (("currency_code", "VARCHAR(8) NOT NULL"),),
+          ("currency_code",)),
+    Table("md_gold.fact_fx_daily",
+          (("date", "DATE NOT NULL"), ("currency_pair", "VARCHAR(16) NOT NULL"), ("rate_close", "DOUBLE")),
+          ("date", "currency_pair"),
+          # Power BI filtra por par e período: índice cobrindo (par, data, valor)
+          (("ix_fact_fx_pair_date", ("currency_pair", "date", "rate_close")),), partition_col="date"),
+    Table("md_gold.fact_crypto_daily",
+          (("date", "DATE NOT NULL"), ("asset_symbol", "VARCHAR(16) NOT NULL"), ("price_close", "DOUBLE")),
+          ("date", "asset_symbol"),
+          (("ix_fact_crypto_symbol_date", ("asset_symbol", "date", "price_close")),), partition_col="date"),
+    Table("md_gold.dim_index",
+          (("index_code", "VARCHAR(16) NOT NULL"), ("index_name", "VARCHAR(64)")),
+          ("index_code",)),
+    Table("md_gold.fact_index_daily",
+          (("date", "DATE NOT NULL"), ("index_code", "VARCHAR(16) NOT NULL"), *_ohlc("close_price")),
+          ("date", "index_code"),
+          (("ix_fact_index_code_date", ("index_code", "date", "close_price")),), partition_col="date"),
+    Table("md_gold.dim_date",
+          (("date", "DATE NOT NULL"), ("year", "SMALLINT"), ("quarter", "TINYINT"), ("month", "TINYINT"),
+           ("day", "TINYINT"), ("year_month", "CHAR(7)"), ("iso_year", "SMALLINT"), ("iso_week", "TINYINT"),
+           ("day_of_week", "TINYINT"), ("is_weekend", "BOOLEAN"),
+           ("is_business_br", "BOOLEAN"), ("is_business_ecb", "BOOLEAN"), ("is_business_us", "BOOLEAN")),
+          ("date",)),
+    # ---------------- GOLD: rollups por período (W/M/Y) ----------------
+    *(Table(f"md_gold.{name}",
+            (("grain", "CHAR(1) NOT NULL"), (key, "VARCHAR(16) NOT NULL"), ("period_start", "DATE NOT NULL"),
+             ("period_end", "DATE"), ("open", "DOUBLE"), ("high", "DOUBLE"), ("low", "DOUBLE"),
+             ("close", "DOUBLE"), ("return_pct", "DOUBLE"), ("avg_close", "DOUBLE"), ("n_days", "INT")),
+            ("grain", key, "period_start"))
+      for name, key in (("agg_fx_period", "currency_pair"), ("agg_crypto_period", "asset_symbol"),
+                        ("agg_index_period", "index_code"))),
+    # ---------------- GOLD: features analíticas ----------------
+    Table("md_gold.fact_series_features",
+          (("date", "DATE NOT NULL"), ("asset_class", "VARCHAR(8) NOT NULL"), ("series_code", "VARCHAR(16) NOT NULL"),
+           ("close", "DOUBLE"), ("log_return", "DOUBLE"), ("vol_20", "DOUBLE"), ("vol_60", "DOUBLE"),
+           ("sma_20", "DOUBLE"), ("sma_50", "DOUBLE"), ("sma_200", "DOUBLE"),
+           ("ema_12", "DOUBLE"), ("ema_26", "DOUBLE"), ("peak", "DOUBLE"), ("drawdown", "DOUBLE")),
+          ("date", "asset_class", "series_code"),
+          (("ix_features_series_date", ("series_code", "date")),), partition_col="date"),
+    Table("md_gold.fact_correlation",
+          (("date", "DATE NOT NULL"), ("window_days", "SMALLINT NOT NULL"),
+           ("series_a", "VARCHAR(16) NOT NULL"), ("series_b", "VARCHAR(16) NOT NULL"), ("corr", "DOUBLE")),
+          ("date", "window_days", "series_a", "series_b"),
+          (("ix_correlation_pair_date", ("series_a", "series_b", "date")),), partition_col="date"),
+]}
+
+def _q(name: str) -> str:
+    return f"`{name}`"
+
+def create_sql(t: Table, embedded: bool = False) -> str:
+    q = (lambda c: f'"{c}"') if embedded else _q
+    cols = [f"{q(c)} {typ}" for c, typ in t.columns]
+    cols.append(f"PRIMARY KEY ({', '.join(map(q, t.primary_key))})")
+    return (f"CREATE TABLE IF NOT EXISTS {t.name} (\n  " + ",\n  ".join(cols)
+            + ("\n)" if embedded else "\n) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"))
+
+def _split(name: str) -> tuple[str, str]:
+    schema, table = name.split(".")
+    return schema, table
+
+def _has_pk(conn: Connection, t: Table) -> bool:
+    schema, table = _split(t.name)
+    return bool(inspect(conn).get_pk_constraint(table, schema=schema).get("constrained_columns"))
+
+def _create_or_adopt(conn: Connection, t: Table):
+    """Cria a tabela gerenciada; se existir uma versão criada pelo to_sql (sem PK), reconstrói com a PK
+    copiando os dados (a última linha lida por chave vence) e troca os nomes atomicamente."""
+    schema, table = _split(t.name)
+    insp = inspect(conn)
+    if not insp.has_table(table, schema=schema):
+        conn.exec_driver_sql(create_sql(t))
+        logger.info(f"Schema: criada {t.name}")
+        return
+    if _has_pk(conn, t):
+        return
+    existing = {c["name"] for c in insp.get_columns(table, schema=schema)}
+    cols = ", ".join(_q(c) for c in t.column_names if c in existing)
+    new, old = f"{t.name}__new", f"{t.name}__old"
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS {new}")
+    conn.exec_driver_sql(create_sql(Table(new, t.columns, t.primary_key)))
+    updates = ", ".join(f"{_q(c)} = VALUES({_q(c)})" for c in t.column_names
+                        if c in existing and c not in t.primary_key)
+    conn.exec_driver_sql(f"INSERT INTO {new} ({cols}) SELECT {cols} FROM {t.name} "
+                         f"WHERE {' AND '.join(f'{_q(k)} IS NOT NULL' for k in t.primary_key)}"
+                         + (f" ON DUPLICATE KEY UPDATE {updates}" if updates else ""))
+    conn.exec_driver_sql(f"RENAME TABLE {t.name} TO {old}, {new} TO {t.name}")
+    conn.exec_driver_sql(f"DROP TABLE {old}")
+    logger.info(f"Schema: {t.name} reconstruída com PK ({', '.join(t.primary_key)})")
+
+def _ensure_indexes(conn: Connection, t: Table):
+    schema, table = _split(t.name)
+    existing = {ix["name"] for ix in inspect(conn).get_indexes(table, schema=schema)}
+    for name, cols in t.indexes:
+        if name not in existing:
+            conn.exec_driver_sql(f"CREATE INDEX {name} ON {t.name} ({', '.join(map(_q, cols))})")
+            logger.info(f"Schema: índice {name} em {t.name}")
+
+# ---------------- particionamento por ano ----------------
+def _partition_years(conn: Connection, t: Table) -> list[int] | None:
+    """Anos com partição própria (pYYYY) ou None se a tabela não é particionada."""
+    schema, table = _split(t.name)
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = :s AND TABLE_NAME = :t AND PARTITION_NAME IS NOT NULL"),
+        {"s": schema, "t": table}).scalars().all()
+    if not rows:
+        return None
+    return sorted(int(p[1:]) for p in rows if p[1:].isdigit())
+
+def _year_parts(years: range) -> str:
+    parts = [f"PARTITION p{y} VALUES LESS THAN ({y + 1})" for y in years]
+    return ", ".join([*parts, "PARTITION pmax VALUES LESS THAN MAXVALUE"])
+
+def ensure_partitions(conn: Connection, t: Table, through_year: int | None = None):
+    """RANGE (YEAR(date)): p_old (< START_DATE), pYYYY até through_year e pmax.
+    Idempotente; em execuções seguintes só divide pmax para os anos novos."""
+    if not t.partition_col:
+        return
+    through_year = through_year or date.today().year + 1
+    first = pd.to_datetime(START_DATE).year
+    years = _partition_years(conn, t)
+    col = _q(t.partition_col)
+    if years is None:
+        conn.exec_driver_sql(
+            f"ALTER TABLE {t.name} PARTITION BY RANGE (YEAR({col})) ("
+            f"PARTITION p_old VALUES LESS THAN ({first}), {_year_parts(range(first, through_year + 1))})")
+        logger.info(f"Schema: {t.name} particionada por ano ({first}..{through_year})")
+        return
+    last = max(years, default=first - 1)
+    if last < through_year:
+        conn.exec_driver_sql(f"ALTER TABLE {t.name} REORGANIZE PARTITION pmax INTO "
+                             f"({_year_parts(range(last + 1, through_year + 1))})")
+        logger.info(f"Schema: {t.name} ganhou partições {last + 1}..{through_year}")
+
+# ---------------- migrações ----------------
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+    embedded: bool = False          # migração de dados: roda também nos backends embarcados (DuckDB/SQLite)
+
+def _tables(prefix: str = "") -> list[Table]:
+    return [t for name, t in TABLES.items() if name.startswith(prefix)]
+
+# Cada migração cita as tabelas que são dela: tabelas novas em TABLES entram por migração própria, e colunas novas
+# por ALTER ... IF NOT EXISTS (create_sql usa a definição atual, então uma base nova já nasce com elas)
+BASELINE_TABLES = ("md_bronze.ecb_fx_raw", "md_bronze.ptax_usdbrl_raw", "md_bronze.coingecko_btcusd_raw",
+                   "md_bronze.stooq_index_raw", "md_silver.fx_rates", "md_silver.crypto_rates",
+                   "md_silver.index_ohlc", "md_gold.dim_currency", "md_gold.fact_fx_daily",
+                   "md_gold.fact_crypto_daily", "md_gold.dim_index", "md_gold.fact_index_daily")
+
+def _m001_primary_keys(conn: Connection):
+    for name in BASELINE_TABLES:
+        _create_or_adopt(conn, TABLES[name])
+
+def _m002_secondary_indexes(conn: Connection):
+    for name in BASELINE_TABLES:
+        _ensure_indexes(conn, TABLES[name])
+
+def _m003_gold_rollups(conn: Connection):
+    for name in ("md_gold.agg_fx_period", "md_gold.agg_crypto_period", "md_gold.agg_index_period"):
+        _create_or_adopt(conn, TABLES[name])
+
+def _m004_gold_features(conn: Connection):
+    for name in ("md_gold.fact_series_features", "md_gold.fact_correlation"):
+        _create_or_adopt(conn, TABLES[name])
+        _ensure_indexes(conn, TABLES[name])
+
+def _m005_dim_date(conn: Connection):
+    _create_or_adopt(conn, TABLES["md_gold.dim_date"])
+
+LOG_METRIC_COLUMNS = (("rows_in", "BIGINT DEFAULT 0"), ("bytes_downloaded", "BIGINT DEFAULT 0"),
+                      ("http_requests", "INT DEFAULT 0"), ("http_seconds", "DOUBLE"),
+                      ("db_write_seconds", "DOUBLE"), ("wall_seconds", "DOUBLE"),
+                      ("peak_rss_mb", "DOUBLE"), ("metrics_json", "TEXT"))
+
+def _m006_ingestion_log_metrics(conn: Connection):
+    # Mesma DDL do docker/mariadb/initdb/00_init.sql, para bancos criados sem o init
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS md_catalog.ingestion_log (
+          id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+          source_name VARCHAR(100) NOT NULL,
+          run_id CHAR(36) NOT NULL,
+          start_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          end_ts TIMESTAMP NULL,
+          status ENUM('STARTED','SUCCESS','FAILED') NOT NULL,
+          rows_ingested BIGINT DEFAULT 0,
+          message TEXT
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""")
+    for col, typ in LOG_METRIC_COLUMNS:
+        conn.exec_driver_sql(f"ALTER TABLE md_catalog.ingestion_log ADD COLUMN IF NOT EXISTS {_q(col)} {typ}")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_ingestion_log_source "
+                         "ON md_catalog.ingestion_log (source_name, id)")
+
+BACKFILL_TABLE = "md_catalog.backfill_chunks"
+
+def _m007_backfill_chunks(conn: Connection):
+    # Checkpoint por bloco do etl.bronze.backfill: um bloco DONE cobre [chunk_start, chunk_end] do símbolo
+    conn.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {BACKFILL_TABLE} (
+          source_name VARCHAR(50) NOT NULL,
+          symbol VARCHAR(100) NOT NULL,
+          chunk_start DATE NOT NULL,
+          chunk_end DATE NOT NULL,
+          status ENUM('DONE','FAILED') NOT NULL,
+          rows_loaded INT DEFAULT 0,
+          attempts INT NOT NULL DEFAULT 1,
+          message TEXT,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+          PRIMARY KEY (source_name, symbol, chunk_start, chunk_end)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""")
+
+def _m008_crypto_intraday(conn: Connection):
+    for name in ("md_bronze.coingecko_points_raw", "md_silver.crypto_ohlc"):
+        _create_or_adopt(conn, TABLES[name])
+        _ensure_indexes(conn, TABLES[name])
+
+TASKS_TABLE = "md_catalog.ingest_tasks"
+
+def _m009_ingest_tasks(conn: Connection):
+    # Fila de trabalho do etl.bronze.workqueue: uma tarefa por (fonte, símbolo, janela), reservada com
+    # SELECT ... FOR UPDATE SKIP LOCKED; em RUNNING, available_at é o fim do lease do worker (lease_owner)
+    conn.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {TASKS_TABLE} (
+          id BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+          source_name VARCHAR(50) NOT NULL,
+          symbol VARCHAR(100) NOT NULL,
+          window_start DATE NOT NULL,
+          window_end DATE NOT NULL,
+          status ENUM('PENDING','RUNNING','DONE','FAILED') NOT NULL DEFAULT 'PENDING',
+          attempts INT NOT NULL DEFAULT 0,
+          max_attempts INT NOT NULL DEFAULT 5,
+          lease_owner VARCHAR(200) NULL,
+          available_at DATETIME NOT NULL,
+          rows_loaded INT DEFAULT 0,
+          message TEXT,
+          created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+          UNIQUE KEY uq_ingest_tasks (source_name, symbol, window_start, window_end),
+          KEY ix_ingest_tasks_claim (status, available_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""")
+
+def _reset_checkpoints(conn: Connection, checkpoints: list[tuple[str, str]]):
+    """Apaga os checkpoints (watermarks): a próxima execução de cada etapa reprocessa desde START_DATE."""
+    schema, table = _split(WATERMARK_TABLE)
+    if not inspect(conn).has_table(table, schema=schema):
+        return
+    names = [watermark_key(*cp) for cp in checkpoints]
+    n = conn.execute(text(f"DELETE FROM {WATERMARK_TABLE} WHERE source_name IN :names")
+                     .bindparams(bindparam("names", expanding=True)), {"names": names}).rowcount
+    if n:
+        logger.warning(f"Schema: checkpoints {', '.join(names)} apagados; a próxima execução reprocessa desde "
+                       f"START_DATE={START_DATE}")
+
+GOLD_CHECKPOINTS = [("gold", "facts"), ("gold", "rollups"), ("gold", "features")]
+
+def _m010_fx_cross_rebuild(conn: Connection):
+    # A fórmula CODE/BRL mudou com o motor de cross rates: o histórico já gravado em md_silver.fx_rates e na gold
+    # (fatos, rollups, features) ficou com o valor antigo e só a janela do overlap seria recalculada
+    _reset_checkpoints(conn, [("silver", "fx_rates"), *GOLD_CHECKPOINTS])
+
+def _m011_index_trading_flag(conn: Connection):
+    # normalize_indices deixou de descartar linhas fora do calendário de pregão: elas ficam com is_trading_day =
+    # false. As descartadas antes (ex.: 31/12/2021 da NYSE, marcado como feriado por engano) voltam no recálculo
+    if not backend.is_embedded(conn):
+        conn.exec_driver_sql("ALTER TABLE md_silver.index_ohlc ADD COLUMN IF NOT EXISTS `is_trading_day` BOOLEAN")
+    _reset_checkpoints(conn, [("silver", "index_ohlc"), *GOLD_CHECKPOINTS])
+
+def _m012_task_lake_id(conn: Connection):
+    # Tarefa concluída registra o lake (etl.common.lake.lake_id) em que o worker gravou: com a silver lendo a
+    # bronze do lake, workers em hosts com lakes distintos são recusados (etl.bronze.workqueue.check_lake)
+    schema, table = _split(TASKS_TABLE)
+    if "lake_id" not in {c["name"] for c in inspect(conn).get_columns(table, schema=schema)}:
+        conn.exec_driver_sql(f"ALTER TABLE {TASKS_TABLE} ADD COLUMN lake_id VARCHAR(36) NULL")
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "tabelas gerenciadas com PK pelas chaves naturais", _m001_primary_keys),
+    Migration(2, "índices secundários para filtros do Power BI", _m002_secondary_indexes),
+    Migration(3, "rollups gold por semana/mês/ano", _m003_gold_rollups),
+    Migration(4, "features analíticas e correlações da gold", _m004_gold_features),
+    Migration(5, "dimensão de datas com dias úteis por mercado", _m005_dim_date),
+    Migration(6, "métricas por etapa no ingestion_log", _m006_ingestion_log_metrics),
+    Migration(7, "checkpoints por bloco do backfill histórico", _m007_backfill_chunks),
+    Migration(8, "pontos intraday de cripto (bronze) e OHLC diário com VWAP (silver)", _m008_crypto_intraday),
+    Migration(9, "fila de ingestão por símbolo/janela para workers distribuídos", _m009_ingest_tasks),
+    Migration(10, "recálculo da silver FX e da gold com a fórmula CODE/BRL corrigida", _m010_fx_cross_rebuild,
+              embedded=True),
+    Migration(11, "flag is_trading_day na silver de índices (sem descarte pelo calendário)", _m011_index_trading_flag,
+              embedded=True),
+    Migration(12, "lake de origem por tarefa da fila de ingestão", _m012_task_lake_id, embedded=True),
+]
+
+def _ensure_migrations_table(conn: Connection):
+    if backend.is_embedded(conn):
+        conn.exec_driver_sql(f"""
+            CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+              version INT PRIMARY KEY,
+              description VARCHAR(200) NOT NULL,
+              applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )""")
+        return
+    conn.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+          version INT PRIMARY KEY,
+          description VARCHAR(200) NOT NULL,
+          applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""")
+
+def applied_versions(engine: Engine) -> set[int]:
+    with engine.begin() as conn:
+        _ensure_migrations_table(conn)
+        return set(conn.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}")).scalars().all())
+
+# ---------------- backends embarcados (DuckDB/SQLite) ----------------
+def _embedded_catalog(conn: Connection):
+    """Tabelas de controle do md_catalog no estado final das migrações (sem ENUM/AUTO_INCREMENT/ON UPDATE)."""
+    if backend.kind(conn) == "duckdb":
+        conn.exec_driver_sql("CREATE SEQUENCE IF NOT EXISTS md_catalog.ingestion_log_id")
+        conn.exec_driver_sql("CREATE SEQUENCE IF NOT EXISTS md_catalog.ingest_tasks_id")
+        log_id = "id BIGINT PRIMARY KEY DEFAULT nextval('md_catalog.ingestion_log_id')"
+        task_id = "id BIGINT PRIMARY KEY DEFAULT nextval('md_catalog.ingest_tasks_id')"
+    else:
+        log_id = "id INTEGER PRIMARY KEY AUTOINCREMENT"
+        task_id = log_id
+    metrics = "".join(f",\n  {col} {typ}" for col, typ in LOG_METRIC_COLUMNS)
+    conn.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS md_catalog.ingestion_log (
+          {log_id},
+          source_name VARCHAR(100) NOT NULL,
+          run_id CHAR(36) NOT NULL,
+          start_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          end_ts TIMESTAMP NULL,
+          status VARCHAR(10) NOT NULL,
+          rows_ingested BIGINT DEFAULT 0,
+          message TEXT{metrics}
+        )""")
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS md_catalog.watermarks (
+          source_name VARCHAR(100) PRIMARY KEY,
+          last_extracted_at TIMESTAMP NULL,
+          last_extracted_key VARCHAR(100) NULL
+        )""")
+    conn.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {BACKFILL_TABLE} (
+          source_name VARCHAR(50) NOT NULL,
+          symbol VARCHAR(100) NOT NULL,
+          chunk_start DATE NOT NULL,
+          chunk_end DATE NOT NULL,
+          status VARCHAR(10) NOT NULL,
+          rows_loaded INT DEFAULT 0,
+          attempts INT NOT NULL DEFAULT 1,
+          message TEXT,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          PRIMARY KEY (source_name, symbol, chunk_start, chunk_end)
+        )""")
+    conn.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {TASKS_TABLE} (
+          {task_id},
+          source_name VARCHAR(50) NOT NULL,
+          symbol VARCHAR(100) NOT NULL,
+          window_start DATE NOT NULL,
+          window_end DATE NOT NULL,
+          status VARCHAR(10) NOT NULL DEFAULT 'PENDING',
+          attempts INT NOT NULL DEFAULT 0,
+          max_attempts INT NOT NULL DEFAULT 5,
+          lease_owner VARCHAR(200) NULL,
+          lake_id VARCHAR(36) NULL,
+          available_at TIMESTAMP NOT NULL,
+          rows_loaded INT DEFAULT 0,
+          message TEXT,
+          created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          UNIQUE (source_name, symbol, window_start, window_end)
+        )""")
+
+def _add_missing_columns(conn: Connection, t: Table):
+    # CREATE TABLE IF NOT EXISTS não altera tabela existente: colunas novas em TABLES entram por ALTER
+    schema, table = _split(t.name)
+    existing = {c["name"] for c in inspect(conn).get_columns(table, schema=schema)}
+    for c, typ in t.columns:
+        if c not in existing:
+            conn.exec_driver_sql(f"ALTER TABLE {t.name} ADD COLUMN {backend.quote(conn, c)} {typ}")
+            logger.info(f"Schema: coluna {c} em {t.name}")
+
+def _migrate_embedded(engine: Engine) -> list[int]:
+    """Banco embarcado nasce no estado final: catálogo + tabelas de TABLES (idempotente) e as versões
+    registradas como aplicadas; só as migrações `embedded` rodam. Sem índices secundários no DuckDB (índice
+    ART em coluna atualizada impede o ON CONFLICT DO UPDATE)."""
+    done = applied_versions(engine)
+    with engine.begin() as conn:
+        _embedded_catalog(conn)
+        for t in _tables():
+            if backend.is_lake_view(conn, t.name):
+                backend.refresh_lake_view(conn, t.name)
+                continue
+            conn.exec_driver_sql(create_sql(t, embedded=True))
+            _add_missing_columns(conn, t)
+            if backend.kind(conn) == "sqlite":
+                schema, table = _split(t.name)
+                for name, cols in t.indexes:
+                    conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {schema}.{name} ON {table} "
+                                         f"({', '.join(backend.quote(conn, c) for c in cols)})")
+        pending = [m for m in MIGRATIONS if m.version not in done]
+        for m in pending:
+            if m.embedded:
+                m.apply(conn)
+            conn.execute(text(f"INSERT INTO {MIGRATIONS_TABLE} (version, description) VALUES (:v, :d)"),
+                         {"v": m.version, "d": m.description})
+    if pending:
+        logger.info(f"Schema ({backend.kind(engine)}): criado no estado da migração {max(m.version for m in MIGRATIONS):03d}")
+    return [m.version for m in pending]
+
+def migrate(engine: Engine, partition: bool | None = None) -> list[int]:
+    """Aplica as migrações pendentes em ordem (DDL faz commit implícito: cada uma é registrada ao terminar)."""
+    if backend.is_embedded(engine):
+        return _migrate_embedded(engine)
+    partition = DB_PARTITION_BY_YEAR if partition is None else partition
+    done = applied_versions(engine)
+    applied = []
+    for m in sorted(MIGRATIONS, key=lambda m: m.version):
+        if m.version in done:
+            continue
+        logger.info(f"Schema: migração {m.version:03d} — {m.description}")
+        with engine.begin() as conn:
+            m.apply(conn)
+            conn.execute(text(f"INSERT INTO {MIGRATIONS_TABLE} (version, description) VALUES (:v, :d)"),
+                         {"v": m.version, "d": m.description})
+        applied.append(m.version)
+    if partition:
+        with engine.begin() as conn:
+            for t in _tables():
+                ensure_partitions(conn, t)
+    return applied
+
+_schema_lock = threading.Lock()
+_schema_ready: set[str] = set()
+
+def ensure_schema(engine: Engine):
+    # Uma vez por processo e banco (o runner in-process chama antes do DAG; os módulos avulsos na 1ª escrita;
+    # o etl.common.sync abre o destino MariaDB além do backend local)
+    with _schema_lock:
+        url = str(engine.url)
+        if url not in _schema_ready:
+            migrate(engine)
+            _schema_ready.add(url)
+
+def main(argv=None):
+    from .db import get_engine
+    ap = argparse.ArgumentParser(description="Migrações do schema md_bronze/md_silver/md_gold")
+    ap.add_argument("--status", action="store_true", help="só mostra as migrações aplicadas/pendentes")
+    ap.add_argument("--partition", action="store_true", help="particiona as tabelas diárias por ano (DB_PARTITION_BY_YEAR)")
+    args = ap.parse_args(argv)
+    eng = get_engine()
+    if args.status:
+        done = applied_versions(eng)
+        for m in MIGRATIONS:
+            print(f"{m.version:03d} {'OK      ' if m.version in done else 'PENDENTE'} {m.description}")
+        return
+    applied = migrate(eng, partition=args.partition or None)
+    logger.success(f"Schema atualizado ({len(applied)} migração(ões) aplicada(s)).")
+
+if __name__ == "__main__":
+    main()
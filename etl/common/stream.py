@@ -0,0 +1,99 @@
+# etl/common/stream.py
+# Partições (faixas de datas ou grupos de séries) dimensionadas por ETL_MEMORY_BUDGET_MB para as etapas silver/gold.
+from collections.abc import Callable
+from datetime import date, timedelta
+import pandas as pd
+from sqlalchemy.engine import Engine
+from loguru import logger
+from .env import ETL_MEMORY_BUDGET_MB
+from .db import bind
+from .backend import LAKE_SOURCES
+from .watermark import set_watermark, merge_lasts, low_watermark, log_lag, watermark_key
+from . import bronze_input
+
+# Estimativa de bytes por linha de um frame típico (data + 1-2 strings curtas + floats) e de cópias de trabalho
+# que uma transformação mantém vivas ao mesmo tempo (leitura, colunas derivadas, concat, lote do upsert)
+ROW_BYTES = 200
+WORKING_COPIES = 4
+MIN_CHUNK_ROWS = 1_000
+# Limite superior das faixas de data: a última partição fica aberta (pega o que chegar depois da contagem)
+OPEN_END = date(9999, 12, 31)
+
+def chunk_rows(row_bytes: int = ROW_BYTES, copies: int = WORKING_COPIES) -> int | None:
+    """Linhas por partição que cabem no orçamento; None = sem limite (ETL_MEMORY_BUDGET_MB=0)."""
+    if ETL_MEMORY_BUDGET_MB <= 0:
+        return None
+    return max(MIN_CHUNK_ROWS, int(ETL_MEMORY_BUDGET_MB * 2**20 / (row_bytes * copies)))
+
+def pack(counts: pd.Series, max_rows: int | None) -> list[list]:
+    """counts (chave ordenada -> nº de linhas) -> grupos consecutivos de chaves com até max_rows linhas.
+    Uma chave sozinha acima do limite vira um grupo próprio (não dá para partir uma data/série)."""
+    if counts.empty:
+        return []
+    if not max_rows:
+        return [list(counts.index)]
+    groups, cur, size = [], [], 0
+    for key, n in counts.items():
+        if cur and size + n > max_rows:
+            groups.append(cur)
+            cur, size = [], 0
+        cur.append(key)
+        size += int(n)
+    groups.append(cur)
+    return groups
+
+def _counts(engine: Engine, tables: str | list[str], col: str, where: str, params: dict) -> pd.Series:
+    tables = [tables] if isinstance(tables, str) else tables
+    union = " UNION ALL ".join(f"SELECT {col} AS k, COUNT(*) AS n FROM {t} WHERE {where} GROUP BY {col}"
+                               for t in tables)
+    # pd.read_sql direto: a contagem não entra nas linhas lidas da telemetria
+    df = pd.read_sql(bind(union, params), engine, params=params)
+    return df.groupby("k")["n"].sum().sort_index()
+
+def date_partitions(engine: Engine, tables: str | list[str], start: date, max_rows: int | None = None,
+                    date_col: str = "date") -> list[tuple[date, date]]:
+    """Faixas [lo, hi] contíguas de `start` em diante com até max_rows linhas (somando `tables`).
+
+    As faixas cobrem todo o intervalo (sem buracos entre datas contadas) e a última é aberta, então
+    tabelas auxiliares com outro calendário (ex.: PTAX vs. ECB) caem sempre em alguma partição."""
+    names = [tables] if isinstance(tables, str) else tables
+    if bronze_input.from_lake() and all(t in LAKE_SOURCES for t in names):
+        # Silver lendo do lake: a contagem sai do manifest do lake, não do banco
+        counts = bronze_input.date_counts(names, start)
+    else:
+        counts = _counts(engine, tables, date_col, f"{date_col} >= %(start)s", {"start": start})
+    if counts.empty:
+        return []
+    counts.index = pd.to_datetime(counts.index).date
+    groups = pack(counts, max_rows)
+    out, lo = [], start
+    for g in groups[:-1]:
+        out.append((lo, g[-1]))
+        lo = g[-1] + timedelta(days=1)
+    out.append((lo, OPEN_END))
+    if len(out) > 1:
+        logger.info(f"Streaming: {int(counts.sum()):,} linhas de {tables} em {len(out)} faixas de data")
+    return out
+
+def key_partitions(engine: Engine, table: str, key_col: str, start: date, max_rows: int | None = None,
+                   date_col: str = "date") -> list[tuple]:
+    """Grupos de séries (valores de key_col) com até max_rows linhas de `start` em diante, para
+    transformações que precisam do histórico contínuo de cada série (janelas móveis, rollups)."""
+    counts = _counts(engine, table, key_col, f"{date_col} >= %(start)s", {"start": start})
+    groups = [tuple(g) for g in pack(counts, max_rows)]
+    if len(groups) > 1:
+        logger.info(f"Streaming: {int(counts.sum()):,} linhas de {table} em {len(groups)} grupos de séries")
+    return groups
+
+def run_ranges(engine: Engine, checkpoint: tuple[str, str], parts: list[tuple[date, date]],
+               step: Callable[[date, date], tuple[int, dict]]) -> int:
+    """Roda step(lo, hi) -> (linhas gravadas, última data lida por série de entrada) em cada faixa; devolve o
+    total de linhas. O checkpoint é o da série mais atrasada (watermark.low_watermark)."""
+    total, lasts = 0, {}
+    for lo, hi in parts:
+        n, seen = step(lo, hi)
+        # Faixas em ordem crescente: o checkpoint avança a cada uma e uma falha retoma da última gravada
+        set_watermark(engine, *checkpoint, low_watermark(merge_lasts(lasts, seen)))
+        total += n
+    log_lag(watermark_key(*checkpoint), lasts)
+    return total
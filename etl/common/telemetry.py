@@ -0,0 +1,237 @@
+# etl/common/telemetry.py
+# Telemetria por etapa em md_catalog.ingestion_log, com export JSON e textfile do Prometheus.
+import contextvars, copy, json, os, threading, time, uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from loguru import logger
+from .env import METRICS_DIR
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LOG_TABLE = "md_catalog.ingestion_log"
+# Alerta quando a etapa leva mais que REGRESSION_FACTOR × a mediana das últimas REGRESSION_HISTORY execuções
+REGRESSION_FACTOR = 2.0
+REGRESSION_HISTORY = 10
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    # ru_maxrss: KB no Linux (pico do processo, compartilhado entre etapas em paralelo)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+@dataclass
+class StageMetrics:
+    stage: str
+    run_id: str
+    started_at: float = field(default_factory=time.time)
+    status: str = "STARTED"
+    wall_seconds: float = 0.0
+    rows_in: int = 0
+    rows_out: int = 0
+    bytes_downloaded: int = 0
+    http_requests: int = 0
+    http_seconds: float = 0.0
+    db_write_seconds: float = 0.0
+    peak_rss_mb: float = 0.0
+    http_hosts: dict = field(default_factory=dict)   # host -> {requests, seconds, max_seconds, bytes}
+    message: str = ""
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def to_dict(self) -> dict:
+        return {f.name: copy.deepcopy(getattr(self, f.name)) for f in fields(self) if f.name != "_lock"}
+
+_current: contextvars.ContextVar[StageMetrics | None] = contextvars.ContextVar("etl_stage", default=None)
+_run_id = uuid.uuid4().hex
+_finished: list[StageMetrics] = []
+_finished_lock = threading.Lock()
+
+def run_id() -> str:
+    return _run_id
+
+def new_run() -> str:
+    global _run_id
+    _run_id = uuid.uuid4().hex
+    with _finished_lock:
+        _finished.clear()
+    return _run_id
+
+def current() -> StageMetrics | None:
+    return _current.get()
+
+# ---------------- hooks (no-op fora de uma etapa) ----------------
+def record_http(host: str, seconds: float, nbytes: int):
+    m = _current.get()
+    if m is None:
+        return
+    with m._lock:
+        m.http_requests += 1
+        m.http_seconds += seconds
+        m.bytes_downloaded += nbytes
+        h = m.http_hosts.setdefault(host, {"requests": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0})
+        h["requests"] += 1
+        h["seconds"] += seconds
+        h["max_seconds"] = max(h["max_seconds"], seconds)
+        h["bytes"] += nbytes
+
+def record_db_write(seconds: float, rows: int):
+    m = _current.get()
+    if m is None:
+        return
+    with m._lock:
+        m.db_write_seconds += seconds
+        m.rows_out += rows
+
+def record_rows_in(rows: int):
+    m = _current.get()
+    if m is None:
+        return
+    with m._lock:
+        m.rows_in += rows
+
+# ---------------- md_catalog.ingestion_log ----------------
+def _log_start(m: StageMetrics) -> int | None:
+    from .db import get_engine
+    from sqlalchemy import text
+    from .backend import is_embedded
+    try:
+        eng = get_engine()
+        sql = (f"INSERT INTO {LOG_TABLE} (source_name, run_id, start_ts, status) "
+               f"VALUES (:s, :r, :ts, 'STARTED')")
+        # DuckDB não expõe lastrowid: os backends embarcados devolvem o id pelo RETURNING
+        embedded = is_embedded(eng)
+        with eng.begin() as conn:
+            res = conn.execute(text(sql + (" RETURNING id" if embedded else "")),
+                               {"s": m.stage, "r": m.run_id, "ts": datetime.fromtimestamp(m.started_at)})
+            return res.scalar_one() if embedded else res.lastrowid
+    except Exception as exc:
+        logger.warning(f"Telemetria: não foi possível registrar início de {m.stage}: {exc}")
+        return None
+
+def _log_end(m: StageMetrics, row_id: int | None):
+    from .db import get_engine
+    from sqlalchemy import text
+    if row_id is None:
+        return
+    try:
+        with get_engine().begin() as conn:
+            conn.execute(text(f"""
+                UPDATE {LOG_TABLE} SET end_ts = :end_ts, status = :status, rows_ingested = :rows_out,
+                  rows_in = :rows_in, bytes_downloaded = :bytes, http_requests = :http_requests,
+                  http_seconds = :http_seconds, db_write_seconds = :db_seconds, wall_seconds = :wall,
+                  peak_rss_mb = :rss, metrics_json = :metrics, message = :message
+                WHERE id = :id"""),
+                {"end_ts": datetime.now(), "status": m.status, "rows_out": m.rows_out, "rows_in": m.rows_in,
+                 "bytes": m.bytes_downloaded, "http_requests": m.http_requests, "http_seconds": m.http_seconds,
+                 "db_seconds": m.db_write_seconds, "wall": m.wall_seconds, "rss": m.peak_rss_mb,
+                 "metrics": json.dumps({"http_hosts": m.http_hosts}), "message": m.message[:2000],
+                 "id": row_id})
+    except Exception as exc:
+        logger.warning(f"Telemetria: não foi possível registrar fim de {m.stage}: {exc}")
+
+@contextmanager
+def stage(name: str, persist: bool = True):
+    """Instrumenta uma etapa: métricas acumuladas via hooks de HTTP/DB e gravadas no ingestion_log ao final."""
+    m = StageMetrics(name, _run_id)
+    token = _current.set(m)
+    row_id = _log_start(m) if persist else None
+    t0 = time.perf_counter()
+    try:
+        yield m
+        m.status = "SUCCESS"
+    except Exception as exc:
+        m.status = "FAILED"
+        m.message = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        _current.reset(token)
+        m.wall_seconds = time.perf_counter() - t0
+        m.peak_rss_mb = peak_rss_mb()
+        with _finished_lock:
+            _finished.append(m)
+        if persist:
+            _log_end(m, row_id)
+        logger.debug(f"[{name}] {m.wall_seconds:.1f}s, in={m.rows_in} out={m.rows_out}, "
+                     f"http={m.http_requests} ({m.bytes_downloaded / 1e6:.1f} MB, {m.http_seconds:.1f}s), "
+                     f"db={m.db_write_seconds:.1f}s, rss={m.peak_rss_mb:.0f} MB")
+
+def finished() -> list[StageMetrics]:
+    with _finished_lock:
+        return list(_finished)
+
+# ---------------- export ----------------
+def _prom_escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"')
+
+def _prom_labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_prom_escape(v)}"' for k, v in labels.items()) + "}"
+
+def prometheus_text(stages: list[StageMetrics]) -> str:
+    gauges = [
+        ("etl_stage_duration_seconds", "Tempo de parede da etapa", lambda m: m.wall_seconds),
+        ("etl_stage_success", "1 se a etapa terminou com sucesso", lambda m: int(m.status == "SUCCESS")),
+        ("etl_stage_rows_in", "Linhas lidas do banco/lake", lambda m: m.rows_in),
+        ("etl_stage_rows_out", "Linhas gravadas", lambda m: m.rows_out),
+        ("etl_stage_bytes_downloaded", "Bytes baixados via HTTP", lambda m: m.bytes_downloaded),
+        ("etl_stage_db_write_seconds", "Tempo de escrita no banco", lambda m: m.db_write_seconds),
+        ("etl_stage_peak_rss_bytes", "Pico de RSS do processo ao fim da etapa", lambda m: m.peak_rss_mb * 1024 * 1024),
+    ]
+    lines = []
+    for metric, help_, fn in gauges:
+        lines += [f"# HELP {metric} {help_}", f"# TYPE {metric} gauge"]
+        lines += [f"{metric}{_prom_labels(stage=m.stage)} {fn(m)}" for m in stages]
+    lines += ["# HELP etl_http_requests Requisições HTTP por host", "# TYPE etl_http_requests gauge"]
+    lines += [f"etl_http_requests{_prom_labels(stage=m.stage, host=h)} {v['requests']}"
+              for m in stages for h, v in m.http_hosts.items()]
+    lines += ["# HELP etl_http_seconds Soma da latência HTTP por host", "# TYPE etl_http_seconds gauge"]
+    lines += [f"etl_http_seconds{_prom_labels(stage=m.stage, host=h)} {v['seconds']}"
+              for m in stages for h, v in m.http_hosts.items()]
+    lines += ["# HELP etl_run_timestamp_seconds Fim da última execução", "# TYPE etl_run_timestamp_seconds gauge",
+              f"etl_run_timestamp_seconds {time.time()}"]
+    return "\n".join(lines) + "\n"
+
+def export(stages: list[StageMetrics] | None = None, out_dir: str = METRICS_DIR) -> tuple[str, str]:
+    """Grava run_<run_id>.json (resumo) e etl.prom (textfile do Prometheus, sobrescrito a cada execução)."""
+    stages = finished() if stages is None else stages
+    os.makedirs(out_dir, exist_ok=True)
+    json_path = os.path.join(out_dir, f"run_{_run_id}.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"run_id": _run_id, "finished_at": datetime.now().isoformat(timespec="seconds"),
+                   "stages": [m.to_dict() for m in stages]}, f, indent=1, default=str)
+    prom_path = os.path.join(out_dir, "etl.prom")
+    tmp = f"{prom_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text(stages))
+    os.replace(tmp, prom_path)   # o collector nunca lê arquivo pela metade
+    return json_path, prom_path
+
+def check_regressions(stages: list[StageMetrics] | None = None, factor: float = REGRESSION_FACTOR,
+                      history: int = REGRESSION_HISTORY) -> list[str]:
+    """Compara o tempo de cada etapa com a mediana das últimas execuções bem-sucedidas no ingestion_log."""
+    from .db import get_engine
+    from sqlalchemy import text
+    stages = finished() if stages is None else stages
+    alerts = []
+    try:
+        with get_engine().connect() as conn:
+            for m in stages:
+                if m.status != "SUCCESS":
+                    continue
+                past = conn.execute(text(f"""
+                    SELECT wall_seconds FROM {LOG_TABLE}
+                    WHERE source_name = :s AND status = 'SUCCESS' AND run_id <> :r AND wall_seconds IS NOT NULL
+                    ORDER BY id DESC LIMIT :n"""), {"s": m.stage, "r": m.run_id, "n": history}).scalars().all()
+                if len(past) < 3:
+                    continue
+                median = sorted(past)[len(past) // 2]
+                if median > 0 and m.wall_seconds > factor * median:
+                    alerts.append(f"{m.stage}: {m.wall_seconds:.1f}s vs mediana {median:.1f}s "
+                                  f"(últimas {len(past)} execuções)")
+    except Exception as exc:
+        logger.warning(f"Telemetria: comparação com histórico indisponível: {exc}")
+    for a in alerts:
+        logger.warning(f"Regressão de desempenho — {a}")
+    return alerts
@@ -0,0 +1,163 @@
+# etl/common/trading_calendar.py
+# Calendário de negociação compartilhado: feriados/dias úteis por mercado, a dimensão dim_date
+# e o alinhamento as-of (última observação até a data) usado pela silver em vez de merges ad hoc.
+from datetime import date, timedelta
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Mercados conhecidos:
+#   BR     — dias úteis bancários nacionais (PTAX/BACEN, B3)
+#   ECB    — TARGET2 (taxas de referência do ECB)
+#   US     — NYSE (índices americanos)
+#   CRYPTO — todos os dias
+MARKETS = ("BR", "ECB", "US", "CRYPTO")
+# Maior distância (dias corridos) aceita entre a data alvo e a observação usada no as-of
+MAX_STALENESS_DAYS = 7
+
+def easter(year: int) -> date:
+    # Algoritmo de Meeus/Jones/Butcher (calendário gregoriano)
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return date(year, month, day)
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    # n-ésimo (n>0) ou último (n=-1) dia da semana `weekday` (0=segunda) do mês
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = (date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1))
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+def _observed(d: date) -> date:
+    # NYSE: feriado no sábado -> sexta; no domingo -> segunda
+    if d.weekday() == 5:
+        return d - timedelta(days=1)
+    if d.weekday() == 6:
+        return d + timedelta(days=1)
+    return d
+
+def _us_new_year(year: int) -> list[date]:
+    # Exceção da NYSE: Ano Novo no sábado não é compensado na sexta 31/12 (o pregão do ano anterior abre)
+    d = date(year, 1, 1)
+    return [] if d.weekday() == 5 else [_observed(d)]
+
+def _holidays_year(market: str, year: int) -> list[date]:
+    e = easter(year)
+    if market == "BR":
+        out = [date(year, 1, 1), e - timedelta(days=48), e - timedelta(days=47),   # carnaval
+               e - timedelta(days=2), date(year, 4, 21), date(year, 5, 1),
+               e + timedelta(days=60),                                              # Corpus Christi
+               date(year, 9, 7), date(year, 10, 12), date(year, 11, 2), date(year, 11, 15),
+               date(year, 12, 25)]
+        if year >= 2024:
+            out.append(date(year, 11, 20))                                          # Consciência Negra
+        return out
+    if market == "ECB":
+        return [date(year, 1, 1), e - timedelta(days=2), e + timedelta(days=1),
+                date(year, 5, 1), date(year, 12, 25), date(year, 12, 26)]
+    if market == "US":
+        out = [*_us_new_year(year), _nth_weekday(year, 1, 0, 3), _nth_weekday(year, 2, 0, 3),
+               e - timedelta(days=2), _nth_weekday(year, 5, 0, -1), _observed(date(year, 7, 4)),
+               _nth_weekday(year, 9, 0, 1), _nth_weekday(year, 11, 3, 4), _observed(date(year, 12, 25))]
+        if year >= 2022:
+            out.append(_observed(date(year, 6, 19)))                                # Juneteenth
+        return out
+    if market == "CRYPTO":
+        return []
+    raise ValueError(f"Mercado desconhecido: {market} (use {', '.join(MARKETS)})")
+
+@lru_cache(maxsize=64)
+def _holidays_range(market: str, first_year: int, last_year: int) -> pd.DatetimeIndex:
+    days = [d for y in range(first_year, last_year + 1) for d in _holidays_year(market, y)]
+    return pd.DatetimeIndex(sorted(set(days)))
+
+def holidays(market: str, start, end) -> pd.DatetimeIndex:
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    h = _holidays_range(market, start.year, end.year)
+    return h[(h >= start) & (h <= end)]
+
+def business_days(market: str, start, end) -> pd.DatetimeIndex:
+    """Dias de negociação do mercado em [start, end]."""
+    if market == "CRYPTO":
+        return pd.date_range(start, end, freq="D")
+    return pd.bdate_range(start, end, freq="C", holidays=list(holidays(market, start, end)))
+
+def is_business_day(market: str, dates) -> np.ndarray:
+    d = pd.DatetimeIndex(pd.to_datetime(dates)).normalize()
+    if market == "CRYPTO" or len(d) == 0:
+        return np.ones(len(d), dtype=bool)
+    return (d.dayofweek < 5) & ~d.isin(holidays(market, d.min(), d.max()))
+
+def dim_date(start, end) -> pd.DataFrame:
+    """Dimensão de datas com atributos de calendário e flags de dia útil por mercado."""
+    d = pd.date_range(start, end, freq="D")
+    iso = d.isocalendar()
+    out = pd.DataFrame({
+        "date": d.date,
+        "year": d.year, "quarter": d.quarter, "month": d.month, "day": d.day,
+        "year_month": d.strftime("%Y-%m"),
+        "iso_year": iso["year"].to_numpy(), "iso_week": iso["week"].to_numpy(),
+        "day_of_week": d.dayofweek + 1,                      # 1 = segunda
+        "is_weekend": d.dayofweek >= 5,
+    })
+    for m in MARKETS:
+        if m != "CRYPTO":
+            out[f"is_business_{m.lower()}"] = is_business_day(m, d)
+    return out
+
+# ---------------- alinhamento as-of ----------------
+def asof_align(targets, obs: pd.DataFrame, value_cols: list[str], by: str | None = None,
+               date_col: str = "date", max_staleness_days: int | None = MAX_STALENESS_DAYS) -> pd.DataFrame:
+    """Para cada data alvo (e série `by`), a última observação de `obs` com data <= alvo.
+
+    targets: datas (array-like) ou DataFrame com `date_col` (e `by`). Devolve os alvos com `value_cols` e
+    `asof_date` (data da observação usada); observações mais velhas que max_staleness_days viram NaN.
+    """
+    if isinstance(targets, pd.DataFrame):
+        left = targets.copy()
+    else:
+        left = pd.DataFrame({date_col: targets})
+    left["_t"] = pd.to_datetime(left[date_col])
+    right = obs[[*([by] if by else []), date_col, *value_cols]].copy()
+    right["_t"] = pd.to_datetime(right[date_col])
+    right = right.rename(columns={date_col: "asof_date"}).dropna(subset=value_cols, how="all")
+    left["_order"] = np.arange(len(left))
+    tol = pd.Timedelta(days=max_staleness_days) if max_staleness_days is not None else None
+    out = pd.merge_asof(left.sort_values("_t"), right.sort_values("_t"), on="_t", by=by,
+                        direction="backward", tolerance=tol)
+    out["asof_date"] = pd.to_datetime(out["asof_date"]).dt.date
+    return out.sort_values("_order").drop(columns=["_t", "_order"]).reset_index(drop=True)
+
+def asof_frame(targets, wide: pd.DataFrame, max_staleness_days: int | None = MAX_STALENESS_DAYS) -> pd.DataFrame:
+    """wide (índice = data, uma coluna por série) reamostrado nas datas alvo pela última linha <= alvo:
+    um searchsorted nos arrays ordenados + take, para todas as colunas de uma vez."""
+    t = pd.DatetimeIndex(pd.to_datetime(targets)).values
+    if wide.empty:
+        # Sem observações na janela (ex.: PTAX vazia): tudo NaN, como o merge à esquerda fazia
+        return pd.DataFrame(np.nan, index=pd.DatetimeIndex(t), columns=wide.columns, dtype="float64")
+    wide = wide.sort_index()
+    idx = pd.DatetimeIndex(pd.to_datetime(wide.index)).values
+    pos = np.searchsorted(idx, t, side="right") - 1
+    ok = pos >= 0
+    if max_staleness_days is not None:
+        ok &= (t - idx[np.maximum(pos, 0)]) <= np.timedelta64(max_staleness_days, "D")
+    vals = wide.to_numpy("float64")[np.maximum(pos, 0)]
+    vals[~ok] = np.nan
+    return pd.DataFrame(vals, index=pd.DatetimeIndex(t), columns=wide.columns)
+
+def asof_series(targets, obs: pd.Series, max_staleness_days: int | None = MAX_STALENESS_DAYS) -> np.ndarray:
+    """Versão para uma série indexada por data."""
+    return asof_frame(targets, obs.dropna().to_frame(), max_staleness_days).iloc[:, 0].to_numpy()
+
+def lookback_start(start, days: int = MAX_STALENESS_DAYS) -> date:
+    # Início da leitura para que o as-of das primeiras datas da janela tenha observação anterior
+    return pd.Timestamp(start).date() - timedelta(days=days)
@@ -0,0 +1,112 @@
+from datetime import date, datetime, timedelta
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from loguru import logger
+from .env import START_DATE, WATERMARK_OVERLAP_DAYS, WATERMARK_MAX_LAG_DAYS, FULL_REFRESH
+from .backend import upsert_sql
+
+WATERMARK_TABLE = "md_catalog.watermarks"
+
+def watermark_key(source: str, symbol: str | None = None) -> str:
+    # Um watermark por fonte/símbolo: "ecb:USD", "yahoo:^bvsp", "bacen_ptax"...
+    return f"{source}:{symbol}" if symbol else source
+
+def get_watermark(engine: Engine, source: str, symbol: str | None = None) -> date | None:
+    sql = f"SELECT last_extracted_key FROM {WATERMARK_TABLE} WHERE source_name = :name"
+    with engine.connect() as conn:
+        row = conn.execute(text(sql), {"name": watermark_key(source, symbol)}).fetchone()
+    if not row or not row[0]:
+        return None
+    return pd.to_datetime(row[0]).date()
+
+def set_watermark(engine: Engine, source: str, symbol: str | None, last_date) -> None:
+    if last_date is None or pd.isna(last_date):
+        return
+    key = pd.to_datetime(last_date).date().isoformat()
+    # last_extracted_key guarda a data ISO; só troca por uma maior (não retrocede com reprocessamentos parciais)
+    sql = upsert_sql(engine, WATERMARK_TABLE, ["source_name", "last_extracted_at", "last_extracted_key"],
+                     ["source_name"], {
+                         "last_extracted_at": "{new}",
+                         "last_extracted_key": "CASE WHEN {new} > COALESCE({old}, '') THEN {new} ELSE {old} END",
+                     })
+    with engine.begin() as conn:
+        conn.execute(text(sql), {"source_name": watermark_key(source, symbol),
+                                 "last_extracted_at": datetime.utcnow(), "last_extracted_key": key})
+    logger.debug(f"Watermark {watermark_key(source, symbol)} -> {key}")
+
+def rewind_watermark(engine: Engine, source: str, symbol: str | None, before) -> None:
+    """Recua o checkpoint para antes de `before` (nunca avança): a próxima execução reprocessa desde lá."""
+    key = (pd.to_datetime(before).date() - timedelta(days=1)).isoformat()
+    sql = f"""
+        UPDATE {WATERMARK_TABLE}
+        SET last_extracted_key = CASE WHEN last_extracted_key < :key THEN last_extracted_key ELSE :key END
+        WHERE source_name = :name
+    """
+    with engine.begin() as conn:
+        conn.execute(text(sql), {"name": watermark_key(source, symbol), "key": key})
+    logger.debug(f"Watermark {watermark_key(source, symbol)} recuado para <= {key}")
+
+def set_watermarks(engine: Engine, source: str, df: pd.DataFrame,
+                   symbol_col: str | None = None, date_col: str = "date") -> None:
+    # Avança os watermarks a partir do que foi efetivamente carregado
+    if df is None or df.empty:
+        return
+    if symbol_col is None:
+        set_watermark(engine, source, None, df[date_col].max())
+        return
+    for symbol, last_date in df.groupby(symbol_col)[date_col].max().items():
+        set_watermark(engine, source, symbol, last_date)
+
+def series_lasts(df: pd.DataFrame, key_col: str | None = None, name: str = "", date_col: str = "date") -> dict:
+    """Última data de cada série de entrada de uma etapa ({série: data}); sem key_col o frame é a série `name`.
+    Com key_col, `name` prefixa as séries (várias tabelas na mesma etapa)."""
+    if df is None or df.empty:
+        return {}
+    if key_col is None:
+        return {name: df[date_col].max()}
+    return {f"{name}{k}": d for k, d in df.groupby(key_col)[date_col].max().items()}
+
+def merge_lasts(acc: dict, lasts: dict) -> dict:
+    for k, d in lasts.items():
+        if d is None or pd.isna(d):
+            continue
+        d = pd.to_datetime(d).date()
+        acc[k] = max(acc.get(k, d), d)
+    return acc
+
+def low_watermark(lasts: dict, max_lag_days: int = WATERMARK_MAX_LAG_DAYS) -> date | None:
+    """Checkpoint de uma etapa com várias séries de entrada: a última data da mais atrasada, para que as linhas
+    que ela entregar depois ainda caiam na janela. Séries paradas há mais de max_lag_days não seguram o checkpoint."""
+    if not lasts:
+        return None
+    lead = max(lasts.values())
+    return min(d for d in lasts.values() if (lead - d).days <= max_lag_days)
+
+def _names(keys: list[str], limit: int = 5) -> str:
+    return ", ".join(keys[:limit]) + (f" (+{len(keys) - limit})" if len(keys) > limit else "")
+
+def log_lag(stage: str, lasts: dict, max_lag_days: int = WATERMARK_MAX_LAG_DAYS) -> None:
+    # Atraso dentro do overlap (fim de semana, feriado de um mercado) é o normal e não é logado
+    if not lasts:
+        return
+    lead, low = max(lasts.values()), low_watermark(lasts, max_lag_days)
+    if (lead - low).days > WATERMARK_OVERLAP_DAYS:
+        held = sorted(k for k, d in lasts.items() if d == low)
+        logger.info(f"{stage}: checkpoint em {low} por {_names(held)} (demais séries até {lead})")
+    stale = sorted(k for k, d in lasts.items() if (lead - d).days > max_lag_days)
+    if stale:
+        logger.warning(f"{stage}: {_names(stale)} sem dados há mais de {max_lag_days} dias; não seguram o "
+                       f"checkpoint (linhas que chegarem antes de {low} precisam de backfill ou FULL_REFRESH)")
+
+def incremental_start(engine: Engine, source: str, symbol: str | None = None,
+                      overlap_days: int | None = None) -> date:
+    """Início da janela a buscar: watermark - overlap, nunca antes de START_DATE."""
+    floor = pd.to_datetime(START_DATE).date()
+    if FULL_REFRESH:
+        return floor
+    wm = get_watermark(engine, source, symbol)
+    if wm is None:
+        return floor
+    overlap = WATERMARK_OVERLAP_DAYS if overlap_days is None else int(overlap_days)
+    return max(floor, wm - timedelta(days=overlap))
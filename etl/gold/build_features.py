@@ -0,0 +1,167 @@
+# etl/gold/build_features.py
+# Features por série (log-retorno, volatilidade, SMA/EMA, drawdown) e correlação móvel entre séries.
+from collections.abc import Iterator
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from loguru import logger
+from etl.common.db import get_engine, upsert, read_sql
+from etl.common.watermark import incremental_start, set_watermark, series_lasts, merge_lasts, low_watermark, log_lag
+from etl.common.stream import chunk_rows, key_partitions
+
+CHECKPOINT = ("gold", "features")
+FEATURES_TABLE = "md_gold.fact_series_features"
+CORR_TABLE = "md_gold.fact_correlation"
+
+VOL_WINDOWS = (20, 60)
+SMA_WINDOWS = (20, 50, 200)
+EMA_SPANS = (12, 26)
+CORR_WINDOW = 60
+CORR_MIN_PERIODS = 40
+# Dias de pregão por ano para anualizar a volatilidade (cripto negocia todo dia)
+ANNUALIZATION = {"fx": 252, "index": 252, "crypto": 365}
+
+# asset_class -> (fato diário, coluna da série, coluna de fechamento)
+SERIES = {
+    "fx": ("md_gold.fact_fx_daily", "currency_pair", "rate_close"),
+    "crypto": ("md_gold.fact_crypto_daily", "asset_symbol", "price_close"),
+    "index": ("md_gold.fact_index_daily", "index_code", "close_price"),
+}
+
+def warmup_days() -> int:
+    # Dias corridos que cobrem a maior janela em dias úteis (+ folga para feriados)
+    return int(max(*SMA_WINDOWS, *VOL_WINDOWS, CORR_WINDOW) * 7 / 5) + 15
+
+def read_closes(eng, since, asset_class: str, keys: tuple) -> pd.DataFrame:
+    """(asset_class, series_code, date, close) das séries `keys` de uma classe, desde `since`."""
+    table, key, close = SERIES[asset_class]
+    df = read_sql(f"SELECT date, {key} AS series_code, {close} AS close FROM {table} "
+                  f"WHERE date >= %(since)s AND {key} IN %(keys)s", eng, params={"since": since, "keys": keys})
+    df = df.assign(asset_class=asset_class).dropna(subset=["close"])
+    df["date"] = pd.to_datetime(df["date"])
+    return df.sort_values(["asset_class", "series_code", "date"], ignore_index=True)
+
+def read_state(eng, before) -> pd.DataFrame:
+    """Última linha de features antes de `before` por série: sementes das EMAs e do pico (asof = data dela)."""
+    ema_cols = ", ".join(f"f.ema_{s}" for s in EMA_SPANS)
+    q = f"""
+        SELECT f.asset_class, f.series_code, f.date AS asof, {ema_cols}, f.peak
+        FROM {FEATURES_TABLE} f
+        JOIN (SELECT asset_class, series_code, MAX(date) AS d FROM {FEATURES_TABLE}
+              WHERE date < %(before)s GROUP BY asset_class, series_code) m
+          ON f.asset_class = m.asset_class AND f.series_code = m.series_code AND f.date = m.d
+    """
+    state = read_sql(q, eng, params={"before": before})
+    state["asof"] = pd.to_datetime(state["asof"])
+    return state
+
+def compute_features(closes: pd.DataFrame, state: pd.DataFrame | None = None) -> pd.DataFrame:
+    """closes (asset_class, series_code, date, close) ordenado por série/data -> features por linha.
+
+    Retornos, volatilidades e SMAs são janelas finitas (exatas se `closes` inclui o aquecimento).
+    EMAs e pico dependem do histórico inteiro: para séries com `state`, continuam da semente nas linhas
+    posteriores a `asof`; as demais começam na primeira linha de `closes`.
+    """
+    keys = ["asset_class", "series_code"]
+    df = closes.reset_index(drop=True).copy()
+    g = df.groupby(keys, sort=False)
+    df["log_return"] = np.log(df["close"]) - np.log(g["close"].shift(1))
+    ann = np.sqrt(df["asset_class"].map(ANNUALIZATION).astype("float64"))
+    for w in VOL_WINDOWS:
+        df[f"vol_{w}"] = g["log_return"].transform(lambda s: s.rolling(w, min_periods=w).std()) * ann
+    for w in SMA_WINDOWS:
+        df[f"sma_{w}"] = g["close"].transform(lambda s: s.rolling(w, min_periods=w).mean())
+
+    seed_cols = ["asof", *[f"ema_{s}" for s in EMA_SPANS], "peak"]
+    if state is not None and not state.empty:
+        seeds = df[keys].merge(state[[*keys, *seed_cols]], on=keys, how="left")
+    else:
+        seeds = pd.DataFrame({c: np.nan for c in seed_cols}, index=df.index).astype({"asof": "datetime64[ns]"})
+    tail = (seeds["asof"].isna() | (df["date"] > seeds["asof"])).values
+    sub, sub_seeds = df[tail], seeds[tail]
+    sg = sub.groupby(keys, sort=False)["close"]
+    pos = sub.groupby(keys, sort=False).cumcount()
+    x0 = sg.transform("first")
+    for span in EMA_SPANS:
+        alpha = 2.0 / (span + 1)
+        z = sg.transform(lambda s: s.ewm(span=span, adjust=False).mean())
+        # ewm(adjust=False) começando em x0 difere da recursão semeada por (1-α)^(t+1)·(semente - x0)
+        shift = ((1.0 - alpha) ** (pos + 1) * (sub_seeds[f"ema_{span}"] - x0)).fillna(0.0)
+        df.loc[tail, f"ema_{span}"] = z + shift
+    df.loc[tail, "peak"] = np.fmax(sg.cummax(), sub_seeds["peak"])
+    df["drawdown"] = df["close"] / df["peak"] - 1.0
+    return df
+
+def rolling_correlations(px: pd.DataFrame, window: int = CORR_WINDOW,
+                         min_periods: int = CORR_MIN_PERIODS) -> pd.DataFrame:
+    """Correlação móvel dos log-retornos entre todas as colunas de px (data útil × série), só pares a < b."""
+    rets = np.log(px).diff()
+    corr = rets.rolling(window, min_periods=min_periods).corr()
+    corr.index.names = ["date", "series_a"]
+    corr.columns.name = "series_b"
+    out = corr.stack().rename("corr").reset_index()
+    out = out[out["series_a"] < out["series_b"]].dropna(subset=["corr"])
+    return out.assign(window_days=window)[["date", "window_days", "series_a", "series_b", "corr"]]
+
+def correlation_blocks(px: pd.DataFrame, start, max_rows: int | None = None,
+                       window: int = CORR_WINDOW) -> Iterator[pd.DataFrame]:
+    """Correlações das datas >= start em blocos de datas com até ~max_rows pares (a saída cresce com séries²).
+
+    Cada bloco relê só as `window` datas anteriores a ele: as janelas que terminam no bloco são as mesmas
+    do cálculo sobre o histórico inteiro."""
+    px = px[px.index.dayofweek < 5].sort_index()
+    first = int(px.index.searchsorted(pd.Timestamp(start)))
+    pairs = max(px.shape[1] ** 2, 1)
+    step = len(px) if not max_rows else max(1, max_rows // pairs)
+    for i0 in range(first, len(px), step):
+        out = rolling_correlations(px.iloc[max(0, i0 - window):i0 + step], window)
+        yield out[out["date"] >= px.index[i0]]
+
+def main():
+    eng = get_engine()
+    start = incremental_start(eng, *CHECKPOINT)
+    since = start - timedelta(days=warmup_days())
+    max_rows = chunk_rows()
+    # EMAs e pico continuam da última linha gravada antes de start (FULL_REFRESH: sem estado)
+    state = read_state(eng, start)
+    cols = ["date", "asset_class", "series_code", "close", "log_return",
+            *[f"vol_{w}" for w in VOL_WINDOWS], *[f"sma_{w}" for w in SMA_WINDOWS],
+            *[f"ema_{s}" for s in EMA_SPANS], "peak", "drawdown"]
+
+    # Features são por série: grupos de séries dentro do orçamento, gravados grupo a grupo. A correlação cruza
+    # todas as séries, então de cada grupo fica só a matriz data × série de fechamentos (floats, compacta)
+    px_parts, lasts, n_feats = [], {}, 0
+    for asset_class, (table, key, _) in SERIES.items():
+        for keys in key_partitions(eng, table, key, since, max_rows):
+            closes = read_closes(eng, since, asset_class, keys)
+            if closes.empty:
+                continue
+            feats = compute_features(closes, state)
+            feats = feats[feats["date"] >= pd.Timestamp(start)]
+            px_parts.append(closes.pivot_table(index="date", columns="series_code", values="close", aggfunc="last"))
+            del closes
+            if feats.empty:
+                continue
+            merge_lasts(lasts, series_lasts(feats, "series_code", f"{asset_class}:"))
+            feats = feats[cols].assign(date=feats["date"].dt.date)
+            upsert(eng, FEATURES_TABLE, feats, key_cols=["date", "asset_class", "series_code"])
+            n_feats += len(feats)
+    if not px_parts:
+        logger.info("GOLD FEATURES: nada nos fatos diários.")
+        return
+
+    px = pd.concat(px_parts, axis=1)
+    px = px.loc[:, ~px.columns.duplicated(keep="last")]
+    n_corr = 0
+    for corr in correlation_blocks(px, start, max_rows):
+        corr = corr.assign(date=corr["date"].dt.date)
+        upsert(eng, CORR_TABLE, corr, key_cols=["date", "window_days", "series_a", "series_b"])
+        n_corr += len(corr)
+
+    # Checkpoint na série mais atrasada, como nos fatos
+    set_watermark(eng, *CHECKPOINT, low_watermark(lasts))
+    log_lag("GOLD FEATURES", lasts)
+    logger.success(f"GOLD FEATURES -> {FEATURES_TABLE}: {n_feats} linhas; {CORR_TABLE}: {n_corr} linhas.")
+
+if __name__ == "__main__":
+    main()
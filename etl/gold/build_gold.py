@@ -1,60 +1,102 @@
+from datetime import date
 import pandas as pd
-from sqlalchemy import text
-from sqlalchemy.types import Integer, String, Date, Float
+from sqlalchemy.types import String, Date, Float
 from loguru import logger
-from etl.common.db import get_engine
-
-def upsert(engine, table_full, df: pd.DataFrame, key_cols: list[str]):
-    # Simples upsert via DELETE+INSERT (safe o suficiente em lotes diários)
-    with engine.begin() as conn:
-        # delete existentes
-        if not df.empty:
-            keys = " AND ".join([f"{k} = :{k}" for k in key_cols])
-            del_sql = f"DELETE FROM {table_full} WHERE {keys}"
-            for _, row in df.iterrows():
-                conn.execute(text(del_sql), row.to_dict())
-        # insert all
-        df.to_sql(table_full.split(".")[1], conn.connection, schema=table_full.split(".")[0],
-                  if_exists="append", index=False)
+from etl.common.db import get_engine, upsert, read_sql_chunks
+from etl.common.stream import chunk_rows
+from etl.common.watermark import incremental_start, set_watermark, series_lasts, merge_lasts, low_watermark, log_lag
+from etl.common.trading_calendar import dim_date
+from etl.common.env import GOLD_SNAPSHOT
+from etl.common.gold_version import mark_version
+from etl.gold import snapshot
+
+CHECKPOINT = ("gold", "facts")
 
 def main():
     eng = get_engine()
+    # Só as datas da silver a partir do checkpoint da gold (menos overlap): custo não cresce com o histórico
+    start = incremental_start(eng, *CHECKPOINT)
+    params = {"start": start}
+    logger.info(f"GOLD: processando silver a partir de {start}")
+
+    # ---------------- CALENDÁRIO ----------------
+    # dim_date da janela até o fim do ano seguinte (o Power BI filtra períodos futuros sem buraco)
+    upsert(eng, "md_gold.dim_date", dim_date(start, date(date.today().year + 1, 12, 31)), key_cols=["date"])
+
+    # Fatos são transformações linha a linha: lidos em lotes com cursor do lado do servidor e gravados lote a lote
+    # (memória limitada ao lote); as dimensões são acumuladas, pequenas, e gravadas no fim
+    chunksize = chunk_rows()
+    # Última data por série lida: o checkpoint fica na mais atrasada (uma série que a silver recalcular depois,
+    # como um índice do Yahoo atrasado em relação ao Stooq, ainda cai na janela da próxima execução)
+    lasts = {}
+    # Meses (YYYY-MM) gravados por fato: só essas partições do snapshot Parquet são relidas
+    touched = {t: set() for t in ("md_gold.fact_fx_daily", "md_gold.fact_crypto_daily", "md_gold.fact_index_daily")}
 
     # ---------------- FX ----------------
-    fx = pd.read_sql("SELECT date, pair, rate FROM md_silver.fx_rates", eng)
-    fx["date"] = pd.to_datetime(fx["date"]).dt.date
+    currs = set()
+    for fx in read_sql_chunks("SELECT date, pair, rate FROM md_silver.fx_rates WHERE date >= %(start)s",
+                              eng, params=params, chunksize=chunksize):
+        if fx.empty:
+            continue
+        fx["date"] = pd.to_datetime(fx["date"]).dt.date
+        currs.update(fx["pair"].str.split("/").explode())
+        fx.rename(columns={"pair":"currency_pair", "rate":"rate_close"}, inplace=True)
+        upsert(eng, "md_gold.fact_fx_daily", fx, key_cols=["date", "currency_pair"],
+               dtype={"date": Date(), "currency_pair": String(16), "rate_close": Float()})
+        merge_lasts(lasts, series_lasts(fx, "currency_pair", "fx:"))
+        touched["md_gold.fact_fx_daily"] |= snapshot.month_keys(fx["date"])
     # dim_currency
-    currs = sorted(set([p.split("/")[0] for p in fx["pair"]] + [p.split("/")[1] for p in fx["pair"]]))
-    dim_currency = pd.DataFrame({"currency_code": currs})
-    dim_currency.to_sql("dim_currency", eng, schema="md_gold", if_exists="replace", index=False,
-                        dtype={"currency_code": String(8)})
-
-    fact_fx = fx.copy()
-    fact_fx.rename(columns={"pair":"currency_pair", "rate":"rate_close"}, inplace=True)
-    fact_fx.to_sql("fact_fx_daily", eng, schema="md_gold", if_exists="replace", index=False,
-                   dtype={"date": Date(), "currency_pair": String(16), "rate_close": Float()})
+    dim_currency = pd.DataFrame({"currency_code": sorted(currs)})
+    upsert(eng, "md_gold.dim_currency", dim_currency, key_cols=["currency_code"],
+           dtype={"currency_code": String(8)})
 
     # ---------------- CRYPTO ----------------
-    cr = pd.read_sql("SELECT date, symbol, price FROM md_silver.crypto_rates", eng)
-    cr["date"] = pd.to_datetime(cr["date"]).dt.date
-    cr.rename(columns={"symbol":"asset_symbol","price":"price_close"}, inplace=True)
-    cr.to_sql("fact_crypto_daily", eng, schema="md_gold", if_exists="replace", index=False,
-              dtype={"date": Date(), "asset_symbol": String(16), "price_close": Float()})
+    for cr in read_sql_chunks("SELECT date, symbol, price FROM md_silver.crypto_rates WHERE date >= %(start)s",
+                              eng, params=params, chunksize=chunksize):
+        if cr.empty:
+            continue
+        cr["date"] = pd.to_datetime(cr["date"]).dt.date
+        cr.rename(columns={"symbol":"asset_symbol","price":"price_close"}, inplace=True)
+        upsert(eng, "md_gold.fact_crypto_daily", cr, key_cols=["date", "asset_symbol"],
+               dtype={"date": Date(), "asset_symbol": String(16), "price_close": Float()})
+        merge_lasts(lasts, series_lasts(cr, "asset_symbol", "crypto:"))
+        touched["md_gold.fact_crypto_daily"] |= snapshot.month_keys(cr["date"])
 
     # ---------------- INDEX ----------------
-    idx = pd.read_sql("SELECT date,index_code,index_name,open,high,low,close,volume FROM md_silver.index_ohlc", eng)
-    idx["date"] = pd.to_datetime(idx["date"]).dt.date
-    dim_index = idx[["index_code","index_name"]].drop_duplicates()
-    dim_index.to_sql("dim_index", eng, schema="md_gold", if_exists="replace", index=False,
-                     dtype={"index_code": String(16), "index_name": String(64)})
-
-    fact_index = idx.rename(columns={"close":"close_price"})
-    fact_index = fact_index[["date","index_code","open","high","low","close_price","volume"]]
-    fact_index.to_sql("fact_index_daily", eng, schema="md_gold", if_exists="replace", index=False,
-                      dtype={"date": Date(), "index_code": String(16),
-                             "open": Float(), "high": Float(), "low": Float(),
-                             "close_price": Float(), "volume": Float()})
+    names = {}
+    for idx in read_sql_chunks("SELECT date,index_code,index_name,open,high,low,close,volume,is_trading_day "
+                               "FROM md_silver.index_ohlc WHERE date >= %(start)s", eng, params=params,
+                               chunksize=chunksize):
+        # Fato só com dias de pregão; as linhas marcadas pela silver continuam lá para auditoria (NULL = legado)
+        off = idx["is_trading_day"].eq(0)
+        if off.any():
+            logger.info(f"GOLD INDEX: {int(off.sum())} linha(s) com is_trading_day = false fora de fact_index_daily")
+        idx = idx[~off]
+        if idx.empty:
+            continue
+        idx["date"] = pd.to_datetime(idx["date"]).dt.date
+        names.update(zip(idx["index_code"], idx["index_name"]))
+        idx.rename(columns={"close":"close_price"}, inplace=True)
+        fact_index = idx[["date","index_code","open","high","low","close_price","volume"]]
+        upsert(eng, "md_gold.fact_index_daily", fact_index, key_cols=["date", "index_code"],
+               dtype={"date": Date(), "index_code": String(16),
+                      "open": Float(), "high": Float(), "low": Float(),
+                      "close_price": Float(), "volume": Float()})
+        merge_lasts(lasts, series_lasts(idx, "index_code", "index:"))
+        touched["md_gold.fact_index_daily"] |= snapshot.month_keys(idx["date"])
+    dim_index = pd.DataFrame({"index_code": list(names), "index_name": list(names.values())})
+    upsert(eng, "md_gold.dim_index", dim_index, key_cols=["index_code"],
+           dtype={"index_code": String(16), "index_name": String(64)})
 
+    if GOLD_SNAPSHOT:
+        for table, months in touched.items():
+            snapshot.publish(eng, table, months)
+        for table in ("md_gold.dim_currency", "md_gold.dim_index", "md_gold.dim_date"):
+            snapshot.publish(eng, table)
+    set_watermark(eng, *CHECKPOINT, low_watermark(lasts))
+    log_lag("GOLD", lasts)
+    # Servidores de etl.gold.serve descartam as séries em cache
+    mark_version(max(lasts.values()) if lasts else None)
     logger.success("GOLD atualizado: dim_currency, fact_fx_daily, fact_crypto_daily, dim_index, fact_index_daily")
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+# etl/gold/build_rollups.py
+# Rollups da gold por semana, mês e ano (OHLC, retorno e média do período).
+from dataclasses import dataclass
+from datetime import date
+import pandas as pd
+from loguru import logger
+from etl.common.db import get_engine, upsert, read_sql
+from etl.common.watermark import incremental_start, set_watermark, series_lasts, merge_lasts, low_watermark, log_lag
+from etl.common.stream import chunk_rows, key_partitions
+
+CHECKPOINT = ("gold", "rollups")
+# grain -> período do pandas (W = semana começando na segunda)
+GRAINS = {"W": "W-SUN", "M": "M", "Y": "Y"}
+
+@dataclass(frozen=True)
+class Rollup:
+    source: str                 # fato diário
+    out: str                    # tabela de rollup
+    key: str                    # coluna da série
+    close: str                  # coluna de fechamento
+    ohlc: bool = False          # fato já tem open/high/low (índices); senão deriva do fechamento
+
+ROLLUPS = [
+    Rollup("md_gold.fact_fx_daily", "md_gold.agg_fx_period", "currency_pair", "rate_close"),
+    Rollup("md_gold.fact_crypto_daily", "md_gold.agg_crypto_period", "asset_symbol", "price_close"),
+    Rollup("md_gold.fact_index_daily", "md_gold.agg_index_period", "index_code", "close_price", ohlc=True),
+]
+
+def period_start(d: date, grain: str) -> date:
+    return pd.Period(d, freq=GRAINS[grain]).start_time.date()
+
+def _read_daily(eng, r: Rollup, start: date, keys: tuple) -> pd.DataFrame:
+    cols = f"date, {r.key}, {r.close} AS close" + (", open, high, low" if r.ohlc else "")
+    df = read_sql(f"SELECT {cols} FROM {r.source} WHERE date >= %(start)s AND {r.key} IN %(keys)s",
+                  eng, params={"start": start, "keys": keys})
+    df["date"] = pd.to_datetime(df["date"])
+    if not r.ohlc:
+        df["open"] = df["high"] = df["low"] = df["close"]
+    return df.sort_values([r.key, "date"])
+
+def _prior_close(eng, r: Rollup, before: date, keys: tuple) -> pd.Series:
+    # Último fechamento de cada série antes da janela: base do retorno do primeiro período recalculado
+    q = f"""
+        SELECT f.{r.key}, f.{r.close} AS close
+        FROM {r.source} f
+        JOIN (SELECT {r.key}, MAX(date) AS d FROM {r.source}
+              WHERE date < %(before)s AND {r.key} IN %(keys)s GROUP BY {r.key}) m
+          ON f.{r.key} = m.{r.key} AND f.date = m.d
+    """
+    prev = read_sql(q, eng, params={"before": before, "keys": keys})
+    return prev.set_index(r.key)["close"]
+
+def rollup(daily: pd.DataFrame, key: str, grain: str, prior: pd.Series | None = None) -> pd.DataFrame:
+    """Agrega o diário (date, key, open, high, low, close) no grain; return_pct usa o fechamento
+    do período anterior da mesma série (ou `prior` para o primeiro período)."""
+    if daily.empty:
+        return pd.DataFrame()
+    d = daily.dropna(subset=["close"])
+    per = d["date"].dt.to_period(GRAINS[grain]).dt.start_time.rename("period_start")
+    g = d.groupby([d[key], per], sort=True)
+    out = g.agg(period_end=("date", "max"), open=("open", "first"), high=("high", "max"),
+                low=("low", "min"), close=("close", "last"), avg_close=("close", "mean"),
+                n_days=("close", "size")).reset_index()
+    prev_close = out.groupby(key)["close"].shift(1)
+    if prior is not None and not prior.empty:
+        prev_close = prev_close.fillna(out[key].map(prior))
+    out["return_pct"] = out["close"] / prev_close - 1.0
+    out["grain"] = grain
+    out["period_start"] = out["period_start"].dt.date
+    out["period_end"] = out["period_end"].dt.date
+    return out[["grain", key, "period_start", "period_end", "open", "high", "low", "close",
+                "return_pct", "avg_close", "n_days"]]
+
+def main():
+    eng = get_engine()
+    start = incremental_start(eng, *CHECKPOINT)
+    # Períodos afetados: o que contém `start` em cada grain; lê o diário desde o mais antigo deles (início do ano)
+    affected = {g: period_start(start, g) for g in GRAINS}
+    read_from = min(affected.values())
+    logger.info(f"GOLD ROLLUPS: recalculando períodos a partir de {affected} (diário desde {read_from})")
+
+    lasts = {}
+    for r in ROLLUPS:
+        # Cada série é agregada sozinha: lê grupos de séries que cabem no orçamento de memória
+        groups = key_partitions(eng, r.source, r.key, read_from, chunk_rows())
+        if not groups:
+            logger.info(f"GOLD ROLLUPS {r.out}: nada em {r.source} desde {read_from}")
+            continue
+        n = 0
+        for keys in groups:
+            daily = _read_daily(eng, r, read_from, keys)
+            if daily.empty:
+                continue
+            prior = _prior_close(eng, r, read_from, keys)
+            frames = []
+            for grain in GRAINS:
+                agg = rollup(daily, r.key, grain, prior)
+                frames.append(agg[agg["period_start"] >= affected[grain]])
+            out = pd.concat(frames, ignore_index=True)
+            upsert(eng, r.out, out, key_cols=["grain", r.key, "period_start"])
+            merge_lasts(lasts, series_lasts(daily, r.key, f"{r.out}:"))
+            n += len(out)
+        logger.success(f"GOLD ROLLUPS -> {r.out}: {n} períodos.")
+    # Checkpoint na série mais atrasada: linhas que ela ganhar depois ainda recalculam os seus períodos
+    set_watermark(eng, *CHECKPOINT, low_watermark(lasts))
+    log_lag("GOLD ROLLUPS", lasts)
+
+if __name__ == "__main__":
+    main()
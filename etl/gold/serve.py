@@ -0,0 +1,225 @@
+# etl/gold/serve.py
+# Consulta em memória das séries diárias da gold (valor na data e faixas), em processo ou por HTTP (JSON/Arrow).
+#
+#   python -m etl.gold.serve --port 8766
+#   curl "http://127.0.0.1:8766/v1/value?kind=fx&key=USD/BRL&date=2025-03-10"
+import argparse, json, threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+import numpy as np
+import pyarrow as pa
+from loguru import logger
+from etl.common.env import GOLD_SERVE_CACHE_SERIES, GOLD_VERSION_FILE
+from etl.common.db import get_engine, read_sql
+from etl.common.gold_version import current_version
+
+@dataclass(frozen=True)
+class Kind:
+    table: str
+    key_col: str
+    value_cols: tuple[str, ...]
+
+KINDS = {
+    "fx": Kind("md_gold.fact_fx_daily", "currency_pair", ("rate_close",)),
+    "crypto": Kind("md_gold.fact_crypto_daily", "asset_symbol", ("price_close",)),
+    "index": Kind("md_gold.fact_index_daily", "index_code", ("open", "high", "low", "close_price", "volume")),
+}
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+def _day(d) -> np.datetime64:
+    return np.datetime64(str(d)[:10], "D")
+
+@dataclass
+class Series:
+    dates: np.ndarray                   # datetime64[D], crescente
+    values: dict[str, np.ndarray]
+
+    def at(self, d, asof: bool = False) -> int | None:
+        """Posição da data (ou da última anterior, com asof)."""
+        d = _day(d)
+        if asof:
+            pos = int(np.searchsorted(self.dates, d, side="right")) - 1
+            return pos if pos >= 0 else None
+        pos = int(np.searchsorted(self.dates, d, side="left"))
+        return pos if pos < len(self.dates) and self.dates[pos] == d else None
+
+    def span(self, start=None, end=None) -> slice:
+        lo = 0 if start is None else int(np.searchsorted(self.dates, _day(start), side="left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, _day(end), side="right"))
+        return slice(lo, hi)
+
+    def row(self, pos: int) -> dict:
+        out = {"date": str(self.dates[pos])}
+        for c, v in self.values.items():
+            x = float(v[pos])
+            out[c] = None if np.isnan(x) else x
+        return out
+
+    def to_arrow(self, s: slice) -> pa.Table:
+        return pa.table({"date": pa.array(self.dates[s], pa.date32()),
+                         **{c: pa.array(v[s], pa.float64(), from_pandas=True) for c, v in self.values.items()}})
+
+    def to_json(self, s: slice) -> dict:
+        return {"date": [str(d) for d in self.dates[s]],
+                **{c: [None if np.isnan(x) else float(x) for x in v[s]] for c, v in self.values.items()}}
+
+class GoldStore:
+    """Séries da gold em memória com LRU; thread-safe (o servidor HTTP atende em várias threads)."""
+
+    def __init__(self, engine=None, max_series: int = GOLD_SERVE_CACHE_SERIES, version_file: str = GOLD_VERSION_FILE):
+        self._engine = engine
+        self.max_series = max_series
+        self.version_file = version_file
+        self._cache: OrderedDict[tuple[str, str], Series] = OrderedDict()
+        self._keys: dict[str, list[str]] = {}
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = get_engine()
+        return self._engine
+
+    def _check_version(self) -> object:
+        v = current_version(self.version_file)
+        if v != self._version:
+            if self._cache or self._keys:
+                logger.info(f"Gold atualizada ({self.version_file}): {len(self._cache)} série(s) descartada(s) do cache")
+            self._cache.clear()
+            self._keys.clear()
+            self._version = v
+        return v
+
+    def _load(self, kind: Kind, key: str) -> Series:
+        cols = ", ".join(kind.value_cols)
+        df = read_sql(f"SELECT date, {cols} FROM {kind.table} WHERE {kind.key_col} = %(key)s ORDER BY date",
+                      self.engine, params={"key": key})
+        return Series(df["date"].to_numpy().astype("datetime64[D]"),
+                      {c: df[c].to_numpy("float64", na_value=np.nan) for c in kind.value_cols})
+
+    def series(self, kind: str, key: str) -> Series:
+        spec = KINDS[kind]
+        with self._lock:
+            version = self._check_version()
+            s = self._cache.get((kind, key))
+            if s is not None:
+                self._cache.move_to_end((kind, key))
+                self.hits += 1
+                return s
+            self.misses += 1
+        # Leitura fora do lock; série desconhecida também entra no cache (vazia) para não voltar ao banco
+        s = self._load(spec, key)
+        with self._lock:
+            if self._version == version:
+                self._cache[(kind, key)] = s
+                while len(self._cache) > self.max_series:
+                    self._cache.popitem(last=False)
+        return s
+
+    def keys(self, kind: str) -> list[str]:
+        spec = KINDS[kind]
+        with self._lock:
+            self._check_version()
+            if kind in self._keys:
+                return self._keys[kind]
+        df = read_sql(f"SELECT DISTINCT {spec.key_col} AS k FROM {spec.table} ORDER BY k", self.engine)
+        keys = df["k"].tolist()
+        with self._lock:
+            self._keys[kind] = keys
+        return keys
+
+    def value(self, kind: str, key: str, d, asof: bool = False) -> dict | None:
+        s = self.series(kind, key)
+        pos = s.at(d, asof)
+        return None if pos is None else s.row(pos)
+
+    def range(self, kind: str, key: str, start=None, end=None) -> pa.Table:
+        s = self.series(kind, key)
+        return s.to_arrow(s.span(start, end))
+
+# ---------------- HTTP ----------------
+class GoldHandler(BaseHTTPRequestHandler):
+    store: GoldStore = None
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, obj):
+        self._send(status, json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+
+    def _wants_arrow(self, q: dict) -> bool:
+        fmt = q.get("format")
+        return fmt == "arrow" if fmt else ARROW_STREAM in (self.headers.get("Accept") or "")
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        q = dict(parse_qsl(parts.query))
+        try:
+            if parts.path == "/health":
+                return self._json(200, {"status": "ok", "series": len(self.store._cache),
+                                        "hits": self.store.hits, "misses": self.store.misses})
+            kind = q.get("kind", "")
+            if kind not in KINDS:
+                return self._json(400, {"error": f"kind deve ser um de {sorted(KINDS)}"})
+            if parts.path == "/v1/keys":
+                return self._json(200, {"kind": kind, "keys": self.store.keys(kind)})
+            key = q.get("key")
+            if not key:
+                return self._json(400, {"error": "informe key"})
+            if parts.path == "/v1/value":
+                row = self.store.value(kind, key, q["date"], asof=q.get("asof") in ("1", "true"))
+                if row is None:
+                    return self._json(404, {"error": f"{kind} {key} sem observação em {q['date']}"})
+                return self._json(200, {"kind": kind, "key": key, **row})
+            if parts.path == "/v1/range":
+                s = self.store.series(kind, key)
+                span = s.span(q.get("start"), q.get("end"))
+                if self._wants_arrow(q):
+                    sink = pa.BufferOutputStream()
+                    table = s.to_arrow(span)
+                    with pa.ipc.new_stream(sink, table.schema) as w:
+                        w.write_table(table)
+                    return self._send(200, sink.getvalue().to_pybytes(), ARROW_STREAM)
+                return self._json(200, {"kind": kind, "key": key, **s.to_json(span)})
+            return self._json(404, {"error": "rotas: /v1/value, /v1/range, /v1/keys, /health"})
+        except (KeyError, ValueError) as exc:
+            return self._json(400, {"error": f"parâmetro inválido: {exc}"})
+        except Exception as exc:
+            logger.opt(exception=exc).error(f"Gold serve {self.path}: {exc}")
+            return self._json(500, {"error": str(exc)})
+
+    def log_message(self, fmt, *args):
+        logger.debug(f"gold serve {self.address_string()} {fmt % args}")
+
+def make_server(store: GoldStore | None = None, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    handler = type("Handler", (GoldHandler,), {"store": store or GoldStore()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    ap = argparse.ArgumentParser(description="API local de leitura das séries da gold (JSON / Arrow IPC)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8766)
+    args = ap.parse_args()
+    server = make_server(host=args.host, port=args.port)
+    logger.info(f"Gold serve em http://{args.host}:{args.port} (cache de até {GOLD_SERVE_CACHE_SERIES} séries; "
+                f"invalidação por {GOLD_VERSION_FILE})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
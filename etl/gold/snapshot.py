@@ -0,0 +1,173 @@
+# etl/gold/snapshot.py
+# Snapshots Parquet versionados da gold em data/gold/<tabela>/ (só as partições alteradas são regravadas).
+#
+#   python -m etl.gold.snapshot
+#   python -m etl.gold.snapshot --full md_gold.fact_fx_daily
+import argparse, hashlib, json, os
+from datetime import datetime, timezone
+from collections.abc import Iterable
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy.engine import Engine
+from loguru import logger
+from etl.common.env import GOLD_SNAPSHOT_DIR
+from etl.common.db import get_engine, read_sql
+from etl.common.schema import TABLES, Table
+from etl.common import backend
+
+# Tabelas publicadas pelo build_gold
+GOLD_TABLES = ("md_gold.fact_fx_daily", "md_gold.fact_crypto_daily", "md_gold.fact_index_daily",
+               "md_gold.dim_currency", "md_gold.dim_index", "md_gold.dim_date")
+SNAPSHOT_KEEP_VERSIONS = 3
+HISTORY_MAX = 100
+ALL = "all"
+
+def table_dir(table: str, root: str = GOLD_SNAPSHOT_DIR) -> str:
+    return os.path.join(root, table.split(".", 1)[1])
+
+def _atomic_json(path: str, obj: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=1, default=str)
+    os.replace(tmp, path)
+
+def load_manifest(table: str, root: str = GOLD_SNAPSHOT_DIR) -> dict:
+    try:
+        with open(os.path.join(table_dir(table, root), "_manifest.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        t = TABLES[table]
+        return {"table": table, "version": 0, "partition_by": "month" if t.partition_col else None,
+                "primary_key": list(t.primary_key), "partitions": {}, "retired": [], "history": []}
+
+def month_keys(dates) -> set[str]:
+    """Datas -> partições YYYY-MM (para o build_gold acumular o que tocou)."""
+    return set(pd.to_datetime(pd.Series(dates)).dt.strftime("%Y-%m").dropna())
+
+def snapshot_files(table: str, root: str = GOLD_SNAPSHOT_DIR) -> list[str]:
+    """Arquivos da versão atual (ex.: pd.read_parquet(snapshot_files("md_gold.fact_fx_daily")))."""
+    base = table_dir(table, root)
+    return [os.path.join(base, p["path"]) for _, p in sorted(load_manifest(table, root)["partitions"].items())]
+
+def _typed(df: pd.DataFrame, t: Table) -> pd.DataFrame:
+    # Tipos pelo DDL, não pelo driver: o schema dos arquivos é o mesmo em MariaDB, DuckDB e SQLite
+    out = {}
+    for c, typ in t.columns:
+        typ = typ.split()[0].upper()
+        if typ == "DATE":
+            out[c] = pd.to_datetime(df[c]).dt.date
+        elif typ in ("DOUBLE", "FLOAT"):
+            out[c] = pd.to_numeric(df[c]).astype("float64")
+        elif typ in ("INT", "BIGINT", "SMALLINT", "TINYINT"):
+            out[c] = pd.to_numeric(df[c]).astype("Int64")
+        elif typ == "BOOLEAN":
+            out[c] = df[c].astype("boolean")
+        else:
+            out[c] = df[c].astype("string")
+    return pd.DataFrame(out)
+
+def _hash(df: pd.DataFrame) -> str:
+    # Hash de cada linha concatenado na ordem da PK (a soma colidia com linhas trocando valores entre si)
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+def _reads(engine: Engine, t: Table, keys: Iterable[str] | None) -> dict[str, tuple[str, dict | None]]:
+    q = lambda c: backend.quote(engine, c)
+    select = f"SELECT {', '.join(map(q, t.column_names))} FROM {t.name}"
+    order = f" ORDER BY {', '.join(map(q, t.primary_key))}"
+    if not t.partition_col:
+        return {ALL: (select + order, None)}
+    if keys is None:
+        bounds = read_sql(f"SELECT MIN({q(t.partition_col)}) AS lo, MAX({q(t.partition_col)}) AS hi FROM {t.name}",
+                          engine)
+        if bounds.empty or pd.isna(bounds["lo"].iloc[0]):
+            return {}
+        keys = [str(p) for p in pd.period_range(pd.Timestamp(bounds["lo"].iloc[0]), pd.Timestamp(bounds["hi"].iloc[0]),
+                                                freq="M")]
+    where = f" WHERE {q(t.partition_col)} BETWEEN %(lo)s AND %(hi)s"
+    out = {}
+    for k in sorted(keys):
+        p = pd.Period(k, freq="M")
+        out[k] = (select + where + order, {"lo": p.start_time.date(), "hi": p.end_time.date()})
+    return out
+
+def publish(engine: Engine, table: str, months: Iterable[str] | None = None, full: bool = False,
+            root: str = GOLD_SNAPSHOT_DIR) -> list[str]:
+    """Publica as partições `months` (YYYY-MM) da tabela; todas se full, se months=None ou se ainda não há
+    snapshot. Só partições com conteúdo diferente do publicado ganham arquivo novo. Devolve as que mudaram."""
+    t = TABLES[table]
+    m = load_manifest(table, root)
+    if full or not m["partitions"]:
+        months = None
+    version = m["version"] + 1
+    base = table_dir(table, root)
+    changed = []
+    for key, (sql, params) in _reads(engine, t, months).items():
+        df = read_sql(sql, engine, params=params)
+        prev = m["partitions"].get(key)
+        if df.empty:
+            continue
+        df = _typed(df, t)
+        h = _hash(df)
+        if prev and prev["hash"] == h:
+            continue
+        if key == ALL:
+            rel = os.path.join(ALL, f"part-v{version:06d}.parquet")
+        else:
+            rel = os.path.join(f"year={key[:4]}", f"month={key[5:]}", f"part-v{version:06d}.parquet")
+        path = os.path.join(base, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), f"{path}.tmp", compression="zstd",
+                       write_statistics=True)
+        os.replace(f"{path}.tmp", path)
+        if prev:
+            m["retired"].append({"path": prev["path"], "version": version})
+        entry = {"path": rel, "version": version, "rows": len(df), "hash": h, "bytes": os.path.getsize(path)}
+        if t.partition_col:
+            entry.update(min_date=str(df[t.partition_col].min()), max_date=str(df[t.partition_col].max()))
+        m["partitions"][key] = entry
+        changed.append(key)
+    if not changed:
+        logger.info(f"Snapshot {table}: nenhuma partição mudou (versão {m['version']})")
+        return []
+
+    now = datetime.now(timezone.utc).isoformat()
+    m.update(version=version, updated_at=now)
+    m["history"] = [*m["history"], {"version": version, "at": now, "changed": changed}][-HISTORY_MAX:]
+    # Substituídos há mais de SNAPSHOT_KEEP_VERSIONS versões: nenhum manifest recente aponta mais para eles
+    keep = []
+    for r in m["retired"]:
+        if r["version"] <= version - SNAPSHOT_KEEP_VERSIONS:
+            try:
+                os.remove(os.path.join(base, r["path"]))
+            except FileNotFoundError:
+                pass
+        else:
+            keep.append(r)
+    m["retired"] = keep
+    # Manifest por último: leitores veem a versão anterior inteira ou a nova inteira
+    _atomic_json(os.path.join(base, "_manifest.json"), m)
+    index_path = os.path.join(root, "_snapshots.json")
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        index = {}
+    index[table] = {"version": version, "updated_at": now, "partitions": len(m["partitions"]),
+                    "manifest": os.path.join(os.path.basename(base), "_manifest.json")}
+    _atomic_json(index_path, index)
+    logger.info(f"Snapshot {table} v{version}: {len(changed)} partição(ões) regravada(s) de {len(m['partitions'])}")
+    return changed
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Publica snapshots Parquet versionados da gold")
+    ap.add_argument("tables", nargs="*", help=f"tabelas (default: {', '.join(GOLD_TABLES)})")
+    ap.add_argument("--full", action="store_true", help="relê todas as partições (só regrava as que mudaram)")
+    args = ap.parse_args(argv)
+    eng = get_engine()
+    for table in args.tables or GOLD_TABLES:
+        publish(eng, table, full=args.full)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# etl/silver/fx_cross.py
+# Motor de cross rates N×N: uma matriz data × moeda com o preço de 1 unidade de cada moeda em BRL
+# (âncora) gera qualquer par A/B = v[:, A] / v[:, B] por broadcast, sem um DataFrame por moeda.
+from fnmatch import fnmatchcase
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from loguru import logger
+from etl.common.db import get_engine, read_sql
+
+ANCHOR = "BRL"
+# Pares gravados na silver por padrão (o mesmo conjunto CODE/BRL de antes)
+DEFAULT_MATERIALIZE = ["*/BRL"]
+
+class CrossRateMatrix:
+    """value[d, i] = preço de 1 unidade de codes[i] em BRL na data dates[d] (NaN se faltou cotação)."""
+
+    def __init__(self, dates, codes: list[str], value: np.ndarray):
+        self.dates = pd.DatetimeIndex(dates)
+        self.codes = list(codes)
+        self.value = np.asarray(value, dtype="float64")
+        self._pos = {c: i for i, c in enumerate(self.codes)}
+
+    @classmethod
+    def from_vs_eur(cls, vs_eur: pd.DataFrame, brl_per_eur: pd.Series) -> "CrossRateMatrix":
+        """vs_eur: data × moeda com unidades da moeda por 1 EUR (convenção do ECB, EUR = 1);
+        brl_per_eur: BRL por 1 EUR na mesma data."""
+        vs_eur = vs_eur.drop(columns=[ANCHOR], errors="ignore")
+        value = brl_per_eur.to_numpy("float64")[:, None] / vs_eur.to_numpy("float64")
+        codes = [*vs_eur.columns, ANCHOR]
+        value = np.column_stack([value, np.ones(len(vs_eur))])
+        return cls(vs_eur.index, codes, value)
+
+    @classmethod
+    def from_anchor_pairs(cls, df: pd.DataFrame) -> "CrossRateMatrix":
+        """Reconstrói a matriz a partir de linhas (date, pair, rate) com pares CODE/BRL."""
+        df = df[df["pair"].str.endswith(f"/{ANCHOR}")]
+        wide = df.assign(code=df["pair"].str.split("/").str[0]) \
+                 .pivot_table(index="date", columns="code", values="rate", aggfunc="last")
+        wide[ANCHOR] = 1.0
+        return cls(pd.to_datetime(wide.index), list(wide.columns), wide.to_numpy("float64"))
+
+    def select(self, patterns: list[str]) -> list[tuple[int, int]]:
+        """Pares (i, j) cujo nome "A/B" casa com algum padrão glob ("*/BRL", "USD/*", "EUR/JPY"); sem A/A."""
+        out = []
+        for i, a in enumerate(self.codes):
+            for j, b in enumerate(self.codes):
+                if i != j and any(fnmatchcase(f"{a}/{b}", p) for p in patterns):
+                    out.append((i, j))
+        return out
+
+    def rate(self, base: str, quote: str) -> pd.Series:
+        """Série base/quote (preço de 1 base em quote)."""
+        i, j = self._pos[base], self._pos[quote]
+        return pd.Series(self.value[:, i] / self.value[:, j], index=self.dates, name=f"{base}/{quote}")
+
+    def to_long(self, pairs: list[tuple[int, int]] | None = None) -> pd.DataFrame:
+        """(date, pair, rate) para os pares pedidos (todos os N×(N-1) se None), numa divisão vetorizada."""
+        n = len(self.codes)
+        if pairs is None:
+            ii, jj = np.nonzero(~np.eye(n, dtype=bool))
+        else:
+            if not pairs:
+                return pd.DataFrame({"date": [], "pair": [], "rate": []})
+            ii, jj = (np.asarray(x, dtype="int64") for x in zip(*pairs))
+        # (D, P): cada coluna é um par; broadcast de v[:, i] / v[:, j]
+        rates = self.value[:, ii] / self.value[:, jj]
+        codes = np.asarray(self.codes, dtype=object)
+        names = pd.Categorical(codes[ii] + "/" + codes[jj])
+        out = pd.DataFrame({
+            "date": np.tile(self.dates.values, len(ii)),
+            "pair": names.take(np.repeat(np.arange(len(ii)), len(self.dates))),
+            "rate": rates.T.ravel(),
+        })
+        # pair fica categórico: milhões de linhas com ~1.600 nomes distintos
+        return out[np.isfinite(out["rate"].to_numpy())].reset_index(drop=True)
+
+# ---------------- lookup sob demanda ----------------
+@lru_cache(maxsize=8)
+def _load_matrix(start: str | None, end: str | None) -> CrossRateMatrix:
+    q = "SELECT date, pair, rate FROM md_silver.fx_rates WHERE pair LIKE %(anchor)s"
+    params = {"anchor": f"%/{ANCHOR}"}
+    if start:
+        q += " AND date >= %(start)s"
+        params["start"] = start
+    if end:
+        q += " AND date <= %(end)s"
+        params["end"] = end
+    df = read_sql(q, get_engine(), params=params)
+    logger.debug(f"Cross rates: matriz carregada ({df['pair'].nunique()} moedas, {df['date'].nunique()} datas)")
+    return CrossRateMatrix.from_anchor_pairs(df)
+
+def cross_rate(base: str, quote: str, start=None, end=None) -> pd.Series:
+    """Par qualquer calculado sob demanda a partir dos CODE/BRL da silver (matriz em cache por intervalo)."""
+    m = _load_matrix(None if start is None else str(start), None if end is None else str(end))
+    return m.rate(base, quote)
+
+def clear_cache():
+    _load_matrix.cache_clear()
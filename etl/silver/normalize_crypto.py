@@ -1,29 +1,91 @@
+import numpy as np
 import pandas as pd
-from sqlalchemy.types import Date, String, Float
+from sqlalchemy.types import Date, String, Float, Integer
 from loguru import logger
-from etl.common.db import get_engine
+from etl.common.db import get_engine, upsert
+from etl.common.bronze_input import read_table
+from etl.common.io import load_sources_yaml
+from etl.common.watermark import incremental_start, series_lasts
+from etl.common.trading_calendar import asof_series, lookback_start
+from etl.common.stream import chunk_rows, date_partitions, run_ranges
+from etl.bronze.ingest_coingecko_crypto import TABLE as POINTS_TABLE, coin_list
+from etl.bronze.ingest_coingecko_btcusd import TABLE as LEGACY_TABLE
 
 OUT_TABLE = "md_silver.crypto_rates"
+OHLC_TABLE = "md_silver.crypto_ohlc"
+CHECKPOINT = ("silver", "crypto_rates")
+PRICE_COLS = ["open", "high", "low", "close", "vwap", "volume"]
 
-def main():
-    eng = get_engine()
-    btc = pd.read_sql("SELECT date, btc_usd FROM md_bronze.coingecko_btcusd_raw", eng)
-    ptax = pd.read_sql("SELECT date, usdbrl FROM md_bronze.ptax_usdbrl_raw", eng)
+def daily_ohlc(points: pd.DataFrame) -> pd.DataFrame:
+    """Pontos intraday (coin, ts, price, volume) -> OHLC diário (UTC) + VWAP por moeda, numa agregação só.
+
+    volume é o acumulado de 24h que a CoinGecko informa em cada ponto: o VWAP pondera os preços do dia
+    por ele e o volume do dia é a última leitura."""
+    p = points.dropna(subset=["price"]).sort_values(["coin", "ts"], ignore_index=True)
+    p["pv"] = p["price"] * p["volume"].fillna(0.0)
+    p["w"] = p["volume"].fillna(0.0)
+    g = p.groupby(["coin", p["ts"].dt.normalize().rename("date")], sort=False)
+    out = g.agg(open=("price", "first"), high=("price", "max"), low=("price", "min"), close=("price", "last"),
+                pv=("pv", "sum"), w=("w", "sum"), avg=("price", "mean"), volume=("volume", "last"),
+                n_points=("price", "size")).reset_index()
+    # Sem volume no dia: VWAP cai para a média simples dos preços
+    out["vwap"] = np.where(out["w"] > 0, out["pv"] / out["w"].where(out["w"] > 0), out["avg"])
+    out["date"] = out["date"].dt.date
+    return out[["date", "coin", *PRICE_COLS, "n_points"]]
+
+def transform(points: pd.DataFrame, btc: pd.DataFrame, ptax: pd.DataFrame,
+              symbols: dict) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Pontos intraday + BTC legado + PTAX (com lookback) de uma faixa de datas -> (crypto_ohlc, crypto_rates)."""
+    points["ts"] = pd.to_datetime(points["ts"])
     for df in (btc, ptax):
         df["date"] = pd.to_datetime(df["date"]).dt.date
+    # Bronze já chega única por data (PK no banco; dedup na gravação e na leitura do lake)
+    ptax = ptax.set_index("date")["usdbrl"]
 
-    df = btc.merge(ptax, on="date", how="left")
-    df["btc_brl"] = df["btc_usd"] * df["usdbrl"]
+    # Cripto negocia todo dia: USD/BRL as-of (última PTAX até a data) cobre fins de semana e feriados
+    ohlc = daily_ohlc(points)
+    ohlc["base"] = pd.Series([symbols.get(c, c.upper()) for c in ohlc["coin"]], index=ohlc.index, dtype=object)
+    usdbrl = asof_series(ohlc["date"], ptax) if not ohlc.empty else np.array([])
+    ohlc_brl = ohlc.copy()
+    ohlc_brl[PRICE_COLS] = ohlc[PRICE_COLS].to_numpy() * usdbrl[:, None]
+    ohlc_all = pd.concat([ohlc.assign(symbol=ohlc["base"] + "/USD"),
+                          ohlc_brl.assign(symbol=ohlc["base"] + "/BRL")], ignore_index=True)
+    ohlc_all = ohlc_all.dropna(subset=["close"])[["date", "symbol", *PRICE_COLS, "n_points"]]
 
-    out = pd.concat([
-        df[["date"]].assign(symbol="BTC/USD", price=df["btc_usd"]),
-        df[["date"]].assign(symbol="BTC/BRL", price=df["btc_brl"])
-    ], ignore_index=True).dropna()
+    btc = btc.assign(usdbrl=asof_series(btc["date"], ptax))
+    legacy = pd.concat([
+        btc[["date"]].assign(symbol="BTC/USD", price=btc["btc_usd"]),
+        btc[["date"]].assign(symbol="BTC/BRL", price=btc["btc_usd"] * btc["usdbrl"]),
+    ], ignore_index=True)
+    # Fechamento do OHLC tem prioridade; o legado só completa datas/símbolos sem pontos intraday
+    out = pd.concat([ohlc_all[["date", "symbol"]].assign(price=ohlc_all["close"]), legacy], ignore_index=True)
+    out = out.dropna().drop_duplicates(subset=["date", "symbol"], keep="first")
+    return ohlc_all, out
 
-    out.to_sql(OUT_TABLE.split(".")[1], eng, schema=OUT_TABLE.split(".")[0],
-               if_exists="append", index=False,
-               dtype={"date": Date(), "symbol": String(16), "price": Float()})
-    logger.success(f"SILVER CRYPTO -> {OUT_TABLE}: {len(out)} linhas.")
+def process_range(eng, lo, hi, symbols: dict) -> tuple[int, dict]:
+    points = read_table(eng, POINTS_TABLE, ["coin", "ts", "price", "volume"], lo, hi)
+    # Histórico diário do ingestor legado (só BTC): vale para as datas sem pontos intraday
+    btc = read_table(eng, LEGACY_TABLE, ["date", "btc_usd"], lo, hi)
+    # PTAX só tem dias úteis: lê um pouco antes da faixa para o as-of dos primeiros dias
+    ptax = read_table(eng, "md_bronze.ptax_usdbrl_raw", ["date", "usdbrl"], lookback_start(lo), hi)
+    ohlc_all, out = transform(points, btc, ptax, symbols)
+    lasts = {**series_lasts(points, "coin", "coin:", date_col="ts"), **series_lasts(btc, name="btc_usd"),
+             **series_lasts(ptax, name="ptax")}
+    del points, btc
+    upsert(eng, OHLC_TABLE, ohlc_all, key_cols=["date", "symbol"],
+           dtype={"date": Date(), "symbol": String(16), **{c: Float() for c in PRICE_COLS}, "n_points": Integer()})
+    upsert(eng, OUT_TABLE, out, key_cols=["date", "symbol"],
+           dtype={"date": Date(), "symbol": String(16), "price": Float()})
+    return len(ohlc_all) + len(out), lasts
+
+def main():
+    eng = get_engine()
+    start = incremental_start(eng, *CHECKPOINT)
+    symbols = {c["id"]: c["symbol"] for c in coin_list(load_sources_yaml().get("coingecko") or {})}
+    # Pontos intraday são a maior parte; o diário legado (só BTC) entra na contagem para cair nas faixas
+    parts = date_partitions(eng, [POINTS_TABLE, LEGACY_TABLE], start, chunk_rows())
+    total = run_ranges(eng, CHECKPOINT, parts, lambda lo, hi: process_range(eng, lo, hi, symbols))
+    logger.success(f"SILVER CRYPTO -> {OHLC_TABLE} e {OUT_TABLE}: {total} linhas.")
 
 if __name__ == "__main__":
     main()
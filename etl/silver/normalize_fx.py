@@ -1,66 +1,78 @@
+import numpy as np
 import pandas as pd
-from sqlalchemy import text
 from loguru import logger
-from etl.common.db import get_engine
+from etl.common.db import get_engine, upsert
+from etl.common.bronze_input import read_table
+from etl.common.io import load_sources_yaml
+from etl.silver.fx_cross import CrossRateMatrix, DEFAULT_MATERIALIZE
+from etl.common.watermark import incremental_start, series_lasts
+from etl.common.trading_calendar import asof_frame, asof_series, lookback_start
+from etl.common.stream import chunk_rows, date_partitions, run_ranges
 from sqlalchemy.types import Date, String, Float
 
 OUT_TABLE = "md_silver.fx_rates"
+CHECKPOINT = ("silver", "fx_rates")
 
-def main():
-    eng = get_engine()
-    # ECB
-    q_ecb = """
-        SELECT date, code, rate_vs_eur
-        FROM md_bronze.ecb_fx_raw
-    """
-    ecb = pd.read_sql(q_ecb, eng)
+def transform(ecb: pd.DataFrame, ptax: pd.DataFrame, lo, hi, patterns: list[str]) -> pd.DataFrame:
+    """Bronze ECB + PTAX (com lookback antes de `lo`) -> pares materializados nas datas [lo, hi]."""
+    # Bronze já chega única por chave (PK no banco; dedup na gravação e na leitura do lake) e o as-of ordena
     ecb["date"] = pd.to_datetime(ecb["date"]).dt.date
-    ecb = ecb.sort_values("date").drop_duplicates(subset=["date", "code"], keep="last")
-
-    # PTAX USD/BRL
-    q_ptax = "SELECT date, usdbrl FROM md_bronze.ptax_usdbrl_raw"
-    ptax = pd.read_sql(q_ptax, eng)
     ptax["date"] = pd.to_datetime(ptax["date"]).dt.date
-    ptax = ptax.sort_values("date").drop_duplicates(subset=["date"], keep="last")
 
-    # junta
-    base = ecb.pivot(index="date", columns="code", values="rate_vs_eur").reset_index()
-    # Colunas possíveis: USD, BRL, GBP, EUR(=1)
-    # Deriva EUR se não vier (garantia)
-    if "EUR" not in base.columns:
-        base["EUR"] = 1.0
+    # Datas de saída: dias com cotação em qualquer das fontes (união dos calendários ECB e BACEN)
+    targets = pd.DatetimeIndex(sorted(set(ecb["date"]) | set(ptax["date"])))
+    targets = targets[(targets >= pd.Timestamp(lo)) & (targets <= pd.Timestamp(hi))]
+    if targets.empty:
+        return pd.DataFrame(columns=["date", "pair", "rate"])
 
-    # Merge com PTAX (USD/BRL)
-    df = base.merge(ptax, on="date", how="left")
+    # Matriz data × moeda com unidades por 1 EUR (convenção do ECB: D.USD.EUR = USD por EUR),
+    # alinhada por as-of nas datas de saída; USD/BRL da PTAX idem
+    wide = ecb.pivot(index="date", columns="code", values="rate_vs_eur")
+    vs_eur = asof_frame(targets, wide)
+    if "EUR" not in vs_eur.columns:
+        vs_eur["EUR"] = 1.0
+    usdbrl = pd.Series(asof_series(targets, ptax.set_index("date")["usdbrl"]), index=targets)
+    # BRL por EUR: PTAX (USD/BRL × USD por EUR) tem prioridade; a série BRL do ECB cobre as lacunas
+    brl_per_eur = usdbrl * vs_eur["USD"] if "USD" in vs_eur.columns else pd.Series(np.nan, index=vs_eur.index)
+    if "BRL" in vs_eur.columns:
+        brl_per_eur = brl_per_eur.fillna(vs_eur["BRL"])
 
-    # Deriva BRL/EUR se faltou (a partir de USD/EUR e USD/BRL)
-    # rate_vs_eur significa: 1 CODE = X EUR (na prática ECB é quoted vs EUR, então invertido)
-    # ECB "D.USD.EUR.SP00.A": 1 USD in EUR. Logo USD/EUR.
-    # Queremos CODE/BRL. Fórmulas:
-    #   CODE/BRL = (CODE/EUR) / (BRL/EUR)
-    # Mas do PTAX temos USD/BRL. E do ECB temos USD/EUR.
-    # Podemos obter BRL/EUR = (BRL/USD) * (USD/EUR) = (1 / USD/BRL) * (USD/EUR)
-    df["brl_per_eur"] = (1.0 / df["usdbrl"]) * df["USD"]  # BRL/EUR
-    # Para cada moeda CODE:
-    rates = []
-    for code in [c for c in df.columns if c not in ("date","usdbrl","brl_per_eur")]:
-        # CODE/EUR já está como df[code]
-        # CODE/BRL = (CODE/EUR) / (BRL/EUR)
-        rates.append(
-            df[["date", code, "brl_per_eur"]]
-              .assign(pair=lambda x: x.columns[1]+"/BRL",
-                      rate=lambda x: x.iloc[:,1] / x["brl_per_eur"])
-              .rename(columns={"date":"date"})
-              [["date","pair","rate"]]
-        )
-    out = pd.concat(rates, ignore_index=True)
+    matrix = CrossRateMatrix.from_vs_eur(vs_eur, brl_per_eur)
+    pairs = matrix.select(patterns)
+    out = matrix.to_long(pairs)
+    out["date"] = pd.to_datetime(out["date"]).dt.date
+    logger.info(f"SILVER FX {lo} → {targets.max().date()}: {len(matrix.codes)} moedas, {len(pairs)} pares materializados")
+    return out.sort_values(["pair", "date"])
 
-    # Persistir Silver
-    out = out.dropna().sort_values(["pair","date"])
-    out.to_sql(OUT_TABLE.split(".")[1], eng, schema=OUT_TABLE.split(".")[0],
-               if_exists="append", index=False,
-               dtype={"date": Date(), "pair": String(16), "rate": Float()})
-    logger.success(f"SILVER FX -> {OUT_TABLE}: {len(out)} linhas.")
+def process_range(eng, lo, hi, patterns: list[str]) -> tuple[int, dict]:
+    # Lookback por faixa: ECB (TARGET) e BACEN têm feriados diferentes; o as-of precisa da última cotação antes dela
+    ecb = read_table(eng, "md_bronze.ecb_fx_raw", ["date", "code", "rate_vs_eur"], lookback_start(lo), hi)
+    if ecb.empty:
+        return 0, {}
+    ptax = read_table(eng, "md_bronze.ptax_usdbrl_raw", ["date", "usdbrl"], lookback_start(lo), hi)
+    out = transform(ecb, ptax, lo, hi, patterns)
+    lasts = {**series_lasts(ecb, name="ecb"), **series_lasts(ptax, name="ptax")}
+    del ecb, ptax
+    upsert(eng, OUT_TABLE, out, key_cols=["date", "pair"],
+           dtype={"date": Date(), "pair": String(16), "rate": Float()})
+    return len(out), lasts
+
+def main():
+    eng = get_engine()
+    fx_cfg = load_sources_yaml().get("fx") or {}
+    # CODE/BRL sempre materializado: é a base do lookup sob demanda (etl.silver.fx_cross.cross_rate)
+    patterns = list(dict.fromkeys([*DEFAULT_MATERIALIZE, *fx_cfg.get("materialize", [])]))
+    # Delta: só datas a partir do checkpoint da silver (menos overlap p/ revisões tardias); o checkpoint fica na
+    # última data da fonte mais atrasada, então a PTAX publicada depois do ECB ainda recalcula os pares em BRL
+    start = incremental_start(eng, *CHECKPOINT)
+    logger.info(f"SILVER FX: processando bronze a partir de {start} ({patterns})")
+    # Faixas de data dentro do orçamento de memória (o ECB domina: uma linha por moeda por dia)
+    parts = date_partitions(eng, ["md_bronze.ecb_fx_raw", "md_bronze.ptax_usdbrl_raw"], start, chunk_rows())
+    total = run_ranges(eng, CHECKPOINT, parts, lambda lo, hi: process_range(eng, lo, hi, patterns))
+    if not total:
+        logger.info("SILVER FX: nada novo na bronze.")
+        return
+    logger.success(f"SILVER FX -> {OUT_TABLE}: {total} linhas.")
 
 if __name__ == "__main__":
     main()
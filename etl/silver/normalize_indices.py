@@ -1,28 +1,59 @@
 import pandas as pd
-from sqlalchemy.types import Date, String, Float, BigInteger
+from sqlalchemy.types import Date, String, Float, BigInteger, Boolean
 from loguru import logger
-from etl.common.db import get_engine
+from etl.common.db import get_engine, upsert
+from etl.common.bronze_input import read_table
+from etl.common.watermark import incremental_start, series_lasts
+from etl.common.trading_calendar import is_business_day
+from etl.common.stream import chunk_rows, date_partitions, run_ranges
+
+# Calendário de pregão por índice; os demais só descartam fins de semana
+INDEX_MARKETS = {"^bvsp": "BR", "^spx": "US", "^dji": "US", "^ndq": "US", "^ndx": "US"}
 
 OUT_TABLE = "md_silver.index_ohlc"
+CHECKPOINT = ("silver", "index_ohlc")
+SOURCE_TABLE = "md_bronze.stooq_index_raw"
+COLUMNS = ["date", "code", "name", "open", "high", "low", "close", "volume"]
 
-def main():
-    eng = get_engine()
-    q = """
-      SELECT date, code, name, open, high, low, close, volume
-      FROM md_bronze.stooq_index_raw
-    """
-    df = pd.read_sql(q, eng)
+def transform(df: pd.DataFrame) -> pd.DataFrame:
     df["date"] = pd.to_datetime(df["date"]).dt.date
     df.rename(columns={"code":"index_code","name":"index_name"}, inplace=True)
+    # Linhas em dia sem pregão (ex.: fechamento anterior repetido no feriado) ficam marcadas, não descartadas:
+    # o calendário é uma lista fixa de feriados e um erro nele não pode apagar fechamentos reais da bronze
+    trading = pd.Series(pd.to_datetime(df["date"]).dt.dayofweek < 5, index=df.index)
+    for code, market in INDEX_MARKETS.items():
+        mask = (df["index_code"] == code).to_numpy()
+        if mask.any():
+            trading[mask] = is_business_day(market, df.loc[mask, "date"])
+    df["is_trading_day"] = trading.astype(bool)
+    if (~trading).any():
+        off = df.loc[~trading, ["index_code", "date"]].groupby("index_code")["date"].agg(["count", "min", "max"])
+        logger.warning(f"SILVER INDEX: {int((~trading).sum())} linha(s) fora do calendário de pregão "
+                       f"(is_trading_day = false): " + ", ".join(f"{c} {r['count']}x {r['min']}..{r['max']}"
+                                                            for c, r in off.iterrows()))
+    return df
 
-    df.to_sql(OUT_TABLE.split(".")[1], eng, schema=OUT_TABLE.split(".")[0],
-              if_exists="append", index=False,
-              dtype={
+def process_range(eng, lo, hi) -> tuple[int, dict]:
+    df = read_table(eng, SOURCE_TABLE, COLUMNS, lo, hi)
+    if df.empty:
+        return 0, {}
+    df = transform(df)
+    upsert(eng, OUT_TABLE, df, key_cols=["date", "index_code"],
+           dtype={
                 "date": Date(), "index_code": String(16), "index_name": String(64),
                 "open": Float(), "high": Float(), "low": Float(), "close": Float(),
-                "volume": Float()
+                "volume": Float(), "is_trading_day": Boolean()
               })
-    logger.success(f"SILVER INDEX -> {OUT_TABLE}: {len(df)} linhas.")
+    # Checkpoint por índice: Stooq e Yahoo gravam a mesma tabela e um pode chegar dias depois do outro
+    return len(df), series_lasts(df, "index_code")
+
+def main():
+    eng = get_engine()
+    start = incremental_start(eng, *CHECKPOINT)
+    # Uma faixa de datas por vez (orçamento de memória); o dedup por (date, index_code) fica dentro da faixa
+    parts = date_partitions(eng, SOURCE_TABLE, start, chunk_rows())
+    total = run_ranges(eng, CHECKPOINT, parts, lambda lo, hi: process_range(eng, lo, hi))
+    logger.success(f"SILVER INDEX -> {OUT_TABLE}: {total} linhas.")
 
 if __name__ == "__main__":
     main()
@@ -1,26 +1,72 @@
 # scripts/run_all.py
-import subprocess, sys
+# Runner in-process: Bronze → Silver → Gold como DAG, com fontes independentes em paralelo.
+#   python scripts/run_all.py                       # tudo
+#   python scripts/run_all.py --only normalize_fx   # só as etapas listadas
+#   python scripts/run_all.py --from normalize_fx   # a etapa e tudo que depende dela
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+from etl.common.dag import Node, run_dag, select
+from etl.common.db import get_engine
+from etl.common.schema import ensure_schema
+from etl.common import telemetry
+
+SILVER = ("normalize_fx", "normalize_crypto", "normalize_indices")
 
 PIPELINES = [
     # BRONZE
-    "etl.bronze.ingest_ecb_fx",
-    "etl.bronze.ingest_ptax_usdbrl",
-    "etl.bronze.ingest_coingecko_btcusd",
-    "etl.bronze.ingest_stooq_indices",
-    "etl.bronze.ingest_yahoo_index",
+    Node("ingest_ecb_fx", "etl.bronze.ingest_ecb_fx"),
+    Node("ingest_ptax_usdbrl", "etl.bronze.ingest_ptax_usdbrl"),
+    Node("ingest_coingecko_crypto", "etl.bronze.ingest_coingecko_crypto"),
+    Node("ingest_stooq_indices", "etl.bronze.ingest_stooq_indices"),
+    Node("ingest_yahoo_index", "etl.bronze.ingest_yahoo_index"),
     # SILVER
-    "etl.silver.normalize_fx",
-    "etl.silver.normalize_crypto",
-    "etl.silver.normalize_indices",
+    # A PTAX entra em todas as linhas (CODE/BRL, BTC/BRL): sem ela o as-of usaria a última PTAX velha e o
+    # checkpoint avançaria por cima dessas datas
+    Node("normalize_fx", "etl.silver.normalize_fx", ("ingest_ecb_fx", "ingest_ptax_usdbrl"), ("ingest_ptax_usdbrl",)),
+    Node("normalize_crypto", "etl.silver.normalize_crypto", ("ingest_coingecko_crypto", "ingest_ptax_usdbrl"),
+         ("ingest_ptax_usdbrl",)),
+    Node("normalize_indices", "etl.silver.normalize_indices", ("ingest_stooq_indices", "ingest_yahoo_index")),
     # GOLD
-    "etl.gold.build_gold",
+    # Só com toda a silver atualizada: com uma etapa da silver falha, a gold leria a série dela parada
+    Node("build_gold", "etl.gold.build_gold", SILVER, SILVER),
+    Node("build_rollups", "etl.gold.build_rollups", ("build_gold",), ("build_gold",)),
+    Node("build_features", "etl.gold.build_features", ("build_gold",), ("build_gold",)),
 ]
 
-def run(mod: str) -> int:
-    print(f"\n>>> python -m {mod}")
-    return subprocess.run([sys.executable, "-m", mod], check=True).returncode
+def _csv(value: str | None) -> list[str] | None:
+    return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Executa o pipeline Bronze → Silver → Gold")
+    ap.add_argument("--only", help="etapas separadas por vírgula (sem dependências)")
+    ap.add_argument("--from", dest="start_from", help="etapa(s) inicial(is); roda também tudo a jusante")
+    ap.add_argument("--workers", type=int, default=5, help="etapas simultâneas (default: 5)")
+    ap.add_argument("--list", action="store_true", help="lista as etapas e sai")
+    args = ap.parse_args(argv)
+
+    if args.list:
+        for n in PIPELINES:
+            print(f"{n.name:<26} <- {', '.join(f'{d}!' if d in n.hard else d for d in n.deps) or '-'}")
+        return 0
+
+    nodes = select(PIPELINES, only=_csv(args.only), start_from=_csv(args.start_from))
+    t0 = time.perf_counter()
+    # DDL gerenciado (PKs/índices/partições) antes de qualquer escrita
+    ensure_schema(get_engine())
+    result = run_dag(nodes, max_workers=args.workers)
+    for n in nodes:
+        logger.info(f"{n.name:<26} {result.status[n.name]:<8} {result.elapsed.get(n.name, 0):>7.1f}s")
+    json_path, prom_path = telemetry.export()
+    logger.info(f"Telemetria da execução {telemetry.run_id()}: {json_path}, {prom_path}")
+    telemetry.check_regressions()
+    if not result.ok:
+        logger.error(f"Pipeline terminou com falhas em {time.perf_counter() - t0:.1f}s.")
+        return 1
+    print(f"\nOK! Bronze → Silver → Gold finalizado em {time.perf_counter() - t0:.1f}s.")
+    return 0
 
 if __name__ == "__main__":
-    for m in PIPELINES:
-        run(m)
-    print("\nOK! Bronze → Silver → Gold finalizado.")
+    sys.exit(main())
@@ -0,0 +1,11 @@
+import pytest
+from etl.common import backend
+from etl.common.schema import migrate
+
+@pytest.fixture
+def engine(tmp_path):
+    # Banco SQLite descartável no estado final das migrações (um arquivo por schema em tmp_path)
+    eng = backend.embedded_engine(f"sqlite:///{tmp_path}/md.sqlite")
+    migrate(eng)
+    yield eng
+    eng.dispose()
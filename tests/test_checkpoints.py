@@ -0,0 +1,42 @@
+from datetime import date
+import pandas as pd
+from etl.common.db import upsert, read_sql
+from etl.common.watermark import get_watermark, low_watermark, merge_lasts, series_lasts
+from etl.silver import normalize_indices
+
+def _bronze(code: str, days) -> pd.DataFrame:
+    days = pd.to_datetime(list(days))
+    return pd.DataFrame({"date": days.date, "code": code, "name": code.upper(), "open": 1.0, "high": 2.0,
+                         "low": 0.5, "close": range(len(days)), "volume": 10.0})
+
+def test_low_watermark_is_the_lagging_series():
+    lasts = merge_lasts({}, {"a": "2025-03-10", "b": pd.Timestamp("2025-03-04")})
+    merge_lasts(lasts, {"a": date(2025, 3, 7)})
+    assert lasts == {"a": date(2025, 3, 10), "b": date(2025, 3, 4)}
+    assert low_watermark(lasts) == date(2025, 3, 4)
+
+def test_low_watermark_ignores_stale_series():
+    lasts = {"a": date(2025, 3, 31), "b": date(2025, 1, 2), "c": date(2025, 3, 28)}
+    assert low_watermark(lasts, max_lag_days=30) == date(2025, 3, 28)
+    assert low_watermark({}) is None
+
+def test_series_lasts_per_key():
+    df = pd.DataFrame({"date": pd.to_datetime(["2025-03-03", "2025-03-05", "2025-03-04"]), "k": ["x", "x", "y"]})
+    assert series_lasts(df, "k", "t:") == {"t:x": pd.Timestamp("2025-03-05"), "t:y": pd.Timestamp("2025-03-04")}
+    assert series_lasts(df, name="t") == {"t": pd.Timestamp("2025-03-05")}
+
+def test_lagging_index_rows_land_in_silver(engine, monkeypatch):
+    monkeypatch.setattr(normalize_indices, "get_engine", lambda: engine)
+    month = pd.bdate_range("2025-03-03", "2025-03-28")
+    key = ["date", "code"]
+    # Stooq (^spx) já tem o mês; o Yahoo (^bvsp) só os 3 primeiros dias
+    upsert(engine, "md_bronze.stooq_index_raw", pd.concat([_bronze("^spx", month), _bronze("^bvsp", month[:3])]), key)
+    normalize_indices.main()
+    assert get_watermark(engine, *normalize_indices.CHECKPOINT) == month[2].date()
+
+    # O resto do ^bvsp chega depois, com datas bem antes da última do ^spx (além do overlap)
+    upsert(engine, "md_bronze.stooq_index_raw", _bronze("^bvsp", month[3:]), key)
+    normalize_indices.main()
+    silver = read_sql("SELECT index_code, COUNT(*) AS n FROM md_silver.index_ohlc GROUP BY index_code", engine)
+    assert silver.set_index("index_code")["n"].to_dict() == {"^bvsp": len(month), "^spx": len(month)}
+    assert get_watermark(engine, *normalize_indices.CHECKPOINT) == month[-1].date()
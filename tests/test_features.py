@@ -0,0 +1,48 @@
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from etl.common.db import upsert
+from etl.gold.build_features import (compute_features, read_state, warmup_days, FEATURES_TABLE, EMA_SPANS,
+                                     VOL_WINDOWS, SMA_WINDOWS)
+
+COLS = ["log_return", *[f"vol_{w}" for w in VOL_WINDOWS], *[f"sma_{w}" for w in SMA_WINDOWS],
+        *[f"ema_{s}" for s in EMA_SPANS], "peak", "drawdown"]
+
+def _closes() -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    days = pd.bdate_range("2023-01-02", periods=600)
+    frames = [pd.DataFrame({"asset_class": cls, "series_code": code, "date": days,
+                            "close": 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))})
+              for cls, code in (("fx", "USD/BRL"), ("index", "^spx"))]
+    # Uma série nasce dentro da janela retomada: sem estado, as EMAs começam na primeira linha dela
+    late = days[days >= "2024-11-01"]
+    frames.append(pd.DataFrame({"asset_class": "crypto", "series_code": "sol", "date": late,
+                                "close": np.linspace(20, 30, len(late))}))
+    return pd.concat(frames).sort_values(["asset_class", "series_code", "date"], ignore_index=True)
+
+@pytest.mark.parametrize("start", ["2024-03-15", "2024-10-01"])
+def test_resume_from_saved_state_matches_single_pass(engine, start):
+    start = pd.Timestamp(start)
+    closes = _closes()
+    full = compute_features(closes)
+
+    # Primeira passada gravada até start; a segunda lê o estado do banco e só o aquecimento dos fechamentos
+    saved = full[full["date"] < start]
+    upsert(engine, FEATURES_TABLE, saved[["date", "asset_class", "series_code", "close", *COLS]]
+           .assign(date=saved["date"].dt.date), key_cols=["date", "asset_class", "series_code"])
+    state = read_state(engine, start.date())
+    assert len(state) == 2
+    window = closes[closes["date"] >= start - timedelta(days=warmup_days())]
+    resumed = compute_features(window, state)
+
+    got = resumed[resumed["date"] >= start].set_index(["asset_class", "series_code", "date"])[COLS]
+    want = full[full["date"] >= start].set_index(["asset_class", "series_code", "date"])[COLS]
+    pd.testing.assert_frame_equal(got, want, rtol=1e-9)
+
+def test_without_state_emas_restart_at_the_window():
+    closes = _closes()
+    window = closes[closes["date"] >= "2024-03-15"]
+    first = compute_features(window).groupby("series_code").head(1)
+    assert (first["ema_12"] == first["close"]).all()
+    assert (first["peak"] == first["close"]).all()
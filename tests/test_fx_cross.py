@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+from etl.silver.fx_cross import CrossRateMatrix
+
+DATES = pd.to_datetime(["2025-03-03", "2025-03-04"])
+
+def _matrix() -> CrossRateMatrix:
+    # Convenção do ECB: unidades da moeda por 1 EUR; GBP sem cotação em 04/03; a coluna BRL do ECB é ignorada
+    vs_eur = pd.DataFrame({"USD": [1.10, 1.20], "GBP": [0.85, np.nan], "EUR": [1.0, 1.0], "BRL": [9.9, 9.9]},
+                          index=DATES)
+    return CrossRateMatrix.from_vs_eur(vs_eur, pd.Series([5.5, 6.0], index=DATES))
+
+def _rates(df: pd.DataFrame) -> dict[tuple[str, str], float]:
+    return {(str(d.date()), p): r for d, p, r in df[["date", "pair", "rate"]].itertuples(index=False)}
+
+def test_code_brl_is_brl_per_eur_over_code_per_eur():
+    m = _matrix()
+    got = _rates(m.to_long(m.select(["*/BRL"])))
+    assert got == pytest.approx({
+        ("2025-03-03", "USD/BRL"): 5.5 / 1.10, ("2025-03-03", "GBP/BRL"): 5.5 / 0.85,
+        ("2025-03-03", "EUR/BRL"): 5.5,
+        ("2025-03-04", "USD/BRL"): 6.0 / 1.20, ("2025-03-04", "EUR/BRL"): 6.0,
+    })
+
+def test_crosses_and_brl_leg():
+    m = _matrix()
+    got = _rates(m.to_long(m.select(["GBP/USD", "BRL/*"])))
+    assert got == pytest.approx({
+        ("2025-03-03", "GBP/USD"): 1.10 / 0.85,
+        ("2025-03-03", "BRL/USD"): 1.10 / 5.5, ("2025-03-04", "BRL/USD"): 1.20 / 6.0,
+        ("2025-03-03", "BRL/GBP"): 0.85 / 5.5,
+        ("2025-03-03", "BRL/EUR"): 1 / 5.5, ("2025-03-04", "BRL/EUR"): 1 / 6.0,
+    })
+    assert m.rate("GBP", "USD").isna().tolist() == [False, True]
+
+def test_all_pairs_and_missing_currency():
+    m = _matrix()
+    assert m.codes == ["USD", "GBP", "EUR", "BRL"]
+    # 4 × 3 pares no dia 03; no dia 04 só os 3 × 2 sem GBP
+    assert len(m.to_long()) == 12 + 6
+    assert m.select(["JPY/*", "*/JPY"]) == []
+    assert m.to_long([]).empty
+    with pytest.raises(KeyError):
+        m.rate("JPY", "BRL")
+
+def test_anchor_pairs_round_trip():
+    m = _matrix()
+    back = CrossRateMatrix.from_anchor_pairs(m.to_long(m.select(["*/BRL"])))
+    assert back.rate("GBP", "USD").iloc[0] == pytest.approx(1.10 / 0.85)
+    assert back.rate("USD", "EUR").tolist() == pytest.approx([1 / 1.10, 1 / 1.20])
@@ -0,0 +1,99 @@
+import os
+from datetime import date
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from etl.common import lake
+
+KEYS = ["date", "code"]
+
+def _fx(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=["date", "code", "rate_vs_eur"])
+
+def _load(df: pd.DataFrame, root: str) -> lake.BronzeDelta:
+    # Como os ingestores: dedup, grava o delta (com a flag de revisão) e só então registra os hashes
+    delta = lake.dedup_bronze(df, "ecb", KEYS, root=root)
+    lake.write_bronze(delta.df, "ecb", KEYS, symbol_col="code", revision=delta.revision, root=root)
+    delta.commit()
+    return delta
+
+def _index(root: str) -> dict:
+    return lake.load_hashes("ecb", root).to_dict()
+
+def test_row_hashes_ignore_column_order_and_representation():
+    a = _fx([(date(2025, 3, 3), "USD", 1), (date(2025, 3, 4), "USD", 2)])
+    b = a[["rate_vs_eur", "code", "date"]].assign(date=pd.to_datetime(a["date"]), rate_vs_eur=[1.0, 2.0])
+    ka, ra = lake.row_hashes(a, KEYS)
+    kb, rb = lake.row_hashes(b, KEYS)
+    assert (ka == kb).all() and (ra == rb).all()
+    _, rc = lake.row_hashes(a.assign(rate_vs_eur=[1, 3]), KEYS)
+    assert ra[0] == rc[0] and ra[1] != rc[1]
+
+def test_dedup_splits_new_revised_and_repeated(tmp_path):
+    root = str(tmp_path)
+    d1, d2, d3 = date(2025, 3, 3), date(2025, 3, 4), date(2025, 3, 5)
+    first = _load(_fx([(d1, "USD", 1.08), (d1, "GBP", 0.84), (d2, "USD", 1.09)]), root)
+    assert (len(first.df), first.skipped, first.revision.any()) == (3, 0, False)
+
+    # d1 repetido (inclusive como Timestamp), d2 revisado, d3 novo e repetido no próprio frame (o último vence)
+    again = _fx([(pd.Timestamp(d1), "USD", 1.08), (d1, "GBP", 0.84), (d2, "USD", 1.10),
+                 (d3, "USD", 1.00), (d3, "USD", 1.11)])
+    delta = _load(again, root)
+    assert delta.skipped == 2
+    got = {(str(r.date), r.code): (r.rate_vs_eur, rev) for r, rev in zip(delta.df.itertuples(), delta.revision)}
+    assert got == {("2025-03-04", "USD"): (1.10, True), ("2025-03-05", "USD"): (1.11, False)}
+    assert len(_index(root)) == 4
+
+    # O mesmo frame de novo: nada a gravar
+    assert lake.dedup_bronze(again, "ecb", KEYS, root=root).df.empty
+    rev = lake.read_bronze("ecb", root=root, columns=["date", "code", "rate_vs_eur", "revision"])
+    assert rev.set_index(["code", "date"]).loc[("USD", date(2025, 3, 4)), "revision"]
+
+def test_compact_rebuilds_a_missing_hash_index(tmp_path):
+    root = str(tmp_path)
+    _load(_fx([(date(2025, 3, 3), "USD", 1.08), (date(2025, 3, 4), "USD", 1.09)]), root)
+    _load(_fx([(date(2025, 3, 4), "USD", 1.10), (date(2025, 3, 5), "USD", 1.11)]), root)
+    before = _index(root)
+    assert lake.compact("ecb", root=root) == 1
+    assert _index(root) == before
+
+    os.remove(os.path.join(lake.source_dir("ecb", root), "_hashes.parquet"))
+    lake.compact("ecb", root=root)
+    assert _index(root) == before
+    assert lake.rebuild_hashes("ecb", root=root) == 3
+    assert _index(root) == before
+    # Com o índice reconstruído, o overlap re-enviado continua sendo descartado
+    delta = lake.dedup_bronze(_fx([(date(2025, 3, 4), "USD", 1.10), (date(2025, 3, 5), "USD", 1.11)]),
+                              "ecb", KEYS, root=root)
+    assert delta.df.empty and delta.skipped == 2
+
+def _stooq(days, volume) -> pd.DataFrame:
+    days = pd.to_datetime(list(days)).date
+    return pd.DataFrame({"date": days, "code": "^spx", "name": "S&P 500", "open": 1.0, "high": 2.0, "low": 0.5,
+                         "close": 1.5, "volume": volume})
+
+def test_parser_ints_are_written_as_doubles(tmp_path):
+    root = str(tmp_path)
+    (rel,) = lake.write_bronze(_stooq(["2025-03-03"], [100]), "stooq", KEYS, symbol_col="code", root=root)
+    schema = pq.read_schema(os.path.join(lake.source_dir("stooq", root), rel))
+    assert schema.field("volume").type == pa.float64()
+
+def test_compact_merges_int_and_double_files(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    # Arquivos gravados antes do _conform: volume int64 quando não falta valor, double quando falta
+    monkeypatch.setattr(lake, "_conform", lambda df, source: df)
+    lake.write_bronze(_stooq(["2025-03-03", "2025-03-04"], [100, 200]), "stooq", KEYS, symbol_col="code", root=root)
+    lake.write_bronze(_stooq(["2025-03-04", "2025-03-05"], [250, None]), "stooq", KEYS, symbol_col="code",
+                      root=root)
+    lake.write_bronze(_stooq(["2025-04-01"], [300]), "stooq", KEYS, symbol_col="code", root=root)
+    types = {str(pq.read_schema(f).field("volume").type) for f in lake.select_files("stooq", root=root)}
+    assert types == {"int64", "double"}
+    monkeypatch.undo()
+
+    assert lake.compact("stooq", root=root) == 1
+    df = lake.read_bronze("stooq", root=root, columns=["date", "code", "volume"])
+    assert df["volume"].dtype == "float64"
+    got = dict(zip(df["date"].astype(str), df["volume"]))
+    assert got["2025-03-03"] == 100 and got["2025-03-04"] == 250 and pd.isna(got["2025-03-05"])
+    assert got["2025-04-01"] == 300
+    assert len(lake.select_files("stooq", root=root)) == 2
@@ -0,0 +1,64 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+import pytest
+from etl.gold.build_rollups import rollup, period_start
+
+# Sex 27/12/2024 até seg 06/01/2025: a semana de 30/12 atravessa a virada do ano
+DAYS = pd.to_datetime(["2024-12-27", "2024-12-30", "2024-12-31", "2025-01-02", "2025-01-03", "2025-01-06"])
+
+def _daily(key: str = "A", close=(10.0, 11.0, 12.0, 13.0, 14.0, 15.0)) -> pd.DataFrame:
+    close = np.asarray(close, dtype="float64")
+    return pd.DataFrame({"date": DAYS, "k": key, "open": close - 0.5, "high": close + 1.0, "low": close - 1.0,
+                         "close": close})
+
+def _rows(out: pd.DataFrame) -> dict:
+    return {(r.k, str(r.period_start)): r for r in out.itertuples(index=False)}
+
+def test_period_start_edges():
+    assert period_start(date(2025, 1, 5), "W") == date(2024, 12, 30)      # domingo fecha a semana
+    assert period_start(date(2025, 1, 6), "W") == date(2025, 1, 6)        # segunda abre outra
+    assert period_start(date(2024, 12, 31), "M") == date(2024, 12, 1)
+    assert period_start(date(2025, 1, 1), "Y") == date(2025, 1, 1)
+
+def test_weekly_buckets_cross_the_year():
+    w = _rows(rollup(_daily(), "k", "W"))
+    assert list(w) == [("A", "2024-12-23"), ("A", "2024-12-30"), ("A", "2025-01-06")]
+    week = w[("A", "2024-12-30")]
+    assert (str(week.period_end), week.n_days) == ("2025-01-03", 4)
+    assert (week.open, week.high, week.low, week.close) == (10.5, 15.0, 10.0, 14.0)
+    assert week.avg_close == pytest.approx(12.5)
+    assert week.return_pct == pytest.approx(14 / 10 - 1)
+    assert np.isnan(w[("A", "2024-12-23")].return_pct)
+
+@pytest.mark.parametrize("grain", ["M", "Y"])
+def test_month_and_year_split_at_new_year(grain):
+    out = _rows(rollup(_daily(), "k", grain))
+    first = "2024-12-01" if grain == "M" else "2024-01-01"
+    dec, jan = out[("A", first)], out[("A", "2025-01-01")]
+    assert (dec.open, dec.high, dec.low, dec.close, dec.n_days) == (9.5, 13.0, 9.0, 12.0, 3)
+    assert (jan.open, jan.high, jan.low, jan.close, jan.n_days) == (12.5, 16.0, 12.0, 15.0, 3)
+    assert str(dec.period_end) == "2024-12-31"
+    assert jan.return_pct == pytest.approx(15 / 12 - 1)
+
+def test_returns_do_not_leak_across_series_and_skip_missing_close():
+    daily = pd.concat([_daily("A"), _daily("B", (20.0, 21.0, np.nan, 23.0, 24.0, 25.0))])
+    out = _rows(rollup(daily, "k", "M"))
+    assert np.isnan(out[("B", "2024-12-01")].return_pct)
+    assert out[("B", "2024-12-01")].close == 21.0 and out[("B", "2024-12-01")].n_days == 2
+    assert out[("B", "2025-01-01")].return_pct == pytest.approx(25 / 21 - 1)
+
+@pytest.mark.parametrize("start", [date(2025, 1, 2), date(2024, 12, 31)])
+def test_incremental_window_matches_full_recompute(start):
+    # Como o main: lê o diário desde o período afetado mais antigo e usa o fechamento anterior como `prior`
+    daily = pd.concat([_daily("A"), _daily("B", (20.0, 21.0, 22.0, 23.0, 24.0, 25.0))])
+    affected = {g: period_start(start, g) for g in ("W", "M", "Y")}
+    read_from = pd.Timestamp(min(affected.values()))
+    prior = daily[daily["date"] < read_from].groupby("k")["close"].last()
+    for grain, first in affected.items():
+        inc = rollup(daily[daily["date"] >= read_from], "k", grain, prior)
+        inc = inc[inc["period_start"] >= first].reset_index(drop=True)
+        full = rollup(daily, "k", grain)
+        full = full[full["period_start"] >= first].reset_index(drop=True)
+        assert not inc.empty
+        pd.testing.assert_frame_equal(inc, full)
@@ -0,0 +1,12 @@
+import pandas as pd
+from etl.gold.snapshot import _hash
+
+def test_hash_is_stable_and_order_sensitive():
+    df = pd.DataFrame({"currency_pair": ["USD/BRL", "EUR/BRL"], "rate_close": [5.0, 6.0]})
+    assert _hash(df) == _hash(df.copy())
+    assert _hash(df) != _hash(df.iloc[::-1].reset_index(drop=True))
+
+def test_hash_sees_values_swapped_between_rows():
+    a = pd.DataFrame({"currency_pair": ["USD/BRL", "EUR/BRL"], "rate_close": [5.0, 6.0]})
+    b = pd.DataFrame({"currency_pair": ["USD/BRL", "EUR/BRL"], "rate_close": [6.0, 5.0]})
+    assert _hash(a) != _hash(b)
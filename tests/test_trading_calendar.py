@@ -0,0 +1,28 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+from etl.common.trading_calendar import asof_frame, asof_series, is_business_day
+
+def test_asof_series_empty_observations_is_all_nan():
+    targets = pd.to_datetime(["2024-01-02", "2024-01-03"])
+    out = asof_series(targets, pd.Series(dtype=float))
+    assert out.shape == (2,)
+    assert np.isnan(out).all()
+
+def test_asof_frame_empty_keeps_columns():
+    targets = pd.to_datetime(["2024-01-02"])
+    out = asof_frame(targets, pd.DataFrame(columns=["USD", "EUR"], dtype=float))
+    assert list(out.columns) == ["USD", "EUR"]
+    assert out.isna().all().all()
+
+def test_asof_series_uses_last_observation():
+    obs = pd.Series([5.0, 5.1], index=pd.to_datetime(["2024-01-02", "2024-01-04"]))
+    out = asof_series(pd.to_datetime(["2024-01-01", "2024-01-03", "2024-01-05"]), obs)
+    assert np.isnan(out[0])
+    assert out[1:].tolist() == [5.0, 5.1]
+
+def test_us_new_year_on_saturday_not_observed_on_friday():
+    # 01/01/2022 foi sábado: a NYSE abriu em 31/12/2021 e em 03/01/2022
+    assert is_business_day("US", [date(2021, 12, 31), date(2022, 1, 3)]).all()
+    # 01/01/2023 foi domingo: feriado compensado na segunda
+    assert not is_business_day("US", [date(2023, 1, 2)])[0]
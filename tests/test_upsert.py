@@ -0,0 +1,39 @@
+from datetime import date
+import pandas as pd
+from etl.common.db import upsert, read_sql, has_unique_key
+
+TABLE = "md_bronze.ecb_fx_raw"
+
+def _fx(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=["date", "code", "rate_vs_eur"])
+
+def _read(engine, table: str, order: str = "date, code") -> list[tuple]:
+    df = read_sql(f"SELECT * FROM {table} ORDER BY {order}", engine)
+    return [tuple(r) for r in df.itertuples(index=False)]
+
+def test_upsert_inserts_and_updates_by_primary_key(engine):
+    d1, d2 = date(2025, 3, 3), date(2025, 3, 4)
+    assert upsert(engine, TABLE, _fx([(d1, "USD", 1.08), (d1, "GBP", 0.84)]), ["date", "code"]) == 2
+    # Chave repetida atualiza; chave nova insere; repetida no próprio lote: a última vence
+    upsert(engine, TABLE, _fx([(d1, "USD", 1.09), (d2, "USD", 1.10), (d2, "USD", 1.11)]), ["date", "code"])
+    assert _read(engine, TABLE) == [("2025-03-03", "GBP", 0.84), ("2025-03-03", "USD", 1.09),
+                                    ("2025-03-04", "USD", 1.11)]
+
+def test_upsert_rerun_is_idempotent(engine):
+    df = _fx([(date(2025, 3, 3), "USD", 1.08), (date(2025, 3, 4), "USD", 1.09)])
+    upsert(engine, TABLE, df, ["date", "code"])
+    first = _read(engine, TABLE)
+    upsert(engine, TABLE, df, ["date", "code"])
+    assert _read(engine, TABLE) == first
+    assert upsert(engine, TABLE, df.head(0), ["date", "code"]) == 0
+
+def test_upsert_without_primary_key_replaces_matching_rows(engine):
+    # Tabela fora de TABLES: criada a partir do frame, sem PK (DELETE + INSERT pela chave, NULL casa com NULL)
+    table = "md_silver.bench_upsert"
+    df = pd.DataFrame({"k": ["a", "b", None], "v": [1, 2, 3]})
+    upsert(engine, table, df, ["k"])
+    assert not has_unique_key(engine, table, ["k"])
+    upsert(engine, table, pd.DataFrame({"k": ["b", None, "c"], "v": [20, 30, 40]}), ["k"])
+    upsert(engine, table, pd.DataFrame({"k": ["b", None, "c"], "v": [20, 30, 40]}), ["k"])
+    got = read_sql(f"SELECT k, v FROM {table} ORDER BY k IS NULL, k", engine)
+    assert list(got.fillna("-").itertuples(index=False, name=None)) == [("a", 1), ("b", 20), ("c", 40), ("-", 30)]
@@ -0,0 +1,120 @@
+from datetime import date, datetime, timedelta
+import pytest
+from sqlalchemy import text
+from etl.bronze import workqueue as wq
+from etl.bronze.backfill import Chunk
+from etl.common import lake
+from etl.common.schema import TASKS_TABLE
+
+T0 = datetime(2025, 3, 3, 12, 0, 0)
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Relógio da fila controlado pelo teste: clock["now"] += timedelta(...) simula o tempo passando
+    state = {"now": T0}
+    monkeypatch.setattr(wq, "_now", lambda: state["now"])
+    return state
+
+def _enqueue(engine, n: int, max_attempts: int = wq.MAX_ATTEMPTS) -> list[Chunk]:
+    chunks = [Chunk("ecb", f"C{i}", date(2024, 1, 1), date(2024, 3, 31), {}) for i in range(n)]
+    wq.enqueue(engine, chunks, max_attempts=max_attempts)
+    return chunks
+
+def _task(row) -> wq.Task:
+    tid, source, symbol, lo, hi, attempts, max_attempts = row
+    return wq.Task(tid, Chunk(source, symbol, lo, hi, {}), attempts, max_attempts)
+
+def _state(engine, tid: int):
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT status, attempts, lease_owner, available_at, lake_id FROM {TASKS_TABLE} "
+                                 f"WHERE id = :id"), {"id": tid}).one()
+
+def test_claim_splits_tasks_between_workers(engine, clock):
+    _enqueue(engine, 3)
+    a = wq.claim(engine, 2, "w1")
+    b = wq.claim(engine, 2, "w2")
+    assert len(a) == 2 and len(b) == 1
+    assert not {r[0] for r in a} & {r[0] for r in b}
+    assert all(r[5] == 1 for r in a + b)
+    assert wq.claim(engine, 2, "w3") == []
+    assert _state(engine, b[0][0]).lease_owner == "w2"
+
+def test_enqueue_again_keeps_running_tasks(engine, clock):
+    chunks = _enqueue(engine, 1)
+    (row,) = wq.claim(engine, 1, "w1")
+    wq.enqueue(engine, chunks)
+    assert _state(engine, row[0])[:3] == ("RUNNING", 1, "w1")
+
+def test_expired_lease_is_claimed_by_another_worker(engine, clock):
+    _enqueue(engine, 1)
+    (row,) = wq.claim(engine, 1, "w1", lease_s=600)
+    clock["now"] += timedelta(seconds=599)
+    assert wq.claim(engine, 1, "w2") == []
+    clock["now"] += timedelta(seconds=2)
+    (again,) = wq.claim(engine, 1, "w2")
+    assert again[0] == row[0] and again[5] == 2
+    # w1 termina depois de perder o lease: a conclusão dele não vale, a tarefa segue com w2
+    wq.complete(engine, [(_task(row), 10)], "w1")
+    assert _state(engine, row[0])[:3] == ("RUNNING", 2, "w2")
+    wq.complete(engine, [(_task(again), 10)], "w2", lake_id="L")
+    assert _state(engine, row[0]).status == "DONE"
+
+def test_failure_backs_off_exponentially(engine, clock):
+    _enqueue(engine, 1)
+    for attempt, wait in ((1, 30), (2, 60), (3, 120)):
+        (row,) = wq.claim(engine, 1, "w1")
+        assert row[5] == attempt
+        wq.fail(engine, _task(row), "w1", ValueError("HTTP 503"))
+        st = _state(engine, row[0])
+        assert st.status == "PENDING"
+        assert str(st.available_at)[:19] == str(clock["now"] + timedelta(seconds=wait))
+        clock["now"] += timedelta(seconds=wait - 1)
+        assert wq.claim(engine, 1, "w1") == []
+        clock["now"] += timedelta(seconds=1)
+
+def test_backoff_is_capped(engine, clock):
+    _enqueue(engine, 1, max_attempts=20)
+    with engine.begin() as conn:
+        conn.execute(text(f"UPDATE {TASKS_TABLE} SET attempts = 10"))
+    (row,) = wq.claim(engine, 1, "w1")
+    wq.fail(engine, _task(row), "w1", ValueError("HTTP 429"))
+    st = _state(engine, row[0])
+    assert (st.status, st.attempts) == ("PENDING", 11)
+    assert str(st.available_at)[:19] == str(clock["now"] + timedelta(seconds=wq.RETRY_MAX_S))
+
+def test_task_fails_after_max_attempts(engine, clock):
+    chunks = _enqueue(engine, 1, max_attempts=2)
+    for _ in range(2):
+        (row,) = wq.claim(engine, 1, "w1")
+        wq.fail(engine, _task(row), "w1", ValueError("HTTP 503"))
+        clock["now"] += timedelta(hours=1)
+    st = _state(engine, row[0])
+    assert (st.status, st.attempts) == ("FAILED", 2)
+    assert wq.claim(engine, 1, "w1") == []
+    assert wq._waiting(engine, None) == 0
+    # Um novo enqueue reabre a tarefa com as tentativas zeradas
+    wq.enqueue(engine, chunks, max_attempts=2)
+    assert _state(engine, row[0])[:2] == ("PENDING", 0)
+
+def test_reap_fails_expired_lease_on_last_attempt(engine, clock):
+    _enqueue(engine, 2, max_attempts=1)
+    rows = wq.claim(engine, 2, "w1", lease_s=600)
+    assert wq.reap(engine) == 0
+    clock["now"] += timedelta(seconds=601)
+    assert wq.reap(engine) == 2
+    assert {_state(engine, r[0]).status for r in rows} == {"FAILED"}
+    assert wq.claim(engine, 2, "w2") == []
+
+def test_check_lake_rejects_a_different_lake(engine, clock, tmp_path):
+    ours = lake.lake_id(str(tmp_path / "a"))
+    assert lake.lake_id(str(tmp_path / "a")) == ours
+    theirs = lake.lake_id(str(tmp_path / "b"))
+    assert theirs != ours
+    wq.check_lake(engine, ours)
+    _enqueue(engine, 1)
+    (row,) = wq.claim(engine, 1, "w1")
+    wq.complete(engine, [(_task(row), 5)], "w1", lake_id=theirs)
+    assert _state(engine, row[0]).lake_id == theirs
+    wq.check_lake(engine, theirs)
+    with pytest.raises(RuntimeError, match="compartilhar"):
+        wq.check_lake(engine, ours)